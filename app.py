@@ -1,71 +1,138 @@
+"""Application setup.
+
+``create_app()`` builds and configures a Flask app; ``app`` is the instance
+the entry points (main.py, passenger_wsgi.py, asgi.py) and background workers
+use. Building it does no I/O. The LLM, OAuth and SMTP clients are created on
+first use, and missing tables are created by ``init_db`` on the first request,
+not at import.
+
+Migrations are a deploy step: run ``flask --app app db-upgrade`` once before
+starting the new workers. On PostgreSQL they build indexes under an advisory
+lock, and applied from the first request they would stall every other worker's
+first request until the builds finish. A brand-new database is the exception:
+its migrations are applied by ``init_db``, since there is nothing to build.
+
+    AUTO_MIGRATE=0   1 also applies pending migrations on an existing database in init_db
+"""
 import os
 import logging
-from flask import Flask
+import threading
+from flask import Flask, current_app, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_mail import Mail
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+import observability
+
+# Configure logging (LOG_LEVEL, LOG_FORMAT)
+observability.configure_logging()
+logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
-
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "fallback-secret-key-for-development")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///sarkar_ai.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-
-# Flask-Mail configuration (SMTP)
-app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
-app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', '587'))
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USE_SSL'] = False
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'your-email@gmail.com')
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'your-app-password')
-app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'SARKAR AI <noreply@sarkarai.com>')
-
-# Initialize extensions
-db.init_app(app)
-mail = Mail(app)
+mail = Mail()
 
 # Initialize Flask-Login
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'main_routes.auth'
 login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
-
-# Register blueprints
-from google_auth import google_auth
-from routes import main_routes
+    import user_cache
+    return user_cache.load_user(user_id)
 
-app.register_blueprint(google_auth)
-app.register_blueprint(main_routes)
+# Static files carry their own caching headers (see assets.py)
+CACHEABLE_ENDPOINTS = {'static', 'assets.serve'}
 
-@app.after_request
 def add_cache_control(response):
+    if request.endpoint in CACHEABLE_ENDPOINTS:
+        return response
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
 
-with app.app_context():
-    # Import models to ensure tables are created
-    import models  # noqa: F401
-    db.create_all()
+
+_schema_lock = threading.Lock()
+
+def init_db(flask_app):
+    """Create missing tables and apply migrations where allowed (see above). Runs once per app."""
+    if flask_app.extensions.get('schema_ready'):
+        return
+    with _schema_lock:
+        if flask_app.extensions.get('schema_ready'):
+            return
+        from sqlalchemy import inspect
+        from migrations import pending_versions, upgrade
+        with flask_app.app_context():
+            # Import models to ensure tables are created
+            import models  # noqa: F401
+            fresh = not inspect(db.engine).get_table_names()
+            db.create_all()
+            # create_all never alters existing tables; bring them up to date
+            if fresh or os.environ.get('AUTO_MIGRATE', '0') == '1':
+                applied = upgrade(db.engine)
+                if applied:
+                    logger.info(f"Applied migrations: {applied}")
+            else:
+                pending = pending_versions(db.engine)
+                if pending:
+                    logger.warning(f"Pending migrations {pending}; run 'flask --app app db-upgrade'")
+        flask_app.extensions['schema_ready'] = True
+
+def prepare_schema():
+    flask_app = current_app._get_current_object()
+    if not flask_app.extensions.get('schema_ready'):
+        init_db(flask_app)
+
+
+def create_app():
+    """Build a configured app. Cheap: no database, network or LLM work happens here."""
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "fallback-secret-key-for-development")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+    # Configure the database: URL, pool sizing, SQLite pragmas, read replica (see database.py)
+    import database
+    database.configure(app)
+
+    # Flask-Mail configuration (SMTP)
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', '587'))
+    app.config['MAIL_USE_TLS'] = True
+    app.config['MAIL_USE_SSL'] = False
+    app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'your-email@gmail.com')
+    app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'your-app-password')
+    app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'SARKAR AI <noreply@sarkarai.com>')
+
+    # Initialize extensions
+    db.init_app(app)
+    mail.init_app(app)
+    login_manager.init_app(app)
+    # Request latency, SQL counts per request and /metrics
+    observability.init_app(app)
+
+    # Register blueprints
+    from google_auth import google_auth
+    from routes import main_routes
+
+    app.register_blueprint(google_auth)
+    app.register_blueprint(main_routes)
+
+    import assets
+    assets.init_app(app)
+
+    app.before_request(prepare_schema)
+    app.after_request(add_cache_control)
+
+    from migrations import register_commands
+    register_commands(app)
+    return app
+
+
+app = create_app()
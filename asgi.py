@@ -0,0 +1,227 @@
+"""ASGI entry point that serves chat streams from the event loop.
+
+Run with ``uvicorn asgi:application``. ``POST /api/send_message``,
+``POST /api/retry`` and ``GET /api/stream/<id>`` (reconnecting to a running
+stream) are handled natively here, streaming through ``chain.astream`` so an
+open SSE stream costs a coroutine instead of a whole WSGI worker. Every other
+route is delegated to the regular Flask app.
+"""
+import asyncio
+import io
+import json
+import logging
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import request
+from flask_login import current_user
+
+from app import app as flask_app, prepare_schema
+from gemini_chat import agenerate_chat_response_streaming
+from routes import STREAM_ERROR_TEXT, _begin_chat_turn, _begin_retry_turn, _open_resume, _persist_ai_message
+from streaming import ResumableStream, StreamWriter, acoalesce, register_stream
+
+logger = logging.getLogger(__name__)
+
+# POST routes that start a stream -> (begin function, error message)
+STREAM_ROUTES = {
+    '/api/send_message': (_begin_chat_turn, 'Failed to send message'),
+    '/api/retry': (_begin_retry_turn, 'Failed to retry from point'),
+}
+RESUME_PREFIX = '/api/stream/'
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+flask_asgi = WsgiToAsgi(flask_app)
+
+
+async def _read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+def _build_environ(scope, body):
+    """Translate an ASGI HTTP scope into the WSGI environ Flask expects."""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin1').upper().replace('-', '_')
+        if key == 'CONTENT_LENGTH':
+            continue
+        if key != 'CONTENT_TYPE':
+            key = f'HTTP_{key}'
+        value = value.decode('latin1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _open_resume_request(environ, stream_id):
+    """Authenticate a stream reconnect inside a Flask request context."""
+    with flask_app.request_context(environ):
+        # request_context skips before_request hooks, so prepare the schema here
+        prepare_schema()
+        if not current_user.is_authenticated:
+            return None, ({'error': 'Authentication required'}, 401)
+        return _open_resume(stream_id)
+
+
+def _start_turn(environ, begin, error_message):
+    """Authenticate and run ``begin`` (the turn's DB writes) inside a Flask request context."""
+    with flask_app.request_context(environ):
+        prepare_schema()
+        if not current_user.is_authenticated:
+            return None, ({'error': 'Authentication required'}, 401)
+        try:
+            return begin(request.get_json(silent=True))
+        except Exception as e:
+            logger.error(f"{error_message}: {e}")
+            from app import db
+            db.session.rollback()
+            return None, ({'error': error_message}, 500)
+
+
+async def _send_json(send, payload, status):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _run_stream(stream, turn):
+    """Async counterpart of routes._run_stream; runs as its own task."""
+    full_response = ""
+    message_id = None
+    try:
+        stream.publish('start', chat_id=turn['chat_id'], stream_id=stream.id,
+                       user_message_id=turn['user_message_id'])
+
+        async for chunk in acoalesce(agenerate_chat_response_streaming(turn['message'], turn['history'],
+                                                                      use_cache=turn['use_cache'],
+                                                                      refresh_cache=turn['refresh_cache'])):
+            full_response += chunk
+            stream.publish('chunk', content=chunk)
+
+        if full_response:
+            message_id = await asyncio.to_thread(_persist_ai_message, turn['chat_id'], full_response)
+    except Exception as e:
+        logger.error(f"Streaming error: {e}")
+        if not full_response:
+            stream.publish('chunk', content=STREAM_ERROR_TEXT)
+    finally:
+        stream.publish('end', message_id=message_id)
+
+
+async def _send_events(send, stream, cursor, framing):
+    writer = StreamWriter(framing)
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+        async for event in stream.aevents(cursor):
+            await send({'type': 'http.response.body', 'body': writer.event(*event).encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        writer.close()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _follow_stream(receive, send, stream, cursor, framing):
+    """Send ``stream`` to the client until it ends or the client goes away.
+
+    A disconnect only stops this subscriber; the generation task keeps running
+    so the client can resume.
+    """
+    sender = asyncio.ensure_future(_send_events(send, stream, cursor, framing))
+    watcher = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        watcher.cancel()
+    if sender.done() and not sender.cancelled():
+        sender.result()
+
+
+async def start_stream(scope, receive, send):
+    """Handle a POST from STREAM_ROUTES: write the turn, then stream the answer."""
+    begin, error_message = STREAM_ROUTES[scope['path']]
+    body = await _read_body(receive)
+    environ = _build_environ(scope, body)
+
+    # Auth and the turn's writes are short, blocking DB calls
+    turn, error = await asyncio.to_thread(_start_turn, environ, begin, error_message)
+    if error:
+        payload, status = error
+        await _send_json(send, payload, status)
+        return
+
+    stream = ResumableStream(turn['user_id'])
+    register_stream(stream)
+    stream.task = asyncio.ensure_future(_run_stream(stream, turn))
+    await _follow_stream(receive, send, stream, 0, turn['framing'])
+
+
+async def resume_stream(scope, receive, send):
+    environ = _build_environ(scope, b'')
+    stream_id = scope['path'][len(RESUME_PREFIX):]
+    resume, error = await asyncio.to_thread(_open_resume_request, environ, stream_id)
+    if error:
+        payload, status = error
+        await _send_json(send, payload, status)
+        return
+
+    stream, cursor, framing = resume
+    await _follow_stream(receive, send, stream, cursor, framing)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] in STREAM_ROUTES:
+        await start_stream(scope, receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'].startswith(RESUME_PREFIX):
+        await resume_stream(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
@@ -0,0 +1,175 @@
+"""Fingerprinted, precompressed static bundles.
+
+``flask build-assets`` copies every file under ``static/js`` and
+``static/css`` to ``static/dist``, under a name that contains a hash of its
+content (``js/sarkar-chat.3f9a1c0b2e.js``). Next to each it writes a gzip
+variant and, when the ``brotli`` package is installed, a brotli one. It also
+records the mapping in ``static/dist/manifest.json``.
+
+Templates link assets with ``asset_url('js/sarkar-chat.js')``. With a manifest
+that resolves to ``/assets/<hashed name>``. Those responses are cached for a
+year as ``immutable`` and come precompressed when the client accepts it. A new
+build changes the name, so clients never see a stale copy. Without a manifest,
+or in debug mode, ``asset_url`` falls back to the plain ``/static`` file, so
+development needs no build step. ``/static`` responses are revalidated on every
+use (``no-cache`` with an ETag, answered 304 while unchanged). Without a build,
+a deploy that changes ``sarkar-chat.js`` and the API together reaches browsers
+at once.
+
+Files are minified on the way when the optional ``rjsmin`` (JavaScript) and
+``rcssmin`` (CSS) packages are installed, and copied unchanged otherwise. Both
+are established minifiers: they strip comments and whitespace and never
+rewrite code. Compression does most of the work either way; minifying first
+saves a little more. The build never falls back to a homegrown minifier. One
+that still parses but changes behaviour (template literals, regex literals,
+``/`` division, semicolon insertion) would break every page without warning.
+
+    pip install rjsmin rcssmin brotli   # optional build dependencies
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from flask import Blueprint, abort, current_app, request, send_file, url_for
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+SOURCE_DIRS = ('js', 'css')
+SOURCE_EXTENSIONS = ('.js', '.css')
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Files under /static keep their name across deploys, so browsers revalidate
+# them (ETag) on every use; only fingerprinted /assets are cached long
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE_SECONDS', '0'))
+
+assets = Blueprint('assets', __name__)
+
+
+# --- Minifiers -------------------------------------------------------------
+
+def minifiers():
+    """Minify functions by extension, for the optional minifier packages that are installed."""
+    found = {}
+    try:
+        import rjsmin
+        found['.js'] = lambda source: rjsmin.jsmin(source, keep_bang_comments=True)
+    except ImportError:
+        pass
+    try:
+        import rcssmin
+        found['.css'] = lambda source: rcssmin.cssmin(source, keep_bang_comments=True)
+    except ImportError:
+        pass
+    return found
+
+
+# --- Build -----------------------------------------------------------------
+
+def _compress(path, data):
+    with open(path + '.gz', 'wb') as fh:
+        # mtime=0 keeps the output identical across builds of the same content
+        with gzip.GzipFile(fileobj=fh, mode='wb', compresslevel=9, mtime=0) as gz:
+            gz.write(data)
+    try:
+        import brotli
+    except ImportError:
+        return
+    with open(path + '.br', 'wb') as fh:
+        fh.write(brotli.compress(data, quality=11))
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Minify (when possible), fingerprint and precompress the bundles; return the manifest."""
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    minify = minifiers()
+    for ext in sorted(set(SOURCE_EXTENSIONS) - set(minify)):
+        logger.info(f"No minifier for {ext} files installed; they are built unminified")
+    manifest = {}
+    for subdir in SOURCE_DIRS:
+        for name in sorted(os.listdir(os.path.join(static_dir, subdir))):
+            stem, ext = os.path.splitext(name)
+            if ext not in SOURCE_EXTENSIONS:
+                continue
+            with open(os.path.join(static_dir, subdir, name), encoding='utf-8') as fh:
+                source = fh.read()
+            data = (minify[ext](source) if ext in minify else source).encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            target = f'{subdir}/{stem}.{digest}{ext}'
+            path = os.path.join(dist_dir, target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fh:
+                fh.write(data)
+            _compress(path, data)
+            manifest[f'{subdir}/{name}'] = target
+    with open(os.path.join(dist_dir, MANIFEST), 'w') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    return manifest
+
+
+# --- Serving ---------------------------------------------------------------
+
+_manifest = None
+
+
+def load_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(DIST_DIR, MANIFEST)) as fh:
+                _manifest = json.load(fh)
+        except FileNotFoundError:
+            logger.info("No asset manifest; serving unminified files from /static (run flask build-assets)")
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(filename):
+    """URL for a file under static/, fingerprinted when a build exists."""
+    built = None if current_app.debug else load_manifest().get(filename)
+    if built:
+        return url_for('assets.serve', filename=built)
+    return url_for('static', filename=filename)
+
+
+@assets.route('/assets/<path:filename>')
+def serve(filename):
+    if filename not in load_manifest().values():
+        abort(404)
+    path = os.path.join(DIST_DIR, filename)
+    # Parsed into tokens with q-values: "x-br" is not br and "gzip;q=0" refuses gzip
+    accepted = request.accept_encodings
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[candidate] > 0 and os.path.exists(path + suffix):
+            encoding = candidate
+            path += suffix
+            break
+    response = send_file(path, mimetype=_mimetype(filename), conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def _mimetype(filename):
+    return 'text/css' if filename.endswith('.css') else 'text/javascript'
+
+
+def init_app(app):
+    app.register_blueprint(assets)
+    app.jinja_env.globals['asset_url'] = asset_url
+    if app.config.get('SEND_FILE_MAX_AGE_DEFAULT') is None:
+        app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE
+
+    @app.cli.command('build-assets')
+    def build_assets():
+        """Fingerprint, minify (if rjsmin/rcssmin are installed) and precompress static/js and static/css."""
+        import click
+        manifest = build()
+        click.echo(f"Built {len(manifest)} assets into {os.path.relpath(DIST_DIR)}")
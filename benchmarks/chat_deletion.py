@@ -0,0 +1,219 @@
+"""Chat deletion: wiping a large account through the ORM, with set-based deletes, and with the background purge.
+
+Seeds an account with ``--chats`` chats of ``--messages`` messages each (100k
+messages by default) and deletes all of it three ways:
+
+- orm: the old route. It loads every chat and, through the cascade, every
+  message, then deletes them one row at a time in a single transaction.
+- set_based: ``chat_purge.delete_chats``, two DELETE statements in one
+  transaction, which is what /api/delete_all_chats does for small accounts.
+- background: /api/delete_all_chats above the inline limit. The request only
+  hides the chats; the ``purge_chats`` job, run here in the foreground,
+  deletes their messages in batches of ``--batch`` with a commit after each.
+
+For each it reports the time until the user sees the chats gone, the time
+until the rows are gone, and the longest single transaction, which is how long
+a delete can hold locks and block other writers.
+
+With ``--check`` it first loses purges on purpose: /api/delete_all_chats runs
+while the job queue is full, so the chats are hidden but no job purges them.
+It then checks that a second delete_all_chats, a delete_chat, and the
+``sweep_hidden_chats`` job each remove the hidden rows, and exits non-zero if
+any rows are left.
+
+    python benchmarks/chat_deletion.py --chats 100 --messages 1000
+"""
+import argparse
+import sys
+import time
+
+import harness
+
+
+class TransactionClock:
+    """Times every transaction on an engine, from BEGIN to COMMIT or ROLLBACK."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.durations = []
+        self._started = {}
+        event.listen(engine, 'begin', self._begin)
+        event.listen(engine, 'commit', self._end)
+        event.listen(engine, 'rollback', self._end)
+
+    def _begin(self, conn):
+        self._started[id(conn)] = time.perf_counter()
+
+    def _end(self, conn):
+        started = self._started.pop(id(conn), None)
+        if started is not None:
+            self.durations.append(time.perf_counter() - started)
+
+    def longest(self):
+        longest = max(self.durations, default=0.0)
+        self.durations.clear()
+        return longest
+
+
+def delete_orm(app, db, user_id, client):
+    from models import Chat
+    with app.app_context():
+        started = time.perf_counter()
+        for chat in Chat.query.filter_by(user_id=user_id).all():
+            # What the delete-orphan cascade did before passive_deletes
+            for message in chat.messages:
+                db.session.delete(message)
+            db.session.delete(chat)
+        db.session.commit()
+        elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+def delete_set_based(app, db, user_id, client):
+    import chat_purge
+    with app.app_context():
+        started = time.perf_counter()
+        chat_purge.delete_chats(user_id)
+        db.session.commit()
+        elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+def delete_background(app, db, user_id, client):
+    import chat_purge
+    started = time.perf_counter()
+    response = client.delete('/api/delete_all_chats')
+    hidden = time.perf_counter() - started
+    assert response.status_code == 202, response.status_code
+    with app.app_context():
+        chat_purge.purge_chats(user_id)
+    return hidden, time.perf_counter() - started
+
+
+def check_lost_purges(app, db):
+    """Problems found when a purge job is never queued; an empty list means none."""
+    import chat_purge
+    import jobs
+    from models import Chat, Message
+
+    # Runs through the real queue; the sweep is called directly instead of on its timer
+    jobs.PERIODIC.clear()
+    queue = jobs.get_queue()
+    chat_purge.INLINE_MAX_MESSAGES = 10
+
+    def rows_left(user_id):
+        with app.app_context():
+            chats = db.select(Chat.id).where(Chat.user_id == user_id)
+            return (db.session.scalar(db.select(db.func.count()).select_from(Chat).where(Chat.user_id == user_id))
+                    + db.session.scalar(db.select(db.func.count()).select_from(Message)
+                                        .where(Message.chat_id.in_(chats))))
+
+    def lose_purge(name):
+        user_id = harness.create_user(app, db, name)
+        client = harness.login_client(app, user_id)
+        harness.seed_chats(app, db, user_id, 5, 10)
+        queue.max_pending = 0
+        try:
+            response = client.delete('/api/delete_all_chats')
+        finally:
+            queue.max_pending = 1000
+        assert response.status_code == 202 and response.get_json()['job_id'] is None, response.get_data()
+        assert rows_left(user_id) == 55, 'chats were not hidden'
+        return user_id, client
+
+    def second_delete_all(user_id, client):
+        assert client.delete('/api/delete_all_chats').status_code in (200, 202)
+        queue.join(timeout=30)
+
+    def delete_chat(user_id, client):
+        chat_purge.INLINE_MAX_MESSAGES = 1000
+        try:
+            chat_id = harness.seed_chat(app, db, user_id, 2)
+            assert client.delete(f'/api/delete_chat/{chat_id}').status_code == 200
+        finally:
+            chat_purge.INLINE_MAX_MESSAGES = 10
+
+    def sweep(user_id, client):
+        with app.app_context():
+            chat_purge.sweep_hidden_chats()
+
+    problems = []
+    for name, recover in (('second_delete_all', second_delete_all), ('delete_chat', delete_chat),
+                          ('sweep', sweep)):
+        user_id, client = lose_purge(f'lost_{name}')
+        recover(user_id, client)
+        left = rows_left(user_id)
+        if left:
+            problems.append(f'{name}: {left} chat and message rows left after a lost purge')
+    return problems
+
+
+MODES = {
+    'orm': delete_orm,
+    'set_based': delete_set_based,
+    'background': delete_background,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temp SQLite)')
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=1000, help='messages per chat')
+    parser.add_argument('--batch', type=int, default=5000, help='messages per purge batch')
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--check', action='store_true', help='exit non-zero if a lost purge leaves rows behind')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    app, db = harness.configure(args.database_url)
+    import chat_purge
+    import jobs
+    from models import Chat, Message
+
+    problems = check_lost_purges(app, db) if args.check else []
+
+    total = args.chats * args.messages
+    # Every account here goes through the purge job, which this script runs itself
+    chat_purge.INLINE_MAX_MESSAGES = 0
+    chat_purge.BATCH_MESSAGES = args.batch
+    jobs.enqueue = lambda name, owner_id=None, **payload: None
+
+    with app.app_context():
+        clock = TransactionClock(db.engine)
+
+    results = []
+    for name, delete in MODES.items():
+        visible, gone, longest = [], [], []
+        for i in range(args.iterations):
+            user_id = harness.create_user(app, db, f'{name}{i}')
+            client = harness.login_client(app, user_id)
+            chat_ids = harness.seed_chats(app, db, user_id, args.chats, args.messages)
+            clock.longest()
+            hidden_after, deleted_after = delete(app, db, user_id, client)
+            longest.append(clock.longest())
+            visible.append(hidden_after)
+            gone.append(deleted_after)
+            with app.app_context():
+                left = Message.query.filter(Message.chat_id.in_(chat_ids)).count()
+                assert left == 0 and not Chat.query.filter_by(user_id=user_id).count(), name
+        results.append(harness.summarize(
+            f'{name}.{total}_messages', visible, sum(visible),
+            rows_gone_ms_p50=round(harness.percentile(gone, 50) * 1000, 3),
+            longest_transaction_ms=round(max(longest) * 1000, 3),
+        ))
+
+    harness.write_results({
+        'suite': 'chat_deletion',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }, args.output)
+    if problems:
+        print('\n'.join(problems), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
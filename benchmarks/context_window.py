@@ -0,0 +1,128 @@
+"""Context window: prompt size per turn as a conversation grows, before and after token budgeting.
+
+Plays a conversation of ``--turns`` exchanges into the database. Most replies
+are short. A seeded random ``--long-share`` of them are long code answers of
+``--long-tokens``, which sometimes come several in a row, as they do in a
+coding session. Before each turn it builds the prompt history two ways:
+
+- legacy: the last 10 messages verbatim, whatever their size.
+- budgeted: ``chat_history.load_context``, the rolling summary plus the newest
+  messages within ``CHAT_HISTORY_TOKEN_BUDGET``. When it asks for a summary
+  refresh, ``summarize_chat`` runs right away with the offline provider,
+  standing in for the background job.
+
+It reports prompt tokens per turn (p50, p99, max), how many messages each
+prompt carried, the time to build the history, and the number of summary
+refreshes. Time to first token grows with prompt size, so the spread of prompt
+tokens is what makes it predictable or not.
+
+    python benchmarks/context_window.py --turns 300
+"""
+import argparse
+import random
+import statistics
+import time
+
+import harness
+
+LEGACY_MESSAGES = 10
+
+
+def load_legacy(db, chat_id):
+    """The last ``LEGACY_MESSAGES`` messages verbatim, oldest first, as the app once sent them."""
+    from models import Message
+
+    rows = db.session.execute(
+        db.select(Message.content, Message.is_user)
+        .where(Message.chat_id == chat_id)
+        .order_by(Message.id.desc())
+        .limit(LEGACY_MESSAGES)
+    ).all()
+    return [{'content': row.content, 'is_user': row.is_user} for row in reversed(rows)]
+
+
+def play(app, db, user_id, args):
+    import chat_history
+    from models import Chat, Message
+
+    with app.app_context():
+        chat = Chat(title='Context benchmark', user_id=user_id)
+        db.session.add(chat)
+        db.session.commit()
+        chat_id = chat.id
+
+    samples = {'legacy': [], 'budgeted': []}
+    refreshes = 0
+    rng = random.Random(args.seed)
+    short = 'word ' * (args.short_tokens * 4 // 5)
+    long = 'code ' * (args.long_tokens * 4 // 5)
+    for turn in range(args.turns):
+        with app.app_context():
+            chat = db.session.get(Chat, chat_id)
+            started = time.perf_counter()
+            legacy = load_legacy(db, chat_id)
+            samples['legacy'].append((legacy, time.perf_counter() - started))
+            started = time.perf_counter()
+            budgeted, needs_summary = chat_history.load_context(chat)
+            samples['budgeted'].append((budgeted, time.perf_counter() - started))
+
+            reply = long if rng.random() < args.long_share else short
+            db.session.add(Message(content=f'question {turn}: {short}', is_user=True, chat_id=chat_id))
+            db.session.add(Message(content=f'answer {turn}: {reply}', is_user=False, chat_id=chat_id))
+            db.session.commit()
+        if needs_summary:
+            with app.app_context():
+                chat_history.summarize_chat(chat_id)
+            refreshes += 1
+    return samples, refreshes
+
+
+def summarize(name, samples, **extra):
+    import chat_history
+    tokens = [sum(chat_history.estimate_tokens(m['content']) for m in history) for history, _ in samples]
+    messages = [sum(1 for m in history if not m.get('is_summary')) for history, _ in samples]
+    build = [seconds for _, seconds in samples]
+    return {
+        'name': name,
+        'turns': len(samples),
+        'prompt_tokens_p50': round(statistics.median(tokens)),
+        'prompt_tokens_p99': harness.percentile(tokens, 99),
+        'prompt_tokens_max': max(tokens),
+        'messages_per_prompt_p50': statistics.median(messages),
+        'build_ms_p50': round(statistics.median(build) * 1000, 3),
+        'build_ms_p99': round(harness.percentile(build, 99) * 1000, 3),
+        **extra,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temp SQLite)')
+    parser.add_argument('--turns', type=int, default=300)
+    parser.add_argument('--short-tokens', type=int, default=60, help='size of ordinary messages')
+    parser.add_argument('--long-tokens', type=int, default=3000, help='size of the long code answers')
+    parser.add_argument('--long-share', type=float, default=0.2, help='fraction of answers that are long')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    app, db = harness.configure(args.database_url)
+    import chat_history
+    harness.install_fake_provider(ttft=0, tokens_per_sec=0)
+
+    samples, refreshes = play(app, db, harness.create_user(app, db), args)
+    harness.write_results({
+        'suite': 'context_window',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'token_budget': chat_history.HISTORY_TOKEN_BUDGET,
+        'results': [
+            summarize('legacy', samples['legacy']),
+            summarize('budgeted', samples['budgeted'], summary_refreshes=refreshes),
+        ],
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Engine tuning: mixed read/write load under the old and the new engine settings.
+
+Each variant runs in its own process, because engine options are read when
+the app is built:
+
+- old: the settings before database.py. Rollback journal, synchronous=FULL
+  and a pre-ping on every checkout.
+- wal: journal_mode=WAL and synchronous=NORMAL, still with pre-ping.
+- new: the defaults now, wal without pre-ping on SQLite.
+
+Against the engine directly it times ``--commits`` single-row commits,
+connection checkouts, and reads while another thread commits nonstop. Then,
+end to end, ``--readers`` threads fetch /api/get_chat while ``--writers``
+threads send messages through /api/send_message (offline provider, no
+pacing) for ``--seconds``. That part reports read latency, both throughputs
+and failed requests ("database is locked"). Its threads share one
+interpreter, so it is bound by the GIL more than by the database.
+
+    python benchmarks/db_tuning.py --readers 8 --writers 4 --seconds 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import harness
+
+VARIANTS = {
+    'old': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'DB_POOL_PRE_PING': '1'},
+    'wal': {'DB_POOL_PRE_PING': '1'},
+    'new': {},
+}
+
+
+def engine_costs(app, db, args):
+    """Commit rate, pool checkout cost, and read latency while another thread commits."""
+    from sqlalchemy import text
+
+    with app.app_context():
+        engine = db.engine
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE tuning (id INTEGER PRIMARY KEY, body TEXT)'))
+        conn.execute(text('INSERT INTO tuning (body) VALUES (:b)'), [{'b': 'x' * 200}] * 1000)
+
+    def commit():
+        with engine.begin() as conn:
+            conn.execute(text('INSERT INTO tuning (body) VALUES (:b)'), {'b': 'x' * 200})
+    commits, commit_wall = harness.timed(commit, args.commits)
+
+    def checkout():
+        with engine.connect():
+            pass
+    checkouts, checkout_wall = harness.timed(checkout, args.commits * 4)
+
+    stop = threading.Event()
+
+    def keep_committing():
+        while not stop.is_set():
+            commit()
+
+    def read():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT count(*) FROM tuning')).scalar()
+
+    writer = threading.Thread(target=keep_committing)
+    writer.start()
+    reads, read_wall = harness.timed(read, args.commits)
+    stop.set()
+    writer.join()
+    return [
+        harness.summarize('commit', commits, commit_wall),
+        harness.summarize('checkout', checkouts, checkout_wall),
+        harness.summarize('read_during_commits', reads, read_wall),
+    ]
+
+
+def workload(args):
+    app, db = harness.configure()
+    results = engine_costs(app, db, args)
+    harness.install_fake_provider(ttft=0, tokens_per_sec=0, response_tokens=50)
+    threads = args.readers + args.writers
+    clients, chats = [], []
+    for i in range(threads):
+        user_id = harness.create_user(app, db, f'tuning{i}')
+        clients.append(harness.login_client(app, user_id))
+        chats.append(harness.seed_chat(app, db, user_id, 200))
+
+    reads, writes, failures = [], [0], [0]
+    deadline = [None]
+    barrier = threading.Barrier(threads + 1)
+
+    def reader(client, chat_id):
+        barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            started = time.perf_counter()
+            response = client.get(f'/api/get_chat/{chat_id}')
+            if response.status_code == 200:
+                reads.append(time.perf_counter() - started)
+            else:
+                failures[0] += 1
+
+    def writer(client, chat_id):
+        barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            response = client.post('/api/send_message', json={'message': 'ping', 'chat_id': chat_id})
+            body = response.get_data(as_text=True)
+            if response.status_code == 200 and '"message_id": null' not in body:
+                writes[0] += 1
+            else:
+                failures[0] += 1
+
+    workers = [threading.Thread(target=reader, args=(clients[i], chats[i])) for i in range(args.readers)]
+    workers += [threading.Thread(target=writer, args=(clients[i], chats[i]))
+                for i in range(args.readers, threads)]
+    for worker in workers:
+        worker.start()
+    deadline[0] = time.perf_counter() + args.seconds
+    barrier.wait()
+    for worker in workers:
+        worker.join()
+    results.append(harness.summarize(
+        'get_chat_under_load', reads, args.seconds,
+        send_message_per_sec=round(writes[0] / args.seconds, 1),
+        failed_requests=failures[0],
+    ))
+    return results
+
+
+def run_variant(name, args):
+    env = {**os.environ, **VARIANTS[name]}
+    command = [sys.executable, os.path.abspath(__file__), '--variant', name,
+               '--readers', str(args.readers), '--writers', str(args.writers), '--seconds', str(args.seconds),
+               '--commits', str(args.commits)]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--commits', type=int, default=500, help='iterations of the engine-level timings')
+    parser.add_argument('--variant', choices=sorted(VARIANTS), help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(workload(args)))
+        return
+
+    results = []
+    for name in VARIANTS:
+        for result in run_variant(name, args):
+            result['name'] = f"{name}.{result['name']}"
+            results.append(result)
+    harness.write_results({
+        'suite': 'db_tuning',
+        'backend': 'sqlite',
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'variant')},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Google sign-in: outbound HTTP cost per login, before and after the oidc module.
+
+Runs a local stand-in identity provider that serves a discovery document and
+signing certificates with ``Cache-Control: max-age=3600``, a token endpoint
+that issues RS256 id_tokens, and a userinfo endpoint. Each new connection
+costs ``--handshake-ms``, standing in for the TCP and TLS setup to Google.
+Every request costs ``--latency-ms``.
+
+- legacy: the old call pattern. Discovery is fetched on both legs, then the
+  token and userinfo endpoints are called. Every call uses a bare
+  ``requests`` function, so every call opens a new connection.
+- oidc: the same logins through ``oidc``, with a cached discovery document, a
+  pooled session and local id_token verification.
+- callback: /google_login then /google_login/callback through the Flask app,
+  end to end, including the user lookup and session login.
+
+    python benchmarks/google_login.py --logins 100 --handshake-ms 30 --latency-ms 10
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import harness
+
+CLIENT_ID = 'bench-client.apps.googleusercontent.com'
+KEY_ID = 'bench-key'
+
+
+class StandInProvider:
+    def __init__(self, handshake_ms, latency_ms):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from google.auth import crypt
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+        self.public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+        self.signer = crypt.RSASigner.from_string(private_pem, KEY_ID)
+        self.handshake = handshake_ms / 1000
+        self.latency = latency_ms / 1000
+        self.connections = 0
+        self.requests = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def claims(self):
+        now = int(time.time())
+        return {
+            'iss': 'https://accounts.google.com', 'aud': CLIENT_ID, 'sub': '1234567890',
+            'email': 'oidc@example.com', 'email_verified': True, 'given_name': 'Bench',
+            'iat': now, 'exp': now + 3600,
+        }
+
+    def _handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; don't let Nagle hold the body back
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                provider.connections += 1
+                time.sleep(provider.handshake)
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, payload, cache=False):
+                time.sleep(provider.latency)
+                provider.requests += 1
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if cache:
+                    self.send_header('Cache-Control', 'public, max-age=3600')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/.well-known/openid-configuration':
+                    self._send({
+                        'issuer': 'https://accounts.google.com',
+                        'authorization_endpoint': f'{provider.base_url}/auth',
+                        'token_endpoint': f'{provider.base_url}/token',
+                        'userinfo_endpoint': f'{provider.base_url}/userinfo',
+                    }, cache=True)
+                elif self.path == '/certs':
+                    self._send({KEY_ID: provider.public_pem}, cache=True)
+                else:
+                    self._send(provider.claims())
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                from google.auth import jwt
+                id_token = jwt.encode(provider.signer, provider.claims()).decode()
+                self._send({'access_token': 'token', 'token_type': 'Bearer', 'expires_in': 3599,
+                            'id_token': id_token})
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def legacy_login(provider):
+    """The call pattern google_auth used before: four unpooled requests per login."""
+    import requests
+    discovery_url = f'{provider.base_url}/.well-known/openid-configuration'
+    requests.get(discovery_url).json()
+    config = requests.get(discovery_url).json()
+    requests.post(config['token_endpoint'], data={'code': 'abc'}).json()
+    requests.get(config['userinfo_endpoint']).json()
+
+
+def oidc_login():
+    import oidc
+    oidc.provider_config()
+    config = oidc.provider_config()
+    token = oidc.request('POST', config['token_endpoint'], data={'code': 'abc'}).json()
+    oidc.verify_id_token(token['id_token'], CLIENT_ID)
+
+
+def run(name, provider, fn, logins):
+    connections, requests_made = provider.connections, provider.requests
+    latencies, wall = harness.timed(fn, logins)
+    return harness.summarize(
+        name, latencies, wall,
+        connections_per_login=round((provider.connections - connections) / logins, 3),
+        provider_requests_per_login=round((provider.requests - requests_made) / logins, 3),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--handshake-ms', type=float, default=30, help='simulated TCP + TLS setup')
+    parser.add_argument('--latency-ms', type=float, default=10, help='simulated per-request latency')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    provider = StandInProvider(args.handshake_ms, args.latency_ms).start()
+    os.environ.update({
+        'GOOGLE_DISCOVERY_URL': f'{provider.base_url}/.well-known/openid-configuration',
+        'GOOGLE_CERTS_URL': f'{provider.base_url}/certs',
+        'GOOGLE_OAUTH_CLIENT_ID': CLIENT_ID,
+        # The stand-in speaks plain HTTP
+        'OAUTHLIB_INSECURE_TRANSPORT': '1',
+    })
+    app, db = harness.configure()
+
+    def callback():
+        client = app.test_client()
+        client.get('/google_login')
+        response = client.get('/google_login/callback?code=abc')
+        assert response.headers['Location'].endswith('/chat'), response.headers['Location']
+
+    results = [
+        run('legacy', provider, lambda: legacy_login(provider), args.logins),
+        run('oidc', provider, oidc_login, args.logins),
+        run('callback', provider, callback, args.logins),
+    ]
+    provider.stop()
+
+    harness.write_results({
+        'suite': 'google_login',
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""Shared setup for the benchmark scripts in this directory.
+
+Each script runs the real Flask app in-process against a throwaway database and
+the offline FakeProvider. Importing ``app`` reads ``DATABASE_URL``, so
+``configure()`` must run before anything imports the application modules.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def configure(database_url=None):
+    """Point the app at ``database_url`` (default: a fresh SQLite file) and import it."""
+    if not database_url:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='sarkar-bench-'), 'bench.db')
+        database_url = f'sqlite:///{db_path}'
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('LLM_PROVIDER', 'fake')
+    # Measure generation itself; benchmarks/response_cache.py turns the cache on
+    os.environ.setdefault('RESPONSE_CACHE_ENABLED', '0')
+
+    import logging
+    from app import app, db, init_db
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if not database_url.startswith('sqlite'):
+        with app.app_context():
+            # Stand-in servers are scratch databases; start from a clean schema
+            import models  # noqa: F401
+            from sqlalchemy import text
+            db.drop_all()
+            # Otherwise migrations that build on the dropped tables count as applied
+            db.session.execute(text('DROP TABLE IF EXISTS schema_migrations'))
+            db.session.commit()
+    # Scripts seed data before the first request, which is when the app would do this
+    init_db(app)
+    return app, db
+
+
+def backend_name(app, db):
+    with app.app_context():
+        return db.engine.dialect.name
+
+
+def install_fake_provider(**options):
+    import gemini_chat
+    from llm_providers import FakeProvider
+    provider = FakeProvider(**options)
+    gemini_chat.set_provider(provider)
+    return provider
+
+
+def create_user(app, db, username='bench'):
+    from models import User
+    with app.app_context():
+        user = User(username=username, email=f'{username}@example.com')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def login_client(app, user_id):
+    """Return a test client whose session cookie authenticates ``user_id``."""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+    return client
+
+
+def session_cookie(client):
+    return client.get_cookie('session').value
+
+
+async def asgi_post(application, path, payload, cookie, on_body=None):
+    """POST ``payload`` as JSON straight into an ASGI app; ``on_body`` sees each body part."""
+    import asyncio
+    body = json.dumps(payload).encode()
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'POST', 'scheme': 'http', 'path': path,
+        'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [
+            (b'host', b'localhost'),
+            (b'content-type', b'application/json'),
+            (b'cookie', f'session={cookie}'.encode()),
+        ],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.body' and message.get('body') and on_body:
+            on_body(message['body'])
+
+    await application(scope, receive, send)
+
+
+def seed_chat(app, db, user_id, message_count, content_size=200, updated_at=None):
+    """Insert one chat with ``message_count`` alternating user/AI messages."""
+    from sqlalchemy import insert
+    from models import Chat, Message
+    with app.app_context():
+        chat = Chat(title='Benchmark chat', user_id=user_id)
+        if updated_at is not None:
+            chat.updated_at = updated_at
+        db.session.add(chat)
+        db.session.flush()
+        body = ('lorem ipsum ' * (content_size // 12 + 1))[:content_size]
+        now = datetime.utcnow()
+        rows = [
+            {
+                'content': f'{i}: {body}',
+                'is_user': i % 2 == 0,
+                'chat_id': chat.id,
+                'created_at': now,
+            }
+            for i in range(message_count)
+        ]
+        for start in range(0, len(rows), 5000):
+            db.session.execute(insert(Message), rows[start:start + 5000])
+        db.session.commit()
+        return chat.id
+
+
+def seed_chats(app, db, user_id, chat_count, messages_per_chat, content_size=200):
+    base = datetime.utcnow() - timedelta(days=1)
+    return [
+        seed_chat(app, db, user_id, messages_per_chat, content_size,
+                  updated_at=base + timedelta(seconds=i))
+        for i in range(chat_count)
+    ]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, latencies, wall, **extra):
+    """Latency percentiles (ms) and throughput for a list of per-call seconds."""
+    result = {
+        'name': name,
+        'iterations': len(latencies),
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'throughput_per_sec': round(len(latencies) / wall, 2) if wall else None,
+    }
+    result.update(extra)
+    return result
+
+
+def timed(fn, iterations):
+    """Call ``fn`` ``iterations`` times; return (per-call seconds, wall seconds)."""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - call_started)
+    return latencies, time.perf_counter() - started
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def metadata():
+    return {
+        'git_commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def write_results(results, output=None):
+    """Print ``results`` as JSON and optionally write them to ``output``."""
+    text = json.dumps(results, indent=2)
+    print(text)
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as fh:
+            fh.write(text + '\n')
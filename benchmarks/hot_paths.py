@@ -0,0 +1,197 @@
+"""End-to-end latency and throughput for the chat hot paths.
+
+Drives the real Flask app through its test client against one database and the
+offline FakeProvider, and reports p50/p99 latency plus throughput for:
+
+* ``/api/send_message`` - time to first byte and full stream, and per-message
+  cost in chats of 10 to 50k messages
+* ``/api/get_chat/<id>`` - chats with 10, 1k and 10k messages
+* ``/chat`` - sidebar render for a user with hundreds of chats
+* ``/api/retry`` - streamed regenerate of the last user message, in growing chats
+* ``/api/delete_all_chats`` - wipe a seeded account
+
+    python benchmarks/hot_paths.py --output benchmarks/results/hot_paths.json
+    python benchmarks/hot_paths.py --database-url postgresql://localhost/sarkar_bench
+
+A non-SQLite ``--database-url`` is treated as a scratch database and wiped.
+"""
+import argparse
+import time
+
+import harness
+
+
+def bench_send_message(app, db, args):
+    user_id = harness.create_user(app, db, 'sender')
+    client = harness.login_client(app, user_id)
+    chat_id = harness.seed_chat(app, db, user_id, 10)
+    ttfb, full = [], []
+
+    started = time.perf_counter()
+    for i in range(args.iterations):
+        call_started = time.perf_counter()
+        response = client.post('/api/send_message',
+                               json={'message': f'hello {i}', 'chat_id': chat_id},
+                               buffered=False)
+        first = None
+        for _chunk in response.response:
+            if first is None:
+                first = time.perf_counter() - call_started
+        response.close()
+        ttfb.append(first)
+        full.append(time.perf_counter() - call_started)
+    wall = time.perf_counter() - started
+
+    return [
+        harness.summarize('send_message.ttfb', ttfb, wall),
+        harness.summarize('send_message.full_stream', full, wall),
+    ]
+
+
+def bench_send_message_scaling(app, db, args):
+    """Per-message cost of send_message as the chat grows; should stay flat."""
+    user_id = harness.create_user(app, db, 'grower')
+    client = harness.login_client(app, user_id)
+    results = []
+    for size in args.scaling_sizes:
+        chat_id = harness.seed_chat(app, db, user_id, size)
+
+        def call():
+            response = client.post('/api/send_message', json={'message': 'next', 'chat_id': chat_id})
+            response.get_data()
+            assert response.status_code == 200, response.status_code
+
+        latencies, wall = harness.timed(call, args.iterations)
+        results.append(harness.summarize(f'send_message.chat_of_{size}_messages', latencies, wall))
+    return results
+
+
+def bench_get_chat(app, db, args):
+    user_id = harness.create_user(app, db, 'reader')
+    client = harness.login_client(app, user_id)
+    results = []
+    for size in args.chat_sizes:
+        chat_id = harness.seed_chat(app, db, user_id, size)
+        iterations = max(5, args.iterations // max(1, size // 1000))
+
+        def call():
+            response = client.get(f'/api/get_chat/{chat_id}')
+            assert response.status_code == 200, response.status_code
+
+        latencies, wall = harness.timed(call, iterations)
+        results.append(harness.summarize(f'get_chat.{size}_messages', latencies, wall,
+                                         response_bytes=len(client.get(f'/api/get_chat/{chat_id}').data)))
+    return results
+
+
+def bench_sidebar(app, db, args):
+    user_id = harness.create_user(app, db, 'browser')
+    client = harness.login_client(app, user_id)
+    harness.seed_chats(app, db, user_id, args.sidebar_chats, args.sidebar_messages)
+
+    def call():
+        response = client.get('/chat')
+        assert response.status_code == 200, response.status_code
+
+    latencies, wall = harness.timed(call, args.iterations)
+    return [harness.summarize(f'chat_sidebar.{args.sidebar_chats}_chats', latencies, wall,
+                              response_bytes=len(client.get('/chat').data))]
+
+
+def bench_retry(app, db, args):
+    """Streamed regenerate of the last user message, in chats of each --chat-sizes size."""
+    user_id = harness.create_user(app, db, 'retrier')
+    client = harness.login_client(app, user_id)
+    results = []
+    for size in args.chat_sizes:
+        chat_id = harness.seed_chat(app, db, user_id, size)
+        anchor = client.get(f'/api/get_chat/{chat_id}?limit=2').get_json()['chat']['messages'][0]
+        ttfb, full = [], []
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            call_started = time.perf_counter()
+            response = client.post('/api/retry', json={'chat_id': chat_id, 'anchor_message_id': anchor['id']},
+                                   buffered=False)
+            assert response.status_code == 200, response.status_code
+            first = None
+            for _chunk in response.response:
+                if first is None:
+                    first = time.perf_counter() - call_started
+            response.close()
+            ttfb.append(first)
+            full.append(time.perf_counter() - call_started)
+        wall = time.perf_counter() - started
+        results += [
+            harness.summarize(f'retry.ttfb.chat_of_{size}_messages', ttfb, wall),
+            harness.summarize(f'retry.full_stream.chat_of_{size}_messages', full, wall),
+        ]
+    return results
+
+
+def bench_delete_all(app, db, args):
+    latencies = []
+    wall = 0.0
+    for i in range(args.delete_iterations):
+        user_id = harness.create_user(app, db, f'deleter{i}')
+        client = harness.login_client(app, user_id)
+        harness.seed_chats(app, db, user_id, args.delete_chats, args.delete_messages)
+        started = time.perf_counter()
+        response = client.delete('/api/delete_all_chats')
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.status_code
+        latencies.append(elapsed)
+        wall += elapsed
+    total = args.delete_chats * args.delete_messages
+    return [harness.summarize(f'delete_all_chats.{total}_messages', latencies, wall)]
+
+
+SCENARIOS = {
+    'send_message': bench_send_message,
+    'send_message_scaling': bench_send_message_scaling,
+    'get_chat': bench_get_chat,
+    'sidebar': bench_sidebar,
+    'retry': bench_retry,
+    'delete_all': bench_delete_all,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temp SQLite)')
+    parser.add_argument('--label', default=None, help='backend label stored in the results')
+    parser.add_argument('--only', action='append', choices=sorted(SCENARIOS),
+                        help='run only these scenarios (repeatable)')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--chat-sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--scaling-sizes', type=int, nargs='+', default=[10, 1000, 10000, 50000])
+    parser.add_argument('--sidebar-chats', type=int, default=300)
+    parser.add_argument('--sidebar-messages', type=int, default=20)
+    parser.add_argument('--delete-iterations', type=int, default=5)
+    parser.add_argument('--delete-chats', type=int, default=100)
+    parser.add_argument('--delete-messages', type=int, default=50)
+    parser.add_argument('--ttft-ms', type=float, default=0, help='fake LLM time to first token')
+    parser.add_argument('--tokens-per-sec', type=float, default=0, help='fake LLM speed (0 = instant)')
+    parser.add_argument('--response-tokens', type=int, default=200)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    app, db = harness.configure(args.database_url)
+    harness.install_fake_provider(ttft=args.ttft_ms / 1000, tokens_per_sec=args.tokens_per_sec,
+                                  response_tokens=args.response_tokens)
+
+    backend = args.label or harness.backend_name(app, db)
+    results = []
+    for name in args.only or SCENARIOS:
+        results.extend(SCENARIOS[name](app, db, args))
+
+    harness.write_results({
+        'suite': 'hot_paths',
+        'backend': backend,
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Message search: /api/search latency over a large message table, against a LIKE scan.
+
+Seeds ``--messages`` messages (1M by default) of Zipf-distributed words over
+``--users`` accounts, in chats of ``--chat-size``. One heavy account holds
+``--heavy-share`` of all messages, so the heavy account and a typical one
+show how the cost grows with a user's own history. The insert triggers keep
+the index up to date while seeding, so seeding also shows the write cost of
+the index.
+
+For each account it times these queries through /api/search:
+
+- common, mid, rare: one word that appears in about 1 in 5, 1 in 200 and
+  1 in 20k messages
+- two_words: a mid word and a rarer word together
+- prefix: the first letters of a mid word, as while typing
+- page_5: the common word, fifth page
+
+The baseline is what was possible before: ``content LIKE '%word%'`` over the
+user's messages, through the chat and message indexes.
+
+    python benchmarks/message_search.py --messages 1000000
+"""
+import argparse
+import itertools
+import random
+import time
+from datetime import datetime
+
+import harness
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ten', 'ra', 'vu', 'sor', 'pe', 'dax', 'qui', 'ne', 'bol', 'tu', 'ish', 'gar']
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda _w: rng.random())
+
+
+def seed(app, db, args, rng):
+    """Insert the corpus; return (heavy user id, typical user id, vocabulary, seconds)."""
+    from sqlalchemy import insert
+    from models import Chat, Message, User
+
+    words = vocabulary(args.vocabulary, rng)
+    # Zipf: the word of rank r turns up in proportion to 1 / r
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+    heavy = int(args.messages * args.heavy_share)
+    per_user = max((args.messages - heavy) // max(args.users - 1, 1), 1)
+    sizes = [heavy] + [per_user] * (args.users - 1)
+
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    with app.app_context():
+        users = [{'username': f'searcher{i}', 'email': f'searcher{i}@example.com'} for i in range(len(sizes))]
+        db.session.execute(insert(User), users)
+        user_ids = [u.id for u in User.query.filter(User.username.like('searcher%')).order_by(User.id)]
+        rows = []
+        for user_id, size in zip(user_ids, sizes):
+            for first in range(0, size, args.chat_size):
+                chat = Chat(title='Search benchmark', user_id=user_id)
+                db.session.add(chat)
+                db.session.flush()
+                for i in range(min(args.chat_size, size - first)):
+                    text = ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(8, 50)))
+                    rows.append({'content': text, 'is_user': i % 2 == 0, 'chat_id': chat.id, 'created_at': now})
+                if len(rows) >= 10000:
+                    db.session.execute(insert(Message), rows)
+                    db.session.commit()
+                    rows = []
+        if rows:
+            db.session.execute(insert(Message), rows)
+        db.session.commit()
+    return user_ids[0], user_ids[-1], words, time.perf_counter() - started
+
+
+def queries(words):
+    # The word of rank r is in about 29 / (11.4 r) of messages: 29 words per
+    # message on average, over the harmonic number of a 50k vocabulary
+    common, mid, rarer, rare = words[9], words[600], words[3000], words[-1]
+    return {
+        'common': ([common], 0),
+        'mid': ([mid], 0),
+        'rare': ([rare], 0),
+        'two_words': ([mid, rarer], 0),
+        'prefix': ([mid[:4]], 0),
+        'page_5': ([common], 4),
+    }
+
+
+def like_baseline(app, db, user_id, terms, limit):
+    from models import Chat, Message
+    with app.app_context():
+        query = Message.query.join(Chat).filter(Chat.user_id == user_id, Chat.deleted_at.is_(None))
+        for term in terms:
+            query = query.filter(Message.content.like(f'%{term}%'))
+        return query.order_by(Message.id.desc()).limit(limit + 1).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temp SQLite)')
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--heavy-share', type=float, default=0.1, help="heavy account's share of all messages")
+    parser.add_argument('--chat-size', type=int, default=100, help='messages per chat')
+    parser.add_argument('--vocabulary', type=int, default=50000)
+    parser.add_argument('--limit', type=int, default=20, help='results per page')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    app, db = harness.configure(args.database_url)
+    rng = random.Random(args.seed)
+    heavy_id, typical_id, words, seed_seconds = seed(app, db, args, rng)
+
+    results = []
+    for account, user_id in (('heavy', heavy_id), ('typical', typical_id)):
+        client = harness.login_client(app, user_id)
+        for name, (terms, page) in queries(words).items():
+            params = {'q': ' '.join(terms), 'limit': args.limit, 'offset': page * args.limit}
+
+            def call():
+                response = client.get('/api/search', query_string=params)
+                assert response.status_code == 200, response.status_code
+                return response.get_json()['results']
+
+            hits = len(call())
+            latencies, wall = harness.timed(call, args.iterations)
+            results.append(harness.summarize(f'search.{account}.{name}', latencies, wall, hits=hits))
+            if page == 0:
+                baseline = lambda: like_baseline(app, db, user_id, terms, args.limit)
+                latencies, wall = harness.timed(baseline, max(args.iterations // 5, 3))
+                results.append(harness.summarize(f'like_scan.{account}.{name}', latencies, wall))
+
+    harness.write_results({
+        'suite': 'message_search',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'seed_messages_per_sec': round(args.messages / seed_seconds),
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
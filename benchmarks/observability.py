@@ -0,0 +1,171 @@
+"""Observability overhead: hot-path throughput under each logging setup, and /metrics render time.
+
+Sends messages through /api/send_message (offline provider, no pacing) and
+fetches /api/get_chat, with log output written to /dev/null:
+
+- debug_logging: the old ``logging.basicConfig(level=DEBUG)``. Every
+  library's debug output is emitted, including a line per SQL statement.
+- info_uninstrumented: LOG_LEVEL=INFO, with the request and SQL
+  instrumentation hooks removed.
+- info_instrumented: LOG_LEVEL=INFO, as now, with per-request latency and SQL
+  counts recorded.
+
+It also reports how long a /metrics scrape takes once those runs have filled
+the registry. With ``--check`` it first builds an app under each /metrics
+setting and exits non-zero unless /metrics is 404 by default, 401 without the
+configured token, and 200 with it.
+
+    python benchmarks/observability.py --iterations 500
+"""
+import argparse
+import logging
+import os
+import sys
+
+import harness
+
+
+VARIANTS = (
+    ('debug_logging', logging.DEBUG, False),
+    ('info_uninstrumented', logging.INFO, False),
+    ('info_instrumented', logging.INFO, True),
+)
+
+
+def set_logging(level):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(open(os.devnull, 'w'))
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
+
+
+def set_instrumented(app, enabled):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.pool import Pool
+    import observability
+
+    hooks = [
+        (app.before_request_funcs, observability._start_request),
+        (app.after_request_funcs, observability._record_request),
+        (app.teardown_request_funcs, observability._finish_request),
+    ]
+    for registry, fn in hooks:
+        funcs = registry.setdefault(None, [])
+        if enabled and fn not in funcs:
+            funcs.insert(0, fn)
+        elif not enabled and fn in funcs:
+            funcs.remove(fn)
+    if enabled:
+        observability.instrument_engines()
+    elif event.contains(Engine, 'before_cursor_execute', observability._before_cursor_execute):
+        event.remove(Engine, 'before_cursor_execute', observability._before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', observability._after_cursor_execute)
+        event.remove(Engine, 'handle_error', observability._handle_error)
+        event.remove(Pool, 'checkout', observability._checkout)
+        event.remove(Pool, 'checkin', observability._checkin)
+
+
+# (environment, bearer token sent, expected /metrics status)
+METRICS_ACCESS = (
+    ({}, None, 404),
+    ({'METRICS_TOKEN': 'scraper'}, None, 401),
+    ({'METRICS_TOKEN': 'scraper'}, 'wrong', 401),
+    ({'METRICS_TOKEN': 'scraper'}, 'scraper', 200),
+    ({'METRICS_ENABLED': '1'}, None, 200),
+)
+
+
+def check_metrics_access():
+    """Problems with who may read /metrics; an empty list means none."""
+    from app import create_app
+
+    saved = {key: os.environ.pop(key) for key in ('METRICS_TOKEN', 'METRICS_ENABLED') if key in os.environ}
+    problems = []
+    try:
+        for env, token, expected in METRICS_ACCESS:
+            os.environ.update(env)
+            headers = {'Authorization': f'Bearer {token}'} if token else {}
+            status = create_app().test_client().get('/metrics', headers=headers).status_code
+            if status != expected:
+                problems.append(f'/metrics with {env or "no settings"} and token {token!r}: {status}, '
+                                f'expected {expected}')
+            for key in env:
+                del os.environ[key]
+    finally:
+        os.environ.update(saved)
+    return problems
+
+
+def calls(client, chat_id):
+    def send():
+        # A new chat each time, so the chat get_chat reads stays the same size
+        response = client.post('/api/send_message', json={'message': 'ping'})
+        response.get_data()
+        assert response.status_code == 200, response.status_code
+
+    def fetch():
+        response = client.get(f'/api/get_chat/{chat_id}')
+        assert response.status_code == 200, response.status_code
+
+    return {'send_message': send, 'get_chat': fetch}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temp SQLite)')
+    parser.add_argument('--iterations', type=int, default=500, help='calls per variant and endpoint')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--check', action='store_true', help='exit non-zero if /metrics is readable unconfigured')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    os.environ.setdefault('METRICS_TOKEN', 'bench')
+    app, db = harness.configure(args.database_url)
+    problems = check_metrics_access() if args.check else []
+    harness.install_fake_provider(ttft=0, tokens_per_sec=0, response_tokens=50)
+
+    user_id = harness.create_user(app, db)
+    chat_id = harness.seed_chat(app, db, user_id, 10)
+    client = harness.login_client(app, user_id)
+
+    # Variants take turns in short rounds so drift (database growth, CPU
+    # frequency) affects them all alike
+    samples = {}
+    for _round in range(args.rounds):
+        for name, level, instrumented in VARIANTS:
+            handler = set_logging(level)
+            set_instrumented(app, instrumented)
+            for label, fn in calls(client, chat_id).items():
+                fn()
+                latencies, wall = harness.timed(fn, max(args.iterations // args.rounds, 1))
+                entry = samples.setdefault(f'{name}.{label}', [[], 0.0])
+                entry[0].extend(latencies)
+                entry[1] += wall
+            handler.stream.close()
+    results = [harness.summarize(name, latencies, wall) for name, (latencies, wall) in samples.items()]
+    logging.getLogger().setLevel(logging.WARNING)
+
+    auth = {'Authorization': f"Bearer {os.environ['METRICS_TOKEN']}"}
+    scrape = lambda: client.get('/metrics', headers=auth).get_data()
+    latencies, wall = harness.timed(scrape, max(args.iterations // 10, 10))
+    results.append(harness.summarize('metrics_scrape', latencies, wall, bytes=len(scrape())))
+
+    harness.write_results({
+        'suite': 'observability',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }, args.output)
+    if problems:
+        print('\n'.join(problems), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Check that the hot queries are served by indexes.
+
+Calls each hot endpoint through the test client, captures the SQL it issues and
+runs EXPLAIN on every statement that reads ``chat`` or ``message``. The check
+fails (exit status 1) when a statement scans one of those tables without an
+index, sorts with a temporary B-tree, or misses the index the path relies on.
+
+    python benchmarks/query_plans.py
+    python benchmarks/query_plans.py --database-url postgresql://localhost/sarkar_bench
+"""
+import argparse
+import re
+import sys
+
+from sqlalchemy import event
+
+import harness
+
+HOT_TABLES = ('chat', 'message')
+
+
+def hot_paths(client, chat_id, first_message_id):
+    """(label, callable, indexes that must appear in the plan)"""
+    return [
+        ('chat sidebar', lambda: client.get('/chat'),
+         {'ix_chat_user_id_updated_at', 'ix_message_chat_id_id'}),
+        ('sidebar next page', lambda: client.get('/api/chats?cursor=2000-01-01T00:00:00|1'),
+         {'ix_chat_user_id_updated_at'}),
+        ('get_chat latest page', lambda: client.get(f'/api/get_chat/{chat_id}'),
+         {'ix_message_chat_id_id'}),
+        ('get_chat before cursor', lambda: client.get(f'/api/get_chat/{chat_id}?before={first_message_id + 100}'),
+         {'ix_message_chat_id_id'}),
+        ('send_message history', lambda: client.post('/api/send_message', json={
+            'message': 'plan check', 'chat_id': chat_id}).get_data(),
+         {'ix_message_chat_id_id'}),
+    ]
+
+
+def capture(engine, fn):
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and \
+                any(re.search(rf'\bFROM\s+"?{t}"?\b', statement, re.I) for t in HOT_TABLES):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    return statements
+
+
+def explain(conn, statement, parameters):
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+        return [row[-1] for row in rows]
+    # Tiny tables make the planner prefer seq scans; ask whether an index *can* be used
+    conn.exec_driver_sql('SET enable_seqscan = off')
+    return [row[0] for row in conn.exec_driver_sql(f'EXPLAIN {statement}', parameters).all()]
+
+
+def problems(plan, dialect):
+    found = []
+    for line in plan:
+        if dialect == 'sqlite':
+            if re.match(rf'SCAN ({"|".join(HOT_TABLES)})\b', line) and 'INDEX' not in line:
+                found.append(f'full scan: {line}')
+            if 'TEMP B-TREE' in line:
+                found.append(f'sort without index: {line}')
+        elif re.search(rf'Seq Scan on ({"|".join(HOT_TABLES)})\b', line):
+            found.append(f'full scan: {line.strip()}')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to check (default: temp SQLite)')
+    args = parser.parse_args()
+
+    app, db = harness.configure(args.database_url)
+    harness.install_fake_provider(ttft=0, tokens_per_sec=0, response_tokens=5)
+    user_id = harness.create_user(app, db, 'planner')
+    client = harness.login_client(app, user_id)
+    harness.seed_chats(app, db, user_id, 20, 5)
+    chat_id = harness.seed_chat(app, db, user_id, 500)
+    first_message_id = client.get(f'/api/get_chat/{chat_id}?after=0&limit=1').get_json()['chat']['messages'][0]['id']
+
+    failures = 0
+    with app.app_context():
+        engine = db.engine
+        for label, fn, required in hot_paths(client, chat_id, first_message_id):
+            statements = capture(engine, fn)
+            used = set()
+            issues = []
+            with engine.connect() as conn:
+                for statement, parameters in statements:
+                    plan = explain(conn, statement, parameters)
+                    used.update(name for name in required if any(name in line for line in plan))
+                    issues.extend(problems(plan, engine.dialect.name))
+            missing = required - used
+            if missing:
+                issues.append(f"expected index not used: {', '.join(sorted(missing))}")
+            status = 'FAIL' if issues else 'ok'
+            print(f'{status:<5} {label} ({len(statements)} queries)')
+            for issue in issues:
+                print(f'      {issue}')
+            failures += bool(issues)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""LLM response cache: latency of cache hits vs misses through /api/send_message.
+
+Sends the same opening message on fresh chats (the canned "hello" case), so
+after the first request every turn is a cache hit, and compares it with a user
+who opted out of the cache. Reports time to first token and full stream time
+for both, plus the hit rate and generation time saved from the cache metrics.
+
+    python benchmarks/response_cache.py --iterations 50
+"""
+import argparse
+import os
+import time
+
+import harness
+
+
+def stream_once(client, message):
+    started = time.perf_counter()
+    response = client.post('/api/send_message', json={'message': message}, buffered=False)
+    first = None
+    # The first event is `start`, sent before the model is called
+    for index, _chunk in enumerate(response.response):
+        if index == 1:
+            first = time.perf_counter() - started
+    response.close()
+    return first, time.perf_counter() - started
+
+
+def run(name, client, message, iterations):
+    ttfb, full = [], []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        first, total = stream_once(client, message)
+        ttfb.append(first)
+        full.append(total)
+    wall = time.perf_counter() - started
+    return [
+        harness.summarize(f'{name}.first_token', ttfb, wall),
+        harness.summarize(f'{name}.full_stream', full, wall),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--ttft-ms', type=float, default=300, help='fake time to first token')
+    parser.add_argument('--tokens-per-sec', type=float, default=100, help='fake generation speed')
+    parser.add_argument('--response-tokens', type=int, default=150, help='tokens per response')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    os.environ['RESPONSE_CACHE_ENABLED'] = '1'
+    app, db = harness.configure()
+    import metrics
+    from models import User
+
+    harness.install_fake_provider(
+        ttft=args.ttft_ms / 1000,
+        tokens_per_sec=args.tokens_per_sec,
+        response_tokens=args.response_tokens,
+    )
+    cached_user = harness.create_user(app, db, 'cached')
+    opted_out_user = harness.create_user(app, db, 'opted_out')
+    with app.app_context():
+        db.session.get(User, opted_out_user).response_cache_opt_out = True
+        db.session.commit()
+
+    results = run('cache_enabled', harness.login_client(app, cached_user), 'hello', args.iterations)
+    requests = metrics.REGISTRY['llm_cache_requests_total']
+    hits, misses = requests.value(result='hit'), requests.value(result='miss')
+    results += run('cache_opted_out', harness.login_client(app, opted_out_user), 'hello', args.iterations)
+
+    harness.write_results({
+        'suite': 'response_cache',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'cache': {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+            'seconds_saved': round(metrics.REGISTRY['llm_cache_seconds_saved_total'].value(), 3),
+        },
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Run every benchmark suite and collect the results into one JSON file.
+
+Each suite runs in its own process because the app binds its database at
+import time. SQLite always runs; a Postgres-compatible stand-in (a local
+postgres, or anything speaking its wire protocol) is included when
+``BENCH_POSTGRES_URL`` is set. That database is wiped by the run. Checks that
+pass or fail rather than measure are run by run_checks.py.
+
+    python benchmarks/run_all.py                 # -> benchmarks/results/<commit>.json
+    BENCH_POSTGRES_URL=postgresql://localhost/sarkar_bench python benchmarks/run_all.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import harness
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def backends():
+    yield 'sqlite', None
+    postgres_url = os.environ.get('BENCH_POSTGRES_URL')
+    if postgres_url:
+        yield 'postgres', postgres_url
+
+
+def run_suite(script, extra_args):
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as fh:
+        output = fh.name
+    command = [sys.executable, os.path.join(HERE, script), '--output', output, *extra_args]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(output) as fh:
+        return json.load(fh)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations for a smoke run')
+    args = parser.parse_args()
+
+    quick = ['--iterations', '10', '--chat-sizes', '10', '1000', '--scaling-sizes', '10', '1000',
+             '--sidebar-chats', '50', '--delete-iterations', '2'] if args.quick else []
+
+    suites = []
+    for label, url in backends():
+        extra = ['--label', label, *quick]
+        if url:
+            extra += ['--database-url', url]
+        suites.append(run_suite('hot_paths.py', extra))
+    suites.append(run_suite('stream_capacity.py', ['--streams', '50'] if args.quick else []))
+    suites.append(run_suite('sse_coalescing.py', ['--streams', '10'] if args.quick else []))
+    suites.append(run_suite('response_cache.py', ['--iterations', '5'] if args.quick else []))
+    suites.append(run_suite('static_assets.py', ['--views', '3'] if args.quick else []))
+    suites.append(run_suite('user_cache.py', ['--iterations', '200'] if args.quick else []))
+    suites.append(run_suite('google_login.py', ['--logins', '20'] if args.quick else []))
+    suites.append(run_suite('smtp_throughput.py', ['--messages', '100', '--requests', '20'] if args.quick else []))
+    suites.append(run_suite('context_window.py', ['--turns', '60'] if args.quick else []))
+    suites.append(run_suite('observability.py', ['--iterations', '100', '--rounds', '2'] if args.quick else []))
+    suites.append(run_suite('chat_deletion.py', ['--chats', '20', '--iterations', '1'] if args.quick else []))
+    suites.append(run_suite('message_search.py', ['--messages', '20000', '--users', '50', '--iterations', '5']
+                            if args.quick else []))
+    suites.append(run_suite('write_batching.py', ['--writers', '16', '--writes', '10'] if args.quick else []))
+    suites.append(run_suite('db_tuning.py', ['--seconds', '2', '--commits', '100'] if args.quick else []))
+    suites.append(run_suite('stream_connections.py', ['--streams', '10', '50'] if args.quick else []))
+    suites.append(run_suite('startup.py', ['--runs', '3'] if args.quick else []))
+
+    meta = harness.metadata()
+    output = args.output or os.path.join(harness.RESULTS_DIR, f"{(meta['git_commit'] or 'unknown')[:12]}.json")
+    harness.write_results({**meta, 'suites': suites}, output)
+
+
+if __name__ == '__main__':
+    main()
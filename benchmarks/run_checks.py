@@ -0,0 +1,64 @@
+"""Run the pass/fail checks; exit non-zero if any of them fails.
+
+run_all.py measures and records numbers. The scripts listed here assert: each
+exits non-zero when a property the code relies on stops holding, and this
+runner is the single entry point for CI. Each runs in its own process because
+the app binds its database at import. With ``BENCH_POSTGRES_URL`` set, checks
+that take ``--database-url`` also run against that database, which is wiped.
+
+    python benchmarks/run_checks.py
+    python benchmarks/run_checks.py --only query_plans
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from run_all import backends
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (script, arguments, whether it takes --database-url)
+CHECKS = [
+    ('query_plans.py', [], True),
+    ('chat_deletion.py', ['--check', '--chats', '20', '--iterations', '1'], True),
+    ('observability.py', ['--check', '--iterations', '20', '--rounds', '1'], False),
+    ('stream_connections.py', ['--check', '--modes', 'wsgi', 'asgi', '--streams', '10', '50'], False),
+    # Also fails when ``import app`` loads langchain_google_genai or another deferred module
+    ('startup.py', ['--runs', '3', '--budget-ms', '1500'], False),
+]
+
+
+def run_check(script, extra_args):
+    command = [sys.executable, os.path.join(HERE, script), *extra_args]
+    started = time.perf_counter()
+    completed = subprocess.run(command, capture_output=True, text=True)
+    return completed, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', help='script names to run (default: all)')
+    args = parser.parse_args()
+
+    failures = 0
+    for script, check_args, takes_url in CHECKS:
+        if args.only and script.removesuffix('.py') not in args.only and script not in args.only:
+            continue
+        for label, url in backends():
+            if url and not takes_url:
+                continue
+            extra = [*check_args, '--database-url', url] if url else check_args
+            completed, seconds = run_check(script, extra)
+            status = 'ok' if completed.returncode == 0 else 'FAIL'
+            print(f'{status:<5} {script} [{label}] ({seconds:.1f}s)')
+            if completed.returncode:
+                failures += 1
+                print(completed.stdout[-2000:] + completed.stderr[-2000:])
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
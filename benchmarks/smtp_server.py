@@ -0,0 +1,134 @@
+"""Local SMTP stand-in for exercising mail_transport without a real provider.
+
+Speaks enough of the protocol for ``smtplib``: EHLO/HELO, AUTH PLAIN/LOGIN
+(any credentials are accepted), MAIL, RCPT, DATA, RSET, NOOP and QUIT. It
+offers no STARTTLS, so point clients at it with ``MAIL_USE_TLS=0``. The
+cost of the TLS and auth handshakes a real provider adds is simulated with
+``handshake_ms``: half is spent before the greeting and half on AUTH. Every
+reply is delayed by ``rtt_ms`` to stand in for network latency.
+
+Received messages are kept in ``messages`` as ``(mail_from, rcpt_tos, data)``.
+``drop_connections()`` closes every open session, which simulates a server
+timing out idle clients.
+
+    server = StandInSMTPServer(handshake_ms=60, rtt_ms=2).start()
+    ... MAIL_SERVER=127.0.0.1 MAIL_PORT=server.port ...
+    server.stop()
+"""
+import asyncio
+import threading
+
+
+class StandInSMTPServer:
+    def __init__(self, host='127.0.0.1', port=0, handshake_ms=0, rtt_ms=0):
+        self.host = host
+        self.port = port
+        self.handshake = handshake_ms / 1000
+        self.rtt = rtt_ms / 1000
+        self.messages = []
+        self.connections = 0
+        self._writers = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._session, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='smtp-stand-in', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        async def shutdown():
+            self._server.close()
+            sessions = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in sessions:
+                task.cancel()
+            await asyncio.gather(*sessions, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def drop_connections(self):
+        def drop():
+            for writer in list(self._writers):
+                writer.close()
+        self._loop.call_soon_threadsafe(drop)
+
+    async def _reply(self, writer, *lines):
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        writer.write(''.join(lines).encode('ascii'))
+        await writer.drain()
+
+    async def _session(self, reader, writer):
+        self.connections += 1
+        self._writers.add(writer)
+        mail_from, rcpt_tos = None, []
+        try:
+            await asyncio.sleep(self.handshake / 2)
+            await self._reply(writer, '220 stand-in ESMTP\r\n')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                command = line.decode('ascii', 'replace').rstrip('\r\n')
+                verb, _, argument = command.partition(' ')
+                verb = verb.upper()
+                if verb == 'EHLO':
+                    await self._reply(writer, '250-stand-in\r\n', '250-AUTH PLAIN LOGIN\r\n', '250 8BITMIME\r\n')
+                elif verb == 'HELO':
+                    await self._reply(writer, '250 stand-in\r\n')
+                elif verb == 'AUTH':
+                    mechanism = argument.split(' ')[0].upper()
+                    if mechanism == 'LOGIN':
+                        for prompt in ('VXNlcm5hbWU6', 'UGFzc3dvcmQ6'):
+                            await self._reply(writer, f'334 {prompt}\r\n')
+                            await reader.readline()
+                    elif mechanism == 'PLAIN' and ' ' not in argument:
+                        await self._reply(writer, '334 \r\n')
+                        await reader.readline()
+                    await asyncio.sleep(self.handshake / 2)
+                    await self._reply(writer, '235 Authentication successful\r\n')
+                elif verb == 'MAIL':
+                    mail_from, rcpt_tos = argument, []
+                    await self._reply(writer, '250 OK\r\n')
+                elif verb == 'RCPT':
+                    rcpt_tos.append(argument)
+                    await self._reply(writer, '250 OK\r\n')
+                elif verb == 'DATA':
+                    await self._reply(writer, '354 End data with <CR><LF>.<CR><LF>\r\n')
+                    data = []
+                    while True:
+                        chunk = await reader.readline()
+                        if not chunk or chunk == b'.\r\n':
+                            break
+                        data.append(chunk)
+                    self.messages.append((mail_from, rcpt_tos, b''.join(data)))
+                    await self._reply(writer, '250 OK queued\r\n')
+                elif verb in ('RSET', 'NOOP'):
+                    if verb == 'RSET':
+                        mail_from, rcpt_tos = None, []
+                    await self._reply(writer, '250 OK\r\n')
+                elif verb == 'QUIT':
+                    await self._reply(writer, '221 Bye\r\n')
+                    return
+                else:
+                    await self._reply(writer, '502 Command not implemented\r\n')
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
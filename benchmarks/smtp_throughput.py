@@ -0,0 +1,149 @@
+"""Password reset mail: per-message SMTP sessions vs the pooled, batched transport.
+
+Delivers the same rendered reset email to a local stand-in SMTP server
+(benchmarks/smtp_server.py) three ways:
+
+- per_message: the old behaviour. Every send opens a connection, logs in,
+  sends and quits. ``--concurrency`` threads stand in for concurrent requests.
+- pooled: mail_transport with batching off, so only connection reuse applies.
+- pooled_batched: mail_transport with its default batching.
+
+The stand-in charges ``--handshake-ms`` per new connection, standing in for
+TLS and AUTH, and ``--rtt-ms`` per reply. For each mode the benchmark reports
+messages/sec, the connections opened, and how long the caller was blocked.
+For the transport that is only the submit call. It also times template
+rendering and a /reset_password_request round trip with the pooled transport.
+
+    python benchmarks/smtp_throughput.py --messages 500 --handshake-ms 60 --rtt-ms 2
+"""
+import argparse
+import os
+import smtplib
+import threading
+import time
+
+import harness
+from smtp_server import StandInSMTPServer
+
+SENDER = 'bench@example.com'
+
+
+def per_message(server, message, count, concurrency):
+    """The pre-pool behaviour: one full SMTP session per email."""
+    def send_one():
+        with smtplib.SMTP(server.host, server.port) as smtp:
+            smtp.login(SENDER, 'secret')
+            smtp.sendmail(SENDER, 'user@example.com', message)
+
+    latencies = []
+    lock = threading.Lock()
+    remaining = iter(range(count))
+
+    def worker():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            started = time.perf_counter()
+            send_one()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def transported(transport, message, count):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(count):
+        call_started = time.perf_counter()
+        transport.submit('user@example.com', message)
+        latencies.append(time.perf_counter() - call_started)
+    transport.flush()
+    return latencies, time.perf_counter() - started
+
+
+def make_transport(server, pool_size, batch_size, batch_window_ms):
+    import mail_transport
+    pool = mail_transport.SMTPConnectionPool(
+        server.host, server.port, SENDER, 'secret', use_tls=False, size=pool_size)
+    return mail_transport.MailTransport(
+        pool, SENDER, batch_size=batch_size, batch_window_ms=batch_window_ms, max_pending=1_000_000)
+
+
+def run(name, server, send):
+    delivered = len(server.messages)
+    connections = server.connections
+    latencies, wall = send()
+    delivered = len(server.messages) - delivered
+    return harness.summarize(
+        f'{name}.caller_blocked', latencies, wall,
+        delivered=delivered,
+        messages_per_sec=round(delivered / wall, 1),
+        connections_opened=server.connections - connections,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500, help='emails per mode')
+    parser.add_argument('--concurrency', type=int, default=4, help='sending threads for per_message')
+    parser.add_argument('--pool-size', type=int, default=2, help='pooled connections for the transport')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--batch-window-ms', type=float, default=50)
+    parser.add_argument('--handshake-ms', type=float, default=60, help='simulated TLS + AUTH cost')
+    parser.add_argument('--rtt-ms', type=float, default=2, help='simulated per-reply latency')
+    parser.add_argument('--requests', type=int, default=100, help='/reset_password_request round trips')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    server = StandInSMTPServer(handshake_ms=args.handshake_ms, rtt_ms=args.rtt_ms).start()
+    os.environ.update({
+        'MAIL_SERVER': server.host, 'MAIL_PORT': str(server.port), 'MAIL_USE_TLS': '0',
+        'MAIL_USERNAME': SENDER, 'MAIL_PASSWORD': 'secret', 'MAIL_POOL_SIZE': str(args.pool_size),
+    })
+    app, db = harness.configure()
+    import email_service
+    import mail_transport
+
+    render = lambda: email_service.build_password_reset_message(
+        SENDER, 'user@example.com', 'Bench User', 'http://localhost:5000/reset_password?token=abc')
+    render_latencies, render_wall = harness.timed(render, 1000)
+    message = render()
+
+    results = [
+        harness.summarize('render_template', render_latencies, render_wall),
+        run('per_message', server, lambda: per_message(server, message, args.messages, args.concurrency)),
+    ]
+    pooled = make_transport(server, args.pool_size, 1, 0)
+    results.append(run('pooled', server, lambda: transported(pooled, message, args.messages)))
+    pooled.close()
+    batched = make_transport(server, args.pool_size, args.batch_size, args.batch_window_ms)
+    results.append(run('pooled_batched', server, lambda: transported(batched, message, args.messages)))
+    batched.close()
+
+    # End to end through the route, using the transport the app builds from the environment
+    harness.create_user(app, db, 'reset')
+    client = app.test_client()
+    request_latencies, request_wall = harness.timed(
+        lambda: client.post('/reset_password_request', data={'email': 'reset@example.com'}), args.requests)
+    mail_transport.get_transport().flush()
+    results.append(harness.summarize('reset_password_request', request_latencies, request_wall))
+    server.stop()
+
+    harness.write_results({
+        'suite': 'smtp_throughput',
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
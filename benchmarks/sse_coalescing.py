@@ -0,0 +1,106 @@
+"""SSE chunk coalescing and framing: events, bytes and latency per stream.
+
+Streams through the ASGI handler with the FakeProvider emitting one token per
+chunk, the worst case for per-event overhead, and repeats the run for each
+coalescing window and framing. For every configuration it reports events and
+bytes per stream, events/sec, time to first byte, the largest gap between two
+events a client sees, and the server CPU time spent for all streams.
+
+    python benchmarks/sse_coalescing.py --streams 50 --windows 0 16 30 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import harness
+
+
+def run(application, cookie, streams, framing):
+    import streaming
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+
+    async def one():
+        times = []
+        sizes = []
+
+        def on_body(body):
+            times.append(time.perf_counter())
+            sizes.append(len(body))
+
+        opened = time.perf_counter()
+        await harness.asgi_post(application, '/api/send_message',
+                                {'message': 'hello', 'framing': framing}, cookie, on_body)
+        # The first body part is the start event; latency is about the text after it
+        gaps = [b - a for a, b in zip(times[1:], times[2:])]
+        return {
+            'events': len(times),
+            'bytes': sum(sizes),
+            'ttfb': times[1] - opened if len(times) > 1 else None,
+            'max_gap': max(gaps, default=0),
+            'duration': times[-1] - opened,
+        }
+
+    async def main():
+        return await asyncio.gather(*(one() for _ in range(streams)))
+
+    results = asyncio.run(main())
+    wall = time.perf_counter() - started
+    events = [r['events'] for r in results]
+    return {
+        'name': f"window_{streaming.COALESCE_MS:g}ms.{framing}",
+        'window_ms': streaming.COALESCE_MS,
+        'framing': framing,
+        'streams': streams,
+        'events_per_stream': statistics.fmean(events),
+        'bytes_per_stream': round(statistics.fmean(r['bytes'] for r in results)),
+        'events_per_sec': round(sum(events) / wall, 1),
+        'ttfb_p50_ms': round(statistics.median(r['ttfb'] for r in results) * 1000, 2),
+        'max_gap_p99_ms': round(harness.percentile([r['max_gap'] for r in results], 99) * 1000, 2),
+        'stream_p50_ms': round(statistics.median(r['duration'] for r in results) * 1000, 1),
+        'server_cpu_ms': round((time.process_time() - cpu_started) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=50, help='concurrent streams per configuration')
+    parser.add_argument('--windows', type=float, nargs='+', default=[0, 16, 30, 50],
+                        help='coalescing windows to compare, in ms (0 disables coalescing)')
+    parser.add_argument('--framings', nargs='+', default=['json', 'compact'])
+    parser.add_argument('--ttft-ms', type=float, default=100, help='fake time to first token')
+    parser.add_argument('--tokens-per-sec', type=float, default=200, help='fake generation speed')
+    parser.add_argument('--response-tokens', type=int, default=300, help='tokens per response')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    app, db = harness.configure()
+    import streaming
+    from asgi import application
+
+    harness.install_fake_provider(
+        ttft=args.ttft_ms / 1000,
+        tokens_per_sec=args.tokens_per_sec,
+        chunk_size=1,
+        response_tokens=args.response_tokens,
+    )
+    cookie = harness.session_cookie(harness.login_client(app, harness.create_user(app, db)))
+
+    results = []
+    for window in args.windows:
+        streaming.COALESCE_MS = window
+        for framing in args.framings:
+            results.append(run(application, cookie, args.streams, framing))
+
+    harness.write_results({
+        'suite': 'sse_coalescing',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
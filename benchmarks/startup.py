@@ -0,0 +1,138 @@
+"""Startup: time to import the app and serve its first request, with an import profile.
+
+Each run starts a fresh interpreter against a fresh SQLite file, imports
+``app`` and then requests /auth through the test client. It records the import
+time, the first request (which now prepares the schema) and the whole
+process. Two modes are compared:
+
+- eager: before the app factory. The LLM SDK, requests and oauthlib are imported
+  up front and the schema is created as part of startup.
+- lazy: ``import app`` as it is now.
+
+Then ``python -X importtime -c "import app"`` breaks the import down by
+top-level package and lists any module that should be deferred but still
+loads. With ``--budget-ms``, the script exits non-zero when the lazy import's
+median is over budget or a deferred module loads, so a CI job can track
+startup regressions.
+
+    python benchmarks/startup.py --runs 10 --budget-ms 600
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import harness
+
+# Only needed once a user chats with Gemini or signs in with Google
+DEFERRED = ('langchain_google_genai', 'langchain_core', 'google.generativeai', 'oauthlib', 'requests')
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+{preload}
+import app as app_module
+{prepare}
+imported = time.perf_counter()
+response = app_module.app.test_client().get('/auth')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - started) * 1000, 'first_request_ms': (served - imported) * 1000}}))
+"""
+
+MODES = {
+    'eager': {
+        'preload': 'import langchain_google_genai, langchain_core.prompts, oauthlib.oauth2, requests',
+        'prepare': 'app_module.init_db(app_module.app)',
+    },
+    'lazy': {'preload': '', 'prepare': ''},
+}
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)')
+
+
+def child_env():
+    env = dict(os.environ)
+    db_path = os.path.join(tempfile.mkdtemp(prefix='sarkar-startup-'), 'startup.db')
+    env.update({'DATABASE_URL': f'sqlite:///{db_path}', 'LLM_PROVIDER': 'fake'})
+    return env
+
+
+def run_once(mode):
+    code = CHILD.format(**MODES[mode])
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code], cwd=harness.ROOT, env=child_env(),
+                               capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def run(mode, runs):
+    run_once(mode)  # warm the OS page cache and the .pyc files
+    samples = [run_once(mode) for _ in range(runs)]
+    summary = {'name': mode, 'runs': runs}
+    for key in ('import_ms', 'first_request_ms', 'process_ms'):
+        values = [sample[key] for sample in samples]
+        summary[f'{key}_p50'] = round(statistics.median(values), 1)
+        summary[f'{key}_max'] = round(max(values), 1)
+    return summary
+
+
+def import_profile(top):
+    """Self time (ms) per top-level package for ``import app``, and deferred modules that loaded."""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=harness.ROOT,
+                               env=child_env(), capture_output=True, text=True, check=True)
+    by_package = {}
+    loaded = set()
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, name = int(match.group(1)), match.group(2)
+        package = name.split('.')[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+        loaded.add(name)
+    ranked = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    deferred = sorted(name for name in loaded if any(name == d or name.startswith(d + '.') for d in DEFERRED))
+    return {
+        'total_ms': round(sum(by_package.values()) / 1000, 1),
+        'modules': len(loaded),
+        'top_packages_ms': {package: round(us / 1000, 1) for package, us in ranked},
+        'deferred_loaded': deferred,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10, help='packages to list in the import profile')
+    parser.add_argument('--budget-ms', type=float, help='fail when the lazy import p50 exceeds this')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    results = [run(mode, args.runs) for mode in MODES]
+    profile = import_profile(args.top)
+
+    harness.write_results({
+        'suite': 'startup',
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+        'import_profile': profile,
+    }, args.output)
+
+    if args.budget_ms is not None:
+        lazy = results[-1]['import_ms_p50']
+        if lazy > args.budget_ms or profile['deferred_loaded']:
+            sys.exit(f"Startup over budget: import p50 {lazy} ms (budget {args.budget_ms} ms), "
+                     f"deferred modules loaded: {profile['deferred_loaded']}")
+
+
+if __name__ == '__main__':
+    main()
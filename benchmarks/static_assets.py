@@ -0,0 +1,103 @@
+"""Static assets: bytes and requests per /chat page view, cold and warm.
+
+Loads /chat through the test client and fetches every script, stylesheet and
+image it links, with ``Accept-Encoding: gzip, br``. A small browser-cache model
+honours the ``Cache-Control`` each response carries and revalidates stale
+entries with their ETag; a 304 counts as a request with no bytes. The page is viewed
+``--views`` times, and the first view and the repeat views are reported
+separately.
+
+Two runs are compared. ``legacy`` sends every response with no-store and
+links the unminified files, as before the asset pipeline. ``pipeline`` uses
+the built bundles, minified only where rjsmin or rcssmin is installed
+(reported as ``minified``). The script builds them into a temporary directory,
+so static/dist is left alone.
+
+    python benchmarks/static_assets.py --views 10
+"""
+import argparse
+import re
+import tempfile
+import time
+
+import harness
+
+LINK = re.compile(r'(?:src|href)="(/(?:static|assets)/[^"]+)"')
+
+
+class BrowserCache:
+    def __init__(self):
+        # url -> (fresh until, ETag)
+        self.entries = {}
+
+    def fetch(self, client, url):
+        """Return ``(bytes transferred, whether a request was sent)`` for ``url``."""
+        fresh_until, etag = self.entries.get(url, (0, None))
+        if fresh_until > time.monotonic():
+            return 0, False
+        headers = {'Accept-Encoding': 'gzip, br'}
+        if etag:
+            headers['If-None-Match'] = etag
+        response = client.get(url, headers=headers)
+        cache_control = response.headers.get('Cache-Control', '')
+        if 'no-store' not in cache_control:
+            match = re.search(r'max-age=(\d+)', cache_control)
+            max_age = int(match.group(1)) if match and 'no-cache' not in cache_control else 0
+            self.entries[url] = (time.monotonic() + max_age, response.headers.get('ETag') or etag)
+        return len(response.data), True
+
+
+def view(client, cache):
+    page = client.get('/chat')
+    urls = LINK.findall(page.get_data(as_text=True))
+    fetched = [cache.fetch(client, url) for url in urls]
+    return (len(page.data) + sum(size for size, _ in fetched),
+            1 + sum(1 for _, requested in fetched if requested))
+
+
+def run(name, client, views):
+    cache = BrowserCache()
+    cold_bytes, cold_requests = view(client, cache)
+    warm = [view(client, cache) for _ in range(views - 1)]
+    return {
+        'name': name,
+        'cold_bytes': cold_bytes,
+        'cold_requests': cold_requests,
+        'warm_bytes_per_view': round(sum(b for b, _ in warm) / len(warm)) if warm else None,
+        'warm_requests_per_view': round(sum(r for _, r in warm) / len(warm), 2) if warm else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--views', type=int, default=10)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    app, db = harness.configure()
+    import assets
+
+    client = harness.login_client(app, harness.create_user(app, db))
+
+    # Before: raw files, and the old after_request stamping no-store on everything
+    assets._manifest = {}
+    no_store = lambda response: response.headers.update({'Cache-Control': 'no-cache, no-store'}) or response
+    app.after_request_funcs.setdefault(None, []).append(no_store)
+    results = [run('legacy', client, args.views)]
+    app.after_request_funcs[None].remove(no_store)
+
+    assets.DIST_DIR = tempfile.mkdtemp(prefix='sarkar-assets-')
+    assets._manifest = assets.build(dist_dir=assets.DIST_DIR)
+    results.append(run('pipeline', client, args.views))
+
+    harness.write_results({
+        'suite': 'static_assets',
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'minified': sorted(assets.minifiers()),
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Concurrent SSE stream capacity: sync WSGI workers vs the ASGI stream path.
+
+The LLM is replaced by the offline FakeProvider, so the numbers only
+reflect how many conversations each serving model can keep open at once. All
+streams are opened together; time-to-first-byte is measured from that moment,
+so it includes any time a request spent queued behind busy workers.
+
+    python benchmarks/stream_capacity.py --streams 500 --workers 4
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import harness
+
+
+def _summary(name, wall, ttfb, provider, streams):
+    return harness.summarize(
+        f'{name}.ttfb', ttfb, wall,
+        streams=streams,
+        wall_seconds=round(wall, 3),
+        peak_concurrent_streams=provider.peak_streams,
+    )
+
+
+def run_sync(app, session_cookie, provider, streams, workers):
+    """Each request occupies one of ``workers`` threads for its whole stream."""
+    provider.reset_stats()
+    started = time.perf_counter()
+
+    def one(_):
+        client = app.test_client()
+        client.set_cookie('session', session_cookie)
+        response = client.post('/api/send_message', json={'message': 'hello'}, buffered=False)
+        first = None
+        for _chunk in response.response:
+            if first is None:
+                first = time.perf_counter() - started
+        response.close()
+        return first
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        ttfb = list(pool.map(one, range(streams)))
+    return _summary(f'wsgi_sync_{workers}_workers', time.perf_counter() - started, ttfb, provider, streams)
+
+
+def run_async(application, session_cookie, provider, streams):
+    """All streams share one event loop through the ASGI handler."""
+    provider.reset_stats()
+    started = time.perf_counter()
+
+    async def one():
+        first = None
+
+        def on_body(_body):
+            nonlocal first
+            if first is None:
+                first = time.perf_counter() - started
+
+        await harness.asgi_post(application, '/api/send_message', {'message': 'hello'}, session_cookie, on_body)
+        return first
+
+    async def main():
+        return await asyncio.gather(*(one() for _ in range(streams)))
+
+    ttfb = asyncio.run(main())
+    return _summary('asgi_async', time.perf_counter() - started, ttfb, provider, streams)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=200, help='concurrent streams to open')
+    parser.add_argument('--workers', type=int, default=4, help='sync worker count to emulate')
+    parser.add_argument('--ttft-ms', type=float, default=200, help='fake time to first token')
+    parser.add_argument('--tokens-per-sec', type=float, default=80, help='fake generation speed')
+    parser.add_argument('--chunk-tokens', type=int, default=4, help='tokens per streamed chunk')
+    parser.add_argument('--response-tokens', type=int, default=80, help='tokens per response')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    app, db = harness.configure()
+    from asgi import application
+
+    provider = harness.install_fake_provider(
+        ttft=args.ttft_ms / 1000,
+        tokens_per_sec=args.tokens_per_sec,
+        chunk_size=args.chunk_tokens,
+        response_tokens=args.response_tokens,
+    )
+    user_id = harness.create_user(app, db)
+    session_cookie = harness.session_cookie(harness.login_client(app, user_id))
+
+    harness.write_results({
+        'suite': 'stream_capacity',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': [
+            run_sync(app, session_cookie, provider, args.streams, args.workers),
+            run_async(application, session_cookie, provider, args.streams),
+        ],
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
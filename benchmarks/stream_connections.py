@@ -0,0 +1,180 @@
+"""Stream connections: pooled DB connections held while N answers stream at once.
+
+A turn needs the database twice: to save the user message when it starts and
+to save the answer when it ends. In between, the model generates for seconds
+and the turn should hold no connection. This script opens ``--streams``
+concurrent streams against a deliberately small pool (``--pool-size``, no
+overflow) while a sampler thread polls ``pool.checkedout()``:
+
+- wsgi: /api/send_message through the test client, one thread per stream.
+- asgi: the same route through ``asgi.application`` on one event loop.
+- held: wsgi with the generator wrapped to keep a connection checked out until
+  it finishes, as when the request session stayed open for the whole stream.
+
+It reports the peak of checked-out connections overall and while every stream
+is generating, and the streams that failed (an error instead of a saved
+answer). With ``--check``, the script exits non-zero when a wsgi or asgi
+stream failed or held a connection while generating, so a CI job can catch a
+regression.
+
+    python benchmarks/stream_connections.py --streams 10 50 200 --check
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import harness
+
+
+class PoolSampler:
+    """Poll checked-out connections and generating streams until stopped."""
+
+    def __init__(self, pool, provider, streams, interval=0.001):
+        self.pool = pool
+        self.provider = provider
+        self.streams = streams
+        self.interval = interval
+        self.peak = 0
+        self.peak_while_generating = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            checked_out = self.pool.checkedout()
+            self.peak = max(self.peak, checked_out)
+            if self.provider.active_streams >= self.streams:
+                self.peak_while_generating = max(self.peak_while_generating or 0, checked_out)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _saved(body):
+    return '"type": "end"' in body and '"message_id": null' not in body
+
+
+def run_wsgi(app, cookie, streams):
+    failed = [0]
+    barrier = threading.Barrier(streams)
+
+    def one():
+        client = app.test_client()
+        client.set_cookie('session', cookie)
+        barrier.wait()
+        response = client.post('/api/send_message', json={'message': 'hello'}, buffered=False)
+        body = b''.join(response.response).decode()
+        response.close()
+        if response.status_code != 200 or not _saved(body):
+            failed[0] += 1
+
+    threads = [threading.Thread(target=one) for _ in range(streams)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return failed[0]
+
+
+def run_asgi(application, cookie, streams):
+    async def one():
+        parts = []
+        await harness.asgi_post(application, '/api/send_message', {'message': 'hello'}, cookie,
+                                lambda body: parts.append(body))
+        return _saved(b''.join(parts).decode())
+
+    async def main():
+        return await asyncio.gather(*(one() for _ in range(streams)))
+
+    return sum(1 for saved in asyncio.run(main()) if not saved)
+
+
+def hold_connection(generate, engine):
+    """Wrap ``generate`` so each call keeps a connection checked out until it is exhausted."""
+    from sqlalchemy import text
+
+    def generate_holding(*args, **kwargs):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            yield from generate(*args, **kwargs)
+    return generate_holding
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, nargs='+', default=[10, 50, 200], help='concurrent streams')
+    parser.add_argument('--modes', nargs='+', choices=('wsgi', 'asgi', 'held'), default=['wsgi', 'asgi', 'held'])
+    parser.add_argument('--pool-size', type=int, default=2, help='DB_POOL_SIZE for the run (no overflow)')
+    parser.add_argument('--pool-timeout', type=float, default=5, help='DB_POOL_TIMEOUT for the run')
+    parser.add_argument('--ttft-ms', type=float, default=500, help='fake time to first token')
+    parser.add_argument('--tokens-per-sec', type=float, default=50, help='fake generation speed')
+    parser.add_argument('--response-tokens', type=int, default=100, help='tokens per response')
+    parser.add_argument('--check', action='store_true', help='exit non-zero if wsgi/asgi streams hold connections')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    # Engine options are read when the app is built
+    os.environ['DB_POOL_SIZE'] = str(args.pool_size)
+    os.environ['DB_MAX_OVERFLOW'] = '0'
+    os.environ['DB_POOL_TIMEOUT'] = str(args.pool_timeout)
+    app, db = harness.configure()
+    import routes
+    from asgi import application
+
+    provider = harness.install_fake_provider(ttft=args.ttft_ms / 1000, tokens_per_sec=args.tokens_per_sec,
+                                             response_tokens=args.response_tokens)
+    cookie = harness.session_cookie(harness.login_client(app, harness.create_user(app, db)))
+    with app.app_context():
+        engine = db.engine
+    generate = routes.generate_chat_response_streaming
+
+    results, problems = [], []
+    for mode in args.modes:
+        for streams in args.streams:
+            routes.generate_chat_response_streaming = (
+                hold_connection(generate, engine) if mode == 'held' else generate)
+            started = time.perf_counter()
+            with PoolSampler(engine.pool, provider, streams) as sampler:
+                failed = (run_asgi(application, cookie, streams) if mode == 'asgi'
+                          else run_wsgi(app, cookie, streams))
+            wall = time.perf_counter() - started
+            # Background persistence can outlive the response; let it settle
+            while engine.pool.checkedout():
+                time.sleep(0.01)
+            results.append({
+                'name': f'{mode}_{streams}',
+                'streams': streams,
+                'pool_size': args.pool_size,
+                'wall_seconds': round(wall, 3),
+                'peak_checked_out': sampler.peak,
+                'peak_checked_out_while_all_generating': sampler.peak_while_generating,
+                'failed_streams': failed,
+            })
+            if mode != 'held' and (failed or sampler.peak_while_generating):
+                problems.append(f'{mode}_{streams}: {failed} failed, '
+                                f'{sampler.peak_while_generating} connections held while generating')
+    routes.generate_chat_response_streaming = generate
+
+    harness.write_results({
+        'suite': 'stream_connections',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }, args.output)
+    if args.check and problems:
+        print('\n'.join(problems), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""load_user cache: /api/get_chat requests/sec and queries per request, with and without it.
+
+Fetches a small chat repeatedly through the test client, first with the user
+cache off (``USER_CACHE_TTL_SECONDS=0``) and then with it on. For each run it
+reports latency, requests/sec and the number of SQL statements each request
+executed, counted with a SQLAlchemy ``before_cursor_execute`` listener. The
+difference is the ``SELECT`` on ``user`` that resolved ``current_user``. It
+matters most when the database is across a network, which is what
+``--database-url`` is for.
+
+    python benchmarks/user_cache.py --iterations 2000
+    python benchmarks/user_cache.py --database-url postgresql://localhost/sarkar_bench
+"""
+import argparse
+
+import harness
+
+
+def run(name, app, db, client, chat_id, iterations):
+    from sqlalchemy import event
+
+    statements = 0
+
+    def count(*_args):
+        nonlocal statements
+        statements += 1
+
+    def call():
+        response = client.get(f'/api/get_chat/{chat_id}')
+        assert response.status_code == 200, response.status_code
+
+    call()  # warm the cache and the connection pool
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        latencies, wall = harness.timed(call, iterations)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return harness.summarize(name, latencies, wall, queries_per_request=round(statements / iterations, 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temp SQLite)')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=20, help='messages in the fetched chat')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    app, db = harness.configure(args.database_url)
+    import metrics
+    import user_cache
+
+    user_id = harness.create_user(app, db, 'cached_reader')
+    chat_id = harness.seed_chat(app, db, user_id, args.messages)
+    client = harness.login_client(app, user_id)
+
+    ttl = user_cache.TTL_SECONDS
+    user_cache.TTL_SECONDS = 0
+    results = [run('get_chat.user_cache_off', app, db, client, chat_id, args.iterations)]
+    user_cache.TTL_SECONDS = ttl or 30
+    results.append(run('get_chat.user_cache_on', app, db, client, chat_id, args.iterations))
+
+    lookups = metrics.REGISTRY['user_cache_requests_total']
+    harness.write_results({
+        'suite': 'user_cache',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'cache': {'hits': lookups.value(result='hit'), 'misses': lookups.value(result='miss')},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Write batching: messages/sec persisted by concurrent chat turns, committed one by one or grouped.
+
+``--writers`` threads stand in for concurrent streams. Each appends
+``--writes`` messages to its own chat through ``message_writer``, alternating
+user messages and AI messages that also bump ``chat.updated_at``:
+
+- unbatched: ``WRITE_BATCHING=0``. Every write commits in its own thread, as
+  the routes did before.
+- batched_<n>ms: the writer thread, with ``WRITE_BATCH_MAX_DELAY_MS=n``.
+
+It reports messages persisted per second, the latency of each write until its
+commit (p50/p99), commits per message, and writes that failed (SQLite's
+"database is locked" when too many threads commit at once).
+
+    python benchmarks/write_batching.py --writers 64 --writes 50
+"""
+import argparse
+import threading
+import time
+
+import harness
+
+
+def run(app, db, chat_ids, writes):
+    import message_writer
+
+    latencies = [[] for _ in chat_ids]
+    failures = [0]
+    barrier = threading.Barrier(len(chat_ids))
+
+    def writer(slot, chat_id):
+        barrier.wait()
+        with app.app_context():
+            for i in range(writes):
+                started = time.perf_counter()
+                try:
+                    message_writer.append_message(chat_id, f'message {i} ' * 20, is_user=i % 2 == 0,
+                                                  touch_chat=i % 2 == 1)
+                    latencies[slot].append(time.perf_counter() - started)
+                except Exception:
+                    db.session.rollback()
+                    failures[0] += 1
+
+    threads = [threading.Thread(target=writer, args=(slot, chat_id)) for slot, chat_id in enumerate(chat_ids)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [seconds for per_thread in latencies for seconds in per_thread], time.perf_counter() - started, failures[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temp SQLite)')
+    parser.add_argument('--writers', type=int, default=64, help='concurrent writing threads')
+    parser.add_argument('--writes', type=int, default=50, help='messages per thread')
+    parser.add_argument('--delays-ms', type=float, nargs='+', default=[0, 2, 5])
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    app, db = harness.configure(args.database_url)
+    import message_writer
+    from sqlalchemy import event
+
+    commits = [0]
+    with app.app_context():
+        event.listen(db.engine, 'commit', lambda conn: commits.__setitem__(0, commits[0] + 1))
+
+    user_id = harness.create_user(app, db)
+    variants = [('unbatched', None)] + [(f'batched_{delay:g}ms', delay) for delay in args.delays_ms]
+    results = []
+    for name, delay in variants:
+        chat_ids = [harness.seed_chat(app, db, user_id, 0) for _ in range(args.writers)]
+        message_writer.ENABLED = delay is not None
+        if delay is not None:
+            message_writer._writer = message_writer.MessageWriter(app, max_delay=delay / 1000)
+        commits[0] = 0
+        latencies, wall, failures = run(app, db, chat_ids, args.writes)
+        results.append(harness.summarize(
+            name, latencies, wall,
+            messages_per_sec=round(len(latencies) / wall, 1),
+            commits_per_message=round(commits[0] / max(len(latencies), 1), 3),
+            failed_writes=failures,
+        ))
+
+    harness.write_results({
+        'suite': 'write_batching',
+        'backend': harness.backend_name(app, db),
+        **harness.metadata(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Token-budgeted chat context with a rolling summary of older turns.
+
+A prompt carries the newest messages that fit in ``CHAT_HISTORY_TOKEN_BUDGET``.
+They are fetched newest-first with ``ORDER BY id DESC LIMIT n`` over the
+``(chat_id, id)`` index, so building a prompt costs the same however long the
+conversation is. Short turns pack in many messages, and a few long code
+answers cannot push the prompt past the budget.
+
+Turns that no longer fit are folded into ``Chat.summary`` by the
+``summarize_chat`` job, off the request path. The summary covers every message
+up to ``Chat.summary_through_id``. The prompt is the summary followed by the
+verbatim messages after it, and each refresh only reads the messages added
+since the last one. A refresh folds enough turns that the rest fill
+``CHAT_SUMMARY_KEEP_RATIO`` of the budget, so the model is asked to summarize
+once every few turns rather than on every one.
+
+    CHAT_HISTORY_TOKEN_BUDGET=8000   tokens for summary plus messages; 0 disables the budget
+    CHAT_HISTORY_MESSAGES=50         most messages sent verbatim
+    CHAT_SUMMARY_ENABLED=1           0 drops turns that do not fit instead of summarizing them
+    CHAT_SUMMARY_MAX_TOKENS=800      cap on the summary itself
+    CHAT_SUMMARY_KEEP_RATIO=0.5      share of the budget left to verbatim turns after a refresh
+"""
+import logging
+import os
+import threading
+
+import jobs
+from app import db
+from gemini_chat import generate_summary
+from models import Chat, Message
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on messages sent as context
+HISTORY_MAX_MESSAGES = int(os.environ.get('CHAT_HISTORY_MESSAGES', '50'))
+# Approximate token budget for the summary and those messages; 0 disables the budget
+HISTORY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', '8000'))
+SUMMARY_ENABLED = os.environ.get('CHAT_SUMMARY_ENABLED', '1') == '1'
+SUMMARY_MAX_TOKENS = int(os.environ.get('CHAT_SUMMARY_MAX_TOKENS', '800'))
+SUMMARY_KEEP_RATIO = float(os.environ.get('CHAT_SUMMARY_KEEP_RATIO', '0.5'))
+# Transcript tokens handed to the model per summarization call
+SUMMARY_INPUT_TOKENS = 6000
+SUMMARY_BATCH_ROWS = 200
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text or '') // 4 + 1
+
+
+def _pack(chat_id, after_id=None, before_id=None, max_messages=None, token_budget=None):
+    """Newest rows with ``after_id < id < before_id`` that fit, oldest first, and whether any were left out."""
+    max_messages = HISTORY_MAX_MESSAGES if max_messages is None else max_messages
+    token_budget = HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    if max_messages <= 0:
+        return [], False
+
+    query = (
+        db.select(Message.id, Message.content, Message.is_user)
+        .where(Message.chat_id == chat_id)
+        .order_by(Message.id.desc())
+        .limit(max_messages + 1)
+    )
+    if after_id is not None:
+        query = query.where(Message.id > after_id)
+    if before_id is not None:
+        query = query.where(Message.id < before_id)
+
+    rows = []
+    used = 0
+    for row in db.session.execute(query):
+        cost = estimate_tokens(row.content)
+        if len(rows) == max_messages or (token_budget and rows and used + cost > token_budget):
+            rows.reverse()
+            return rows, True
+        used += cost
+        rows.append(row)
+    rows.reverse()
+    return rows, False
+
+
+def _as_history(rows):
+    return [{'content': row.content, 'is_user': row.is_user} for row in rows]
+
+
+def load_context(chat, before_id=None):
+    """History for the next prompt in ``chat``: its summary, then the newest messages after it.
+
+    Returns ``(history, needs_summary)``. ``needs_summary`` is True when
+    messages the summary does not cover were left out. Call
+    ``schedule_summary`` once the request has committed.
+    """
+    summary = chat.summary if SUMMARY_ENABLED else None
+    through = chat.summary_through_id if summary else None
+    # A retry from before the point the summary reaches; it would describe the future
+    stale = through is not None and before_id is not None and through >= before_id
+    if stale:
+        summary = through = None
+    budget = HISTORY_TOKEN_BUDGET
+    if summary and budget:
+        budget = max(budget - estimate_tokens(summary), 1)
+
+    rows, truncated = _pack(chat.id, after_id=through, before_id=before_id, token_budget=budget)
+    history = _as_history(rows)
+    if summary:
+        history.insert(0, {'content': summary, 'is_user': False, 'is_summary': True})
+    return history, truncated and SUMMARY_ENABLED and not stale
+
+
+def schedule_summary(chat_id):
+    """Queue a summary refresh for ``chat_id`` unless one is already waiting."""
+    with _pending_lock:
+        if chat_id in _pending:
+            return
+        _pending.add(chat_id)
+    try:
+        jobs.enqueue('summarize_chat', chat_id=chat_id)
+    except jobs.QueueFull:
+        logger.warning(f"Job queue full, chat {chat_id} keeps its old summary for now")
+        with _pending_lock:
+            _pending.discard(chat_id)
+
+
+def _transcript(rows):
+    limit = SUMMARY_INPUT_TOKENS * 4
+    lines = []
+    for row in rows:
+        speaker = 'User' if row.is_user else 'Assistant'
+        content = row.content if len(row.content) <= limit else row.content[:limit] + ' [...]'
+        lines.append(f"{speaker}: {content}")
+    return '\n\n'.join(lines)
+
+
+def _fold(chat_id, summary, through, upto_id):
+    """Summarize messages with ``through < id < upto_id`` in bounded batches. Returns messages folded."""
+    folded = 0
+    while True:
+        query = (
+            db.select(Message.id, Message.content, Message.is_user)
+            .where(Message.chat_id == chat_id, Message.id < upto_id)
+            .order_by(Message.id)
+            .limit(SUMMARY_BATCH_ROWS)
+        )
+        if through is not None:
+            query = query.where(Message.id > through)
+        batch = []
+        used = 0
+        for row in db.session.execute(query):
+            cost = min(estimate_tokens(row.content), SUMMARY_INPUT_TOKENS)
+            if batch and used + cost > SUMMARY_INPUT_TOKENS:
+                break
+            used += cost
+            batch.append(row)
+        if not batch:
+            return folded
+        db.session.rollback()  # don't hold a read transaction open across the model call
+
+        new_summary = generate_summary(summary, _transcript(batch), max_words=SUMMARY_MAX_TOKENS * 3 // 4)
+        new_summary = new_summary[:SUMMARY_MAX_TOKENS * 4]
+        last_id = batch[-1].id
+        matches_old = Chat.summary_through_id.is_(None) if through is None else Chat.summary_through_id == through
+        result = db.session.execute(
+            db.update(Chat)
+            .where(Chat.id == chat_id, matches_old)
+            # A summary is not activity; keep the chat's place in the sidebar
+            .values(summary=new_summary, summary_through_id=last_id, updated_at=Chat.updated_at)
+        )
+        db.session.commit()
+        if result.rowcount == 0:
+            # Another refresh or a retry truncation got there first
+            return folded
+        summary, through = new_summary, last_id
+        folded += len(batch)
+
+
+@jobs.job('summarize_chat')
+def summarize_chat(chat_id: int):
+    """Fold the turns that no longer fit the prompt into the chat's summary. Runs on the job queue."""
+    try:
+        chat = db.session.get(Chat, chat_id)
+        if not chat:
+            return None
+        # Keep the newest turns verbatim within KEEP_RATIO of the budget and fold everything older
+        keep_budget = int(max(HISTORY_TOKEN_BUDGET - SUMMARY_MAX_TOKENS, 1) * SUMMARY_KEEP_RATIO)
+        kept, truncated = _pack(chat_id, after_id=chat.summary_through_id,
+                                max_messages=max(HISTORY_MAX_MESSAGES // 2, 1),
+                                token_budget=keep_budget if HISTORY_TOKEN_BUDGET else 0)
+        if not truncated:
+            return {'folded': 0}
+        folded = _fold(chat_id, chat.summary, chat.summary_through_id, kept[0].id)
+        logger.info(f"Folded {folded} messages into the summary of chat {chat_id}")
+        return {'folded': folded}
+    finally:
+        with _pending_lock:
+            _pending.discard(chat_id)
@@ -0,0 +1,128 @@
+"""Set-based deletion of chats and their messages.
+
+Deleting through the ORM loaded every chat, and through the ``delete-orphan``
+cascade every one of its messages, only to delete them row by row. Here
+deleting chats takes two statements, ``DELETE FROM message WHERE chat_id IN
+(...)`` then ``DELETE FROM chat ...``, and loads nothing into the session. The
+message delete is spelled out rather than left to ``ON DELETE CASCADE`` because
+SQLite only enforces foreign keys when asked to, and databases created before
+migration 4 have no cascade.
+
+Deletes of more than ``CHAT_PURGE_INLINE_MAX_MESSAGES`` messages go to the
+``purge_chats`` job instead. Their chats are hidden at once by setting
+``Chat.deleted_at``. The job then deletes their messages
+``CHAT_PURGE_BATCH_MESSAGES`` at a time, each batch in its own short
+transaction, so no statement holds locks or piles up WAL for minutes.
+
+A hidden chat must not outlive a lost job: the default queue is in memory, and
+a restart, a full queue or a job out of attempts would drop it. Every delete
+therefore also takes the user's hidden chats along. The ``sweep_hidden_chats``
+job purges what is left for every user, when the queue starts and every
+``CHAT_PURGE_SWEEP_SECONDS`` after.
+
+    CHAT_PURGE_INLINE_MAX_MESSAGES=20000
+    CHAT_PURGE_BATCH_MESSAGES=5000
+    CHAT_PURGE_SWEEP_SECONDS=3600
+"""
+import logging
+import os
+from datetime import datetime
+
+import jobs
+import metrics
+from app import db
+from models import Chat, Message
+
+logger = logging.getLogger(__name__)
+
+INLINE_MAX_MESSAGES = int(os.environ.get('CHAT_PURGE_INLINE_MAX_MESSAGES', '20000'))
+BATCH_MESSAGES = int(os.environ.get('CHAT_PURGE_BATCH_MESSAGES', '5000'))
+SWEEP_SECONDS = float(os.environ.get('CHAT_PURGE_SWEEP_SECONDS', '3600'))
+
+PURGED_MESSAGES = metrics.counter('chat_purge_messages_total', 'Messages deleted with their chats, by mode')
+
+# Bulk statements; nothing in the session needs to be kept in sync with them
+_BULK = {'synchronize_session': False}
+
+
+def _doomed_chats(user_id, chat_ids=None):
+    """The user's chats to delete (all, or those in ``chat_ids``) plus any already hidden."""
+    query = db.select(Chat.id).where(Chat.user_id == user_id)
+    if chat_ids is not None:
+        query = query.where(db.or_(Chat.id.in_(chat_ids), Chat.deleted_at.isnot(None)))
+    return query
+
+
+def exceeds_inline_limit(user_id, chat_ids=None):
+    """Whether deleting these chats would take on more messages than an inline delete should."""
+    capped = (
+        db.select(Message.id)
+        .where(Message.chat_id.in_(_doomed_chats(user_id, chat_ids)))
+        .limit(INLINE_MAX_MESSAGES + 1)
+        .subquery()
+    )
+    return db.session.scalar(db.select(db.func.count()).select_from(capped)) > INLINE_MAX_MESSAGES
+
+
+def delete_chats(user_id, chat_ids=None):
+    """Delete the user's chats (all, or those in ``chat_ids``) and their messages. The caller commits.
+
+    Chats hidden earlier, whose purge may have been lost, are deleted too.
+    Returns the number of chats deleted.
+    """
+    chats = _doomed_chats(user_id, chat_ids)
+    messages = db.session.execute(db.delete(Message).where(Message.chat_id.in_(chats)).execution_options(**_BULK))
+    PURGED_MESSAGES.inc(messages.rowcount, mode='inline')
+    deleted = db.session.execute(db.delete(Chat).where(Chat.id.in_(chats)).execution_options(**_BULK))
+    return deleted.rowcount
+
+
+def hide_chats(user_id, chat_ids=None):
+    """Mark the user's chats (all, or those in ``chat_ids``) for the background purge.
+
+    The caller commits, then enqueues ``purge_chats``.
+    """
+    query = db.update(Chat).where(Chat.user_id == user_id, Chat.deleted_at.is_(None))
+    if chat_ids is not None:
+        query = query.where(Chat.id.in_(chat_ids))
+    result = db.session.execute(
+        query
+        # updated_at would otherwise be bumped by its onupdate
+        .values(deleted_at=datetime.utcnow(), updated_at=Chat.updated_at)
+        .execution_options(**_BULK)
+    )
+    return result.rowcount
+
+
+@jobs.job('purge_chats')
+def purge_chats(user_id: int):
+    """Delete the user's hidden chats in batches of messages. Runs on the job queue; safe to rerun."""
+    hidden = db.select(Chat.id).where(Chat.user_id == user_id, Chat.deleted_at.isnot(None))
+    purged = 0
+    while True:
+        batch = db.select(Message.id).where(Message.chat_id.in_(hidden)).limit(BATCH_MESSAGES)
+        result = db.session.execute(db.delete(Message).where(Message.id.in_(batch)).execution_options(**_BULK))
+        db.session.commit()
+        purged += result.rowcount
+        PURGED_MESSAGES.inc(result.rowcount, mode='background')
+        if result.rowcount < BATCH_MESSAGES:
+            break
+    # Anything written to a hidden chat since the last batch goes with it
+    db.session.execute(db.delete(Message).where(Message.chat_id.in_(hidden)).execution_options(**_BULK))
+    chats = db.session.execute(
+        db.delete(Chat).where(Chat.user_id == user_id, Chat.deleted_at.isnot(None)).execution_options(**_BULK))
+    db.session.commit()
+    logger.info(f"Purged {chats.rowcount} chats and {purged} messages for user {user_id}")
+    return {'chats': chats.rowcount, 'messages': purged}
+
+
+@jobs.job('sweep_hidden_chats')
+def sweep_hidden_chats():
+    """Purge hidden chats of every user, for purge jobs that were lost or gave up."""
+    user_ids = db.session.scalars(db.select(Chat.user_id).where(Chat.deleted_at.isnot(None)).distinct()).all()
+    for user_id in user_ids:
+        purge_chats(user_id)
+    return {'users': len(user_ids)}
+
+
+jobs.periodic('sweep_hidden_chats', SWEEP_SECONDS)
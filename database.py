@@ -0,0 +1,99 @@
+"""Engine setup: pool sizing, SQLite pragmas and the optional read replica.
+
+Pool sizes are per process, so size them to the worker model. A sync worker
+with threads needs about one connection per thread. Under ASGI, streams hold no
+connection while the model generates, so a few are enough. ``pool_pre_ping``
+costs a round trip on every checkout; it is on by default for networked
+databases, where it catches connections dropped by a server restart or a
+proxy, and off for SQLite, where there is nothing to drop.
+
+SQLite connections get pragmas for a single-node deployment. WAL lets readers
+run alongside the writer. ``synchronous=NORMAL`` still survives a crash of the
+process; it only risks losing the last commits on power loss. ``busy_timeout``
+makes a writer wait for the lock instead of failing with "database is locked".
+
+With ``DATABASE_REPLICA_URL`` set, the sidebar (/chat and /api/chats) and
+/api/search query the replica through ``read_session()``. A replica can lag the
+primary, so those may show data a few moments old: a chat just created or
+renamed, or a message just sent, can be missing. Reads that must see the
+user's own latest writes stay on the primary. That includes get_chat, which
+the client calls right after send_message.
+
+    DB_POOL_SIZE=5              connections kept open per process
+    DB_MAX_OVERFLOW=10          extra connections allowed during bursts
+    DB_POOL_TIMEOUT=30          seconds to wait for a free connection
+    DB_POOL_RECYCLE=300         seconds before a connection is replaced
+    DB_POOL_PRE_PING            1 or 0; default 1, or 0 on SQLite
+    SQLITE_JOURNAL_MODE=WAL
+    SQLITE_SYNCHRONOUS=NORMAL
+    SQLITE_BUSY_TIMEOUT_MS=5000
+    SQLITE_CACHE_SIZE_KB=20000  page cache per connection
+    DATABASE_REPLICA_URL        read replica for read-only routes
+"""
+import os
+import sqlite3
+
+from flask import current_app, g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app import db
+
+REPLICA_BIND = 'replica'
+
+
+def engine_options(url):
+    """SQLAlchemy engine options for ``url`` from the DB_POOL_* settings."""
+    sqlite = url.startswith('sqlite')
+    options = {
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '300')),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '0' if sqlite else '1') == '1',
+    }
+    # In-memory SQLite uses a single-connection pool that takes no sizes
+    if not (sqlite and (':memory:' in url or url.rstrip('/') == 'sqlite:')):
+        options.update(
+            pool_size=int(os.environ.get('DB_POOL_SIZE', '5')),
+            max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+            pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        )
+    return options
+
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+    cursor.execute(f"PRAGMA synchronous={os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    cursor.execute(f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))}")
+    cursor.execute(f"PRAGMA cache_size=-{int(os.environ.get('SQLITE_CACHE_SIZE_KB', '20000'))}")
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
+
+def configure(app):
+    """Set the database URL, engine options and replica bind on ``app`` (before db.init_app)."""
+    url = os.environ.get('DATABASE_URL', 'sqlite:///sarkar_ai.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: {'url': replica_url, **engine_options(replica_url)}}
+    app.teardown_appcontext(_close_read_session)
+
+
+def read_session():
+    """Session for read-only queries: on the replica when one is configured, else ``db.session``."""
+    if REPLICA_BIND not in current_app.config.get('SQLALCHEMY_BINDS', {}):
+        return db.session
+    if 'read_session' not in g:
+        g.read_session = Session(db.engines[REPLICA_BIND])
+    return g.read_session
+
+
+def _close_read_session(exc):
+    session = g.pop('read_session', None)
+    if session is not None:
+        session.close()
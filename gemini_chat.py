@@ -1,25 +1,26 @@
+import asyncio
 import logging
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
+import threading
+import time
+from llm_providers import FakeProvider
+import metrics
+import response_cache
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize LangChain with Gemini for streaming
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=os.environ.get("GEMINI_API_KEY"),
-    temperature=0.7,
-    streaming=True
-)
+LLM_TTFT = metrics.histogram(
+    'llm_time_to_first_token_seconds', 'Time from calling the provider to its first chunk',
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 30))
+LLM_TOKENS_PER_SEC = metrics.histogram(
+    'llm_output_tokens_per_second', 'Estimated output tokens per second after the first chunk',
+    buckets=(5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000))
+LLM_OUTPUT_TOKENS = metrics.counter('llm_output_tokens_total', 'Estimated output tokens streamed')
+LLM_RESPONSES = metrics.counter('llm_responses_total', 'Streamed provider responses by outcome')
+LLM_ACTIVE = metrics.gauge('llm_active_generations', 'Provider responses being streamed right now')
 
-# Create prompt template with rich formatting instructions
-prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are SARKAR AI, a helpful and intelligent assistant. 
+# System prompt with rich formatting instructions
+SYSTEM_PROMPT = """You are SARKAR AI, a helpful and intelligent assistant. 
 
 IMPORTANT FORMATTING GUIDELINES:
 - Always use proper markdown formatting in your responses
@@ -35,64 +36,300 @@ IMPORTANT FORMATTING GUIDELINES:
 - For mathematical expressions, use appropriate formatting
 - Use strikethrough (~~text~~) for corrections or outdated information
 
-Provide clear, well-structured, and richly formatted responses that are easy to read and understand."""),
-    ("placeholder", "{chat_history}"),
-    ("human", "{input}")
-])
+Provide clear, well-structured, and richly formatted responses that are easy to read and understand."""
 
-# Create the chain with streaming
-chain = prompt | llm | StrOutputParser()
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and SARKAR AI.
 
+Current summary:
+{summary}
 
-def generate_chat_response_streaming(message: str, chat_history=None):
-    """Generate streaming response using LangChain with Gemini"""
+New messages:
+{transcript}
+
+Rewrite the summary so it also covers the new messages. Keep facts, decisions, names, code identifiers and open questions the assistant may need later. Write plain prose of at most {max_words} words."""
+
+
+def _build_history(chat_history=None):
+    """Convert stored message dicts into LangChain messages.
+
+    Callers pass history already bounded by chat_history.load_context. The
+    conversation summary entry, if any, goes into the system prompt instead.
+    """
+    from langchain_core.messages import HumanMessage, AIMessage
+
+    history = []
+    if chat_history:
+        logger.debug(f"Loading {len(chat_history)} messages from history")
+        for msg in chat_history:
+            if msg.get('is_summary'):
+                continue
+            if msg.get('is_user'):
+                history.append(HumanMessage(content=msg.get('content', '')))
+            else:
+                history.append(AIMessage(content=msg.get('content', '')))
+    return history
+
+
+def _summary_instructions(chat_history=None):
+    for msg in chat_history or ():
+        if msg.get('is_summary'):
+            return f"\n\nSummary of the earlier part of this conversation:\n{msg['content']}"
+    return ""
+
+
+class GeminiProvider:
+    """Gemini via LangChain. The client is built lazily on first use."""
+
+    name = 'gemini'
+
+    def __init__(self):
+        self._llm = None
+        self._chain = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    # LangChain and the Gemini SDK take about a second to import,
+                    # so they are imported here rather than when the app starts
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+
+                    # Initialize LangChain with Gemini for streaming
+                    self._llm = ChatGoogleGenerativeAI(
+                        model="gemini-2.0-flash",
+                        google_api_key=os.environ.get("GEMINI_API_KEY"),
+                        temperature=0.7,
+                        streaming=True
+                    )
+        return self._llm
+
+    @property
+    def chain(self):
+        if self._chain is None:
+            from langchain_core.output_parsers import StrOutputParser
+            from langchain_core.prompts import ChatPromptTemplate
+
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", SYSTEM_PROMPT + "{summary}"),
+                ("placeholder", "{chat_history}"),
+                ("human", "{input}")
+            ])
+            # Create the chain with streaming
+            self._chain = prompt | self.llm | StrOutputParser()
+        return self._chain
+
+    def _inputs(self, message, chat_history):
+        return {
+            "input": message,
+            "chat_history": _build_history(chat_history),
+            "summary": _summary_instructions(chat_history),
+        }
+
+    def stream(self, message, chat_history=None):
+        yield from self.chain.stream(self._inputs(message, chat_history))
+
+    async def astream(self, message, chat_history=None):
+        async for chunk in self.chain.astream(self._inputs(message, chat_history)):
+            yield chunk
+
+    def invoke(self, message, chat_history=None):
+        return self.chain.invoke(self._inputs(message, chat_history))
+
+    def title(self, first_message):
+        from langchain_core.messages import HumanMessage
+
+        title_prompt = f"Generate a short, descriptive title (max 5 words) for a conversation that starts with: '{first_message[:100]}'"
+        response = self.llm.invoke([HumanMessage(content=title_prompt)])
+        return response.content
+
+    def summarize(self, prompt):
+        from langchain_core.messages import HumanMessage
+
+        return self.llm.invoke([HumanMessage(content=prompt)]).content
+
+
+PROVIDERS = {
+    'gemini': GeminiProvider,
+    'fake': FakeProvider.from_env,
+}
+
+_provider = None
+
+
+def get_provider():
+    """Return the active provider, chosen by LLM_PROVIDER (default: gemini)."""
+    global _provider
+    if _provider is None:
+        name = os.environ.get('LLM_PROVIDER', 'gemini').lower()
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown LLM_PROVIDER '{name}'; expected one of {sorted(PROVIDERS)}")
+        _provider = PROVIDERS[name]()
+        logger.info(f"Using LLM provider: {name}")
+    return _provider
+
+
+def set_provider(provider):
+    """Swap the active provider, e.g. for a FakeProvider in benchmarks."""
+    global _provider
+    _provider = provider
+
+
+_cache = None
+_cache_loaded = False
+
+
+def get_response_cache():
+    """Return the response cache configured by the environment, or None."""
+    global _cache, _cache_loaded
+    if not _cache_loaded:
+        _cache = response_cache.from_env()
+        _cache_loaded = True
+    return _cache
+
+
+def set_response_cache(cache):
+    """Swap the response cache; None disables caching."""
+    global _cache, _cache_loaded
+    _cache = cache
+    _cache_loaded = True
+
+
+def _cache_lookup(message, chat_history, use_cache, refresh_cache=False):
+    """Return ``(cache, key, entry)``; cache is None when caching does not apply.
+
+    With ``refresh_cache`` (a retry) the entry is always None, so a fresh answer
+    is generated and then stored over the old one.
+    """
+    cache = get_response_cache() if use_cache else None
+    if cache is None:
+        return None, None, None
+    key = response_cache.make_key(get_provider().name, SYSTEM_PROMPT, chat_history, message)
+    return cache, key, None if refresh_cache else cache.get(key)
+
+
+class _GenerationStats:
+    """Time to first token and output rate of one provider stream."""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.started = time.perf_counter()
+        self.first_chunk_at = None
+        self.chunks = 0
+        self.chars = 0
+        LLM_ACTIVE.inc(provider=provider)
+
+    def chunk(self, text):
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+            LLM_TTFT.observe(self.first_chunk_at - self.started, provider=self.provider)
+        self.chunks += 1
+        self.chars += len(text)
+
+    def finish(self, outcome):
+        LLM_ACTIVE.dec(provider=self.provider)
+        LLM_RESPONSES.inc(provider=self.provider, outcome=outcome)
+        # Same ~4 characters per token estimate as chat_history
+        tokens = self.chars // 4
+        LLM_OUTPUT_TOKENS.inc(tokens, provider=self.provider)
+        elapsed = time.perf_counter() - self.first_chunk_at if self.first_chunk_at else 0
+        if self.chunks > 1 and elapsed > 0:
+            LLM_TOKENS_PER_SEC.observe(tokens / elapsed, provider=self.provider)
+
+
+def generate_chat_response_streaming(message: str, chat_history=None, use_cache=True, refresh_cache=False):
+    """Generate streaming response from the active provider (Gemini by default)"""
     try:
-        logger.info(f"Starting streaming response for message: {message[:50]}...")
+        logger.debug(f"Starting streaming response for message: {message[:50]}...")
         
-        # Prepare chat history
-        history = []
-        if chat_history:
-            logger.info(f"Loading {len(chat_history)} messages from history")
-            for msg in chat_history[-10:]:  # Last 10 messages for context
-                if msg.get('is_user'):
-                    history.append(HumanMessage(content=msg.get('content', '')))
-                else:
-                    history.append(AIMessage(content=msg.get('content', '')))
+        cache, key, cached = _cache_lookup(message, chat_history, use_cache, refresh_cache)
+        if cached:
+            logger.debug("Replaying cached response")
+            yield from response_cache.replay(cached['text'])
+            return
         
         # Stream response synchronously
-        chunk_count = 0
-        for chunk in chain.stream({
-            "input": message,
-            "chat_history": history
-        }):
-            if chunk:
-                chunk_count += 1
-                yield chunk
+        started = time.perf_counter()
+        chunks = []
+        provider = get_provider()
+        stats = _GenerationStats(provider.name)
+        outcome = 'error'
+        try:
+            for chunk in provider.stream(message, chat_history):
+                if chunk:
+                    stats.chunk(chunk)
+                    chunks.append(chunk)
+                    yield chunk
+            outcome = 'ok'
+        except GeneratorExit:
+            outcome = 'cancelled'
+            raise
+        finally:
+            stats.finish(outcome)
         
-        logger.info(f"Streamed {chunk_count} chunks successfully")
+        logger.debug(f"Streamed {len(chunks)} chunks successfully")
+        if cache:
+            cache.set(key, ''.join(chunks), time.perf_counter() - started)
                 
     except Exception as e:
         logger.error(f"Gemini streaming error: {e}", exc_info=True)
         yield "I'm experiencing technical difficulties right now. Please try again in a moment."
 
 
-def generate_chat_response(message: str, chat_history=None) -> str:
+async def agenerate_chat_response_streaming(message: str, chat_history=None, use_cache=True,
+                                            refresh_cache=False):
+    """Async variant of generate_chat_response_streaming backed by provider.astream"""
+    try:
+        logger.debug(f"Starting async streaming response for message: {message[:50]}...")
+        
+        cache, key, cached = _cache_lookup(message, chat_history, use_cache, refresh_cache)
+        if cached:
+            logger.debug("Replaying cached response")
+            async for chunk in response_cache.areplay(cached['text']):
+                yield chunk
+            return
+        
+        # Stream response without blocking the event loop
+        started = time.perf_counter()
+        chunks = []
+        provider = get_provider()
+        stats = _GenerationStats(provider.name)
+        outcome = 'error'
+        try:
+            async for chunk in provider.astream(message, chat_history):
+                if chunk:
+                    stats.chunk(chunk)
+                    chunks.append(chunk)
+                    yield chunk
+            outcome = 'ok'
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = 'cancelled'
+            raise
+        finally:
+            stats.finish(outcome)
+        
+        logger.debug(f"Streamed {len(chunks)} chunks successfully")
+        if cache:
+            cache.set(key, ''.join(chunks), time.perf_counter() - started)
+                
+    except Exception as e:
+        logger.error(f"Gemini async streaming error: {e}", exc_info=True)
+        yield "I'm experiencing technical difficulties right now. Please try again in a moment."
+
+
+def generate_chat_response(message: str, chat_history=None, use_cache=True) -> str:
     """Synchronous wrapper for backward compatibility (non-streaming)"""
     try:
-        # Prepare chat history
-        history = []
-        if chat_history:
-            for msg in chat_history[-10:]:
-                if msg.get('is_user'):
-                    history.append(HumanMessage(content=msg.get('content', '')))
-                else:
-                    history.append(AIMessage(content=msg.get('content', '')))
+        cache, key, cached = _cache_lookup(message, chat_history, use_cache)
+        if cached:
+            return cached['text']
         
         # Get response
-        response = chain.invoke({
-            "input": message,
-            "chat_history": history
-        })
+        started = time.perf_counter()
+        response = get_provider().invoke(message, chat_history)
+        if cache and response:
+            cache.set(key, response, time.perf_counter() - started)
         
         return response if response else "I apologize, but I'm unable to generate a response at the moment. Please try again."
         
@@ -101,12 +338,17 @@ def generate_chat_response(message: str, chat_history=None) -> str:
         return "I'm experiencing technical difficulties right now. Please try again in a moment."
 
 
+def generate_summary(previous_summary, transcript, max_words):
+    """Fold ``transcript`` into ``previous_summary``. Raises on errors so the summary job retries."""
+    prompt = SUMMARY_PROMPT.format(summary=previous_summary or '(none yet)', transcript=transcript,
+                                   max_words=max_words)
+    return get_provider().summarize(prompt).strip()
+
+
 def generate_chat_title(first_message: str) -> str:
     """Generate a short title for a chat"""
     try:
-        title_prompt = f"Generate a short, descriptive title (max 5 words) for a conversation that starts with: '{first_message[:100]}'"
-        response = llm.invoke([HumanMessage(content=title_prompt)])
-        title = response.content.strip().strip('"\'')
+        title = get_provider().title(first_message).strip().strip('"\'')
         return title[:50]
     except Exception as e:
         logger.error(f"Error generating chat title: {e}")
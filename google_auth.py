@@ -1,33 +1,41 @@
 # Use this Flask blueprint for Google authentication. Do not use flask-dance.
 
-import json
 import os
 
-import requests
+import oidc
 from app import db
 from flask import Blueprint, redirect, request, url_for, flash
 from flask_login import login_required, login_user, logout_user
 from models import User
-from oauthlib.oauth2 import WebApplicationClient
 
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_OAUTH_CLIENT_ID", "your-client-id")
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_OAUTH_CLIENT_SECRET", "your-client-secret")
-GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
 
 # Make sure to use this redirect URL. It has to match the one in the whitelist
 DEV_REDIRECT_URL = f'https://{os.environ.get("REPLIT_DEV_DOMAIN", "localhost:5000")}/google_login/callback'
 
-# ALWAYS display setup instructions to the user:
-print(f"""To make Google authentication work:
+SETUP_INSTRUCTIONS = f"""To make Google authentication work:
 1. Go to https://console.cloud.google.com/apis/credentials
 2. Create a new OAuth 2.0 Client ID
 3. Add {DEV_REDIRECT_URL} to Authorized redirect URIs
 
 For detailed instructions, see:
 https://docs.replit.com/additional-resources/google-auth-in-flask#set-up-your-oauth-app--client
-""")
+"""
 
-client = WebApplicationClient(GOOGLE_CLIENT_ID)
+_client = None
+
+
+def get_client():
+    """The OAuth client, built on the first Google sign-in rather than at startup."""
+    global _client
+    if _client is None:
+        from oauthlib.oauth2 import WebApplicationClient
+
+        # ALWAYS display setup instructions to the user:
+        print(SETUP_INSTRUCTIONS)
+        _client = WebApplicationClient(GOOGLE_CLIENT_ID)
+    return _client
 
 google_auth = Blueprint("google_auth", __name__)
 
@@ -35,10 +43,10 @@ google_auth = Blueprint("google_auth", __name__)
 @google_auth.route("/google_login")
 def login():
     try:
-        google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
+        google_provider_cfg = oidc.provider_config()
         authorization_endpoint = google_provider_cfg["authorization_endpoint"]
 
-        request_uri = client.prepare_request_uri(
+        request_uri = get_client().prepare_request_uri(
             authorization_endpoint,
             # Replacing http:// with https:// is important as the external
             # protocol must be https to match the URI whitelisted
@@ -55,10 +63,10 @@ def login():
 def callback():
     try:
         code = request.args.get("code")
-        google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
+        google_provider_cfg = oidc.provider_config()
         token_endpoint = google_provider_cfg["token_endpoint"]
 
-        token_url, headers, body = client.prepare_token_request(
+        token_url, headers, body = get_client().prepare_token_request(
             token_endpoint,
             # Replacing http:// with https:// is important as the external
             # protocol must be https to match the URI whitelisted
@@ -66,20 +74,19 @@ def callback():
             redirect_url=request.base_url.replace("http://", "https://"),
             code=code,
         )
-        token_response = requests.post(
+        token_response = oidc.request(
+            "POST",
             token_url,
             headers=headers,
             data=body,
             auth=(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET),
         )
 
-        client.parse_request_body_response(json.dumps(token_response.json()))
-
-        userinfo_endpoint = google_provider_cfg["userinfo_endpoint"]
-        uri, headers, body = client.add_token(userinfo_endpoint)
-        userinfo_response = requests.get(uri, headers=headers, data=body)
+        token = get_client().parse_request_body_response(token_response.text)
 
-        userinfo = userinfo_response.json()
+        # The id_token carries the profile claims; verifying it locally against
+        # Google's cached signing keys saves a call to the userinfo endpoint
+        userinfo = oidc.verify_id_token(token["id_token"], GOOGLE_CLIENT_ID)
         if userinfo.get("email_verified"):
             users_email = userinfo["email"]
             users_name = userinfo.get("given_name", userinfo.get("name", "User"))
@@ -0,0 +1,357 @@
+"""Small in-process background job queue.
+
+Slow side effects (LLM title generation, retried message writes) are handed
+to a pool of worker threads instead of running inside the request. Handlers
+are plain functions registered by name:
+
+    @jobs.job('retitle_chat')
+    def retitle_chat(chat_id, first_message): ...
+
+    job_id = jobs.enqueue('retitle_chat', chat_id=1, first_message='hi')
+
+Maintenance jobs that take no arguments can also run on a schedule with
+``jobs.periodic(name, seconds)``: once when the queue starts, then every
+``seconds``.
+
+Handlers run inside an app context. A handler that raises is retried with
+exponential backoff, up to ``JOB_MAX_ATTEMPTS`` attempts. ``enqueue`` raises
+``QueueFull`` once ``JOB_QUEUE_MAX_PENDING`` jobs are waiting, so callers can
+shed load instead of piling up work.
+
+With ``JOB_QUEUE_PERSIST=1`` every job is also written to the
+``background_job`` table. Jobs that were pending, or running longer than
+``JOB_LEASE_SECONDS``, are picked up again when the queue starts. Claiming is a
+conditional UPDATE, so two processes never run the same job.
+
+    JOB_QUEUE_WORKERS=4            worker threads
+    JOB_QUEUE_MAX_PENDING=1000     backpressure limit
+    JOB_MAX_ATTEMPTS=3             attempts before a job is marked failed
+    JOB_RETRY_BACKOFF_SECONDS=1    first retry delay, doubled on each retry
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = metrics.gauge('jobs_queue_depth', 'Jobs waiting to run, including scheduled retries')
+JOB_LATENCY = metrics.histogram(
+    'job_latency_seconds', 'Time from enqueue to completion',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+JOB_RUN_TIME = metrics.histogram(
+    'job_run_seconds', 'Time spent running a single attempt',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+JOBS_TOTAL = metrics.counter('jobs_total', 'Job outcomes by name and status')
+
+HANDLERS = {}
+# (name, seconds) of jobs enqueued when the queue starts and on an interval
+PERIODIC = []
+
+# Results of finished jobs kept in memory for status lookups
+_RECENT_JOBS = 1000
+
+
+class QueueFull(Exception):
+    """Raised by enqueue when the queue is at its pending limit."""
+
+
+def job(name):
+    """Register the decorated function as the handler for jobs called ``name``."""
+    def register(fn):
+        HANDLERS[name] = fn
+        return fn
+    return register
+
+
+def periodic(name, seconds):
+    """Enqueue the job ``name`` when the queue starts and every ``seconds`` after."""
+    PERIODIC.append((name, seconds))
+
+
+class Job:
+    def __init__(self, name, payload, owner_id=None, job_id=None, attempts=0):
+        self.id = job_id or uuid.uuid4().hex
+        self.name = name
+        self.payload = payload
+        self.owner_id = owner_id
+        self.attempts = attempts
+        self.status = 'pending'
+        self.result = None
+        self.error = None
+        self.enqueued_at = time.monotonic()
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'status': self.status, 'result': self.result}
+
+
+class SqlJobStore:
+    """Keeps jobs in the ``background_job`` table so they survive restarts."""
+
+    def __init__(self, lease_seconds):
+        self.lease_seconds = lease_seconds
+
+    def _execute(self, statement):
+        from app import app, db
+        with app.app_context(), db.engine.begin() as conn:
+            return conn.execute(statement)
+
+    def add(self, job):
+        from app import db
+        from models import BackgroundJob
+        self._execute(db.insert(BackgroundJob).values(
+            id=job.id, name=job.name, payload=json.dumps(job.payload), owner_id=job.owner_id,
+            status='pending', attempts=job.attempts,
+            created_at=datetime.utcnow(), updated_at=datetime.utcnow(),
+        ))
+
+    def claim(self, job):
+        """Mark ``job`` running if it is still pending; False if someone else has it."""
+        from app import db
+        from models import BackgroundJob
+        result = self._execute(
+            db.update(BackgroundJob)
+            .where(BackgroundJob.id == job.id, BackgroundJob.status == 'pending')
+            .values(status='running', attempts=BackgroundJob.attempts + 1, updated_at=datetime.utcnow())
+        )
+        return result.rowcount == 1
+
+    def update(self, job):
+        from app import db
+        from models import BackgroundJob
+        self._execute(
+            db.update(BackgroundJob).where(BackgroundJob.id == job.id).values(
+                status=job.status,
+                result=json.dumps(job.result) if job.result is not None else None,
+                last_error=job.error,
+                updated_at=datetime.utcnow(),
+            )
+        )
+
+    def recover(self):
+        """Jobs to run again after a restart: pending, or running past their lease."""
+        from app import db
+        from models import BackgroundJob
+        stale = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        self._execute(
+            db.update(BackgroundJob)
+            .where(BackgroundJob.status == 'running', BackgroundJob.updated_at < stale)
+            .values(status='pending', updated_at=datetime.utcnow())
+        )
+        rows = self._execute(
+            db.select(BackgroundJob.id, BackgroundJob.name, BackgroundJob.payload,
+                      BackgroundJob.owner_id, BackgroundJob.attempts)
+            .where(BackgroundJob.status == 'pending')
+            .order_by(BackgroundJob.created_at)
+        ).all()
+        return [Job(row.name, json.loads(row.payload), row.owner_id, row.id, row.attempts) for row in rows]
+
+    def get(self, job_id):
+        from app import db
+        from models import BackgroundJob
+        row = self._execute(
+            db.select(BackgroundJob.id, BackgroundJob.name, BackgroundJob.owner_id,
+                      BackgroundJob.status, BackgroundJob.result)
+            .where(BackgroundJob.id == job_id)
+        ).first()
+        if row is None:
+            return None
+        found = Job(row.name, None, row.owner_id, row.id)
+        found.status = row.status
+        found.result = json.loads(row.result) if row.result else None
+        return found
+
+
+class JobQueue:
+    def __init__(self, workers=4, max_pending=1000, max_attempts=3, backoff=1.0, store=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.store = store
+        self.pending = 0
+        self._queue = queue.Queue()
+        self._recent = OrderedDict()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    @classmethod
+    def from_env(cls):
+        store = None
+        if os.environ.get('JOB_QUEUE_PERSIST', '0') == '1':
+            store = SqlJobStore(float(os.environ.get('JOB_LEASE_SECONDS', '300')))
+        return cls(
+            workers=int(os.environ.get('JOB_QUEUE_WORKERS', '4')),
+            max_pending=int(os.environ.get('JOB_QUEUE_MAX_PENDING', '1000')),
+            max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', '3')),
+            backoff=float(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', '1')),
+            store=store,
+        )
+
+    def start(self):
+        """Start the workers and periodic jobs and, with a store, re-queue unfinished jobs. Idempotent."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        if self.store is not None:
+            recovered = self.store.recover()
+            if recovered:
+                logger.info(f"Recovered {len(recovered)} unfinished jobs")
+            for found in recovered:
+                self._submit(found)
+        for name, seconds in PERIODIC:
+            self._schedule(name, seconds, 0)
+
+    def _schedule(self, name, seconds, delay):
+        def fire():
+            try:
+                self.enqueue(name)
+            except QueueFull as e:
+                logger.warning(f"Periodic job {name} skipped: {e}")
+            self._schedule(name, seconds, seconds)
+
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        timer.start()
+
+    def enqueue(self, name, owner_id=None, **payload):
+        """Queue ``name(**payload)`` and return the job id."""
+        if name not in HANDLERS:
+            raise ValueError(f"No job handler registered for '{name}'")
+        json.dumps(payload)  # payloads must survive a round trip through the store
+        self.start()
+        with self._lock:
+            if self.pending >= self.max_pending:
+                JOBS_TOTAL.inc(name=name, status='rejected')
+                raise QueueFull(f"Job queue is full ({self.pending} pending)")
+        new_job = Job(name, payload, owner_id)
+        if self.store is not None:
+            self.store.add(new_job)
+        self._submit(new_job)
+        return new_job.id
+
+    def _submit(self, queued_job):
+        with self._lock:
+            self.pending += 1
+            QUEUE_DEPTH.set(self.pending)
+            self._remember(queued_job)
+        self._queue.put(queued_job)
+
+    def _remember(self, queued_job):
+        self._recent[queued_job.id] = queued_job
+        self._recent.move_to_end(queued_job.id)
+        while len(self._recent) > _RECENT_JOBS:
+            self._recent.popitem(last=False)
+
+    def get(self, job_id):
+        """Return the job with ``job_id`` if it is still known, else None."""
+        with self._lock:
+            found = self._recent.get(job_id)
+        if found is None and self.store is not None:
+            found = self.store.get(job_id)
+        return found
+
+    def _work(self):
+        while True:
+            queued_job = self._queue.get()
+            if queued_job is None:
+                return
+            try:
+                self._run(queued_job)
+            except Exception as e:
+                logger.error(f"Job worker error for {queued_job.name}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, queued_job):
+        from app import app
+        if self.store is not None and not self.store.claim(queued_job):
+            self._done(queued_job)
+            return
+        queued_job.attempts += 1
+        queued_job.status = 'running'
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                queued_job.result = HANDLERS[queued_job.name](**queued_job.payload)
+        except Exception as e:
+            JOB_RUN_TIME.observe(time.perf_counter() - started, name=queued_job.name)
+            queued_job.error = str(e)
+            if queued_job.attempts < self.max_attempts:
+                delay = self.backoff * 2 ** (queued_job.attempts - 1)
+                logger.warning(f"Job {queued_job.name} failed (attempt {queued_job.attempts}), "
+                               f"retrying in {delay:.1f}s: {e}")
+                JOBS_TOTAL.inc(name=queued_job.name, status='retry')
+                queued_job.status = 'pending'
+                if self.store is not None:
+                    self.store.update(queued_job)
+                timer = threading.Timer(delay, self._queue.put, (queued_job,))
+                timer.daemon = True
+                timer.start()
+                return
+            logger.error(f"Job {queued_job.name} failed after {queued_job.attempts} attempts: {e}")
+            queued_job.status = 'failed'
+        else:
+            JOB_RUN_TIME.observe(time.perf_counter() - started, name=queued_job.name)
+            queued_job.status = 'done'
+        JOBS_TOTAL.inc(name=queued_job.name, status=queued_job.status)
+        JOB_LATENCY.observe(time.monotonic() - queued_job.enqueued_at, name=queued_job.name)
+        if self.store is not None:
+            self.store.update(queued_job)
+        self._done(queued_job)
+
+    def _done(self, queued_job):
+        with self._lock:
+            self.pending -= 1
+            QUEUE_DEPTH.set(self.pending)
+
+    def join(self, timeout=None):
+        """Wait until no jobs are pending, or ``timeout`` seconds. Returns True if drained."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue.from_env()
+    return _queue
+
+
+def enqueue(name, owner_id=None, **payload):
+    return get_queue().enqueue(name, owner_id=owner_id, **payload)
+
+
+def get_job(job_id):
+    return get_queue().get(job_id)
+
+
+@atexit.register
+def _drain_on_exit():
+    # Give in-flight side effects (titles, message writes) a moment to finish
+    if _queue is not None and _queue.pending:
+        _queue.join(timeout=float(os.environ.get('JOB_SHUTDOWN_TIMEOUT_SECONDS', '5')))
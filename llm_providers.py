@@ -0,0 +1,109 @@
+"""Offline LLM providers for load testing and profiling.
+
+The real Gemini provider lives in ``gemini_chat``; this module holds the
+deterministic stand-in selected with ``LLM_PROVIDER=fake``. It needs no network
+and produces the same text and pacing on every run, so latency and throughput
+numbers for the whole ``/api/send_message`` pipeline are reproducible.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import zlib
+
+VOCABULARY = (
+    "the model response stream token chunk latency chat message history user "
+    "assistant server request python flask database query cache index event "
+    "async worker queue markdown render code block list table summary result"
+).split()
+
+
+class FakeProvider:
+    """Deterministic provider with configurable time-to-first-token and pacing.
+
+    ``tokens_per_sec`` controls how fast chunks are released after the first
+    one and ``chunk_size`` how many tokens each chunk carries. A token is one
+    word plus its trailing space.
+    """
+
+    name = 'fake'
+
+    def __init__(self, ttft=0.2, tokens_per_sec=50.0, chunk_size=4, response_tokens=200):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.chunk_size = max(1, int(chunk_size))
+        self.response_tokens = max(1, int(response_tokens))
+        self.active_streams = 0
+        self.peak_streams = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttft=float(os.environ.get('FAKE_LLM_TTFT_MS', '200')) / 1000,
+            tokens_per_sec=float(os.environ.get('FAKE_LLM_TOKENS_PER_SEC', '50')),
+            chunk_size=int(os.environ.get('FAKE_LLM_CHUNK_TOKENS', '4')),
+            response_tokens=int(os.environ.get('FAKE_LLM_RESPONSE_TOKENS', '200')),
+        )
+
+    def _tokens(self, message):
+        rng = random.Random(zlib.crc32(message.encode('utf-8')))
+        words = [rng.choice(VOCABULARY) for _ in range(self.response_tokens)]
+        return [f"{word} " for word in words]
+
+    def _chunks(self, message):
+        tokens = self._tokens(message)
+        for start in range(0, len(tokens), self.chunk_size):
+            yield ''.join(tokens[start:start + self.chunk_size])
+
+    def _chunk_delay(self):
+        if self.tokens_per_sec <= 0:
+            return 0
+        return self.chunk_size / self.tokens_per_sec
+
+    def _enter(self):
+        with self._lock:
+            self.active_streams += 1
+            self.peak_streams = max(self.peak_streams, self.active_streams)
+
+    def _exit(self):
+        with self._lock:
+            self.active_streams -= 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.peak_streams = self.active_streams
+
+    def stream(self, message, chat_history=None):
+        self._enter()
+        try:
+            time.sleep(self.ttft)
+            for index, chunk in enumerate(self._chunks(message)):
+                if index:
+                    time.sleep(self._chunk_delay())
+                yield chunk
+        finally:
+            self._exit()
+
+    async def astream(self, message, chat_history=None):
+        self._enter()
+        try:
+            await asyncio.sleep(self.ttft)
+            for index, chunk in enumerate(self._chunks(message)):
+                if index:
+                    await asyncio.sleep(self._chunk_delay())
+                yield chunk
+        finally:
+            self._exit()
+
+    def invoke(self, message, chat_history=None):
+        return ''.join(self.stream(message, chat_history))
+
+    def title(self, first_message):
+        time.sleep(self.ttft)
+        return ' '.join(first_message.split()[:5])
+
+    def summarize(self, prompt):
+        time.sleep(self.ttft)
+        return ''.join(self._tokens(prompt)[:100]).strip()
@@ -0,0 +1,332 @@
+"""Pooled SMTP delivery with batched sends.
+
+Opening a connection, upgrading it with STARTTLS and logging in costs several
+round trips and a TLS handshake. During a burst of password resets those
+round trips cost far more than sending the messages. This module keeps a small
+pool of authenticated connections and reuses them.
+
+``MailTransport.submit`` puts a message in an in-memory outbox and returns
+immediately. Sender threads, one per pooled connection, take up to
+``MAIL_BATCH_SIZE`` waiting messages at a time. They wait at most
+``MAIL_BATCH_WINDOW_MS`` for a batch to fill, then send the whole batch over a
+single connection. A connection that has been idle for
+``MAIL_HEALTH_CHECK_SECONDS`` is checked with NOOP before use, and replaced if
+the server has dropped it. A message that fails with a temporary (4xx) error or
+a lost connection is retried with backoff.
+
+    MAIL_SERVER / MAIL_PORT / MAIL_USERNAME / MAIL_PASSWORD    as before
+    MAIL_USE_TLS=1                 STARTTLS after connecting
+    MAIL_POOL_SIZE=2               connections and sender threads
+    MAIL_BATCH_SIZE=50             messages per batch
+    MAIL_BATCH_WINDOW_MS=50        time to wait for a batch to fill
+    MAIL_OUTBOX_MAX=1000           backpressure limit for submit
+    MAIL_MAX_ATTEMPTS=3            delivery attempts per message
+    MAIL_HEALTH_CHECK_SECONDS=30   idle time before a NOOP check
+    MAIL_IDLE_TIMEOUT_SECONDS=240  idle time after which a connection is discarded
+"""
+import atexit
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CONNECTIONS_OPENED = metrics.counter('mail_connections_opened_total', 'SMTP connections opened')
+MESSAGES_TOTAL = metrics.counter('mail_messages_total', 'Outgoing mail by outcome')
+OUTBOX_DEPTH = metrics.gauge('mail_outbox_depth', 'Messages waiting to be sent')
+BATCH_SIZE = metrics.histogram(
+    'mail_batch_size', 'Messages sent per batch', buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+BATCH_SECONDS = metrics.histogram(
+    'mail_batch_seconds', 'Time to send one batch, including any reconnect',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+
+class OutboxFull(Exception):
+    """Raised by submit when the outbox is at its limit."""
+
+
+class _Connection:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """Authenticated SMTP connections reused across sends."""
+
+    def __init__(self, host, port, username='', password='', use_tls=True, size=2, timeout=10,
+                 health_check_seconds=30, idle_timeout=240):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.timeout = timeout
+        self.health_check_seconds = health_check_seconds
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        CONNECTIONS_OPENED.inc()
+        return _Connection(smtp)
+
+    def _healthy(self, connection):
+        idle = time.monotonic() - connection.last_used
+        if idle >= self.idle_timeout:
+            return False
+        if idle < self.health_check_seconds:
+            return True
+        try:
+            return connection.smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                return self._connect()
+            if self._healthy(connection):
+                return connection
+            connection.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a live connection. A connection that raised is closed, not returned."""
+        with self._slots:
+            connection = self._checkout()
+            try:
+                yield connection
+            except Exception:
+                connection.close()
+                raise
+            connection.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(connection)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class _Envelope:
+    def __init__(self, to, message):
+        self.to = to
+        self.message = message
+        self.attempts = 0
+
+
+def _temporary(error):
+    """Whether an SMTP error is worth retrying."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    # Dropped connections, timeouts and socket errors
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError))
+
+
+class MailTransport:
+    def __init__(self, pool, sender, batch_size=50, batch_window_ms=50, max_pending=1000,
+                 max_attempts=3, backoff=1.0):
+        self.pool = pool
+        self.sender = sender
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.pending = 0
+        self._outbox = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for index in range(self.pool.size):
+            threading.Thread(target=self._work, name=f'mail-sender-{index}', daemon=True).start()
+
+    def submit(self, to, message):
+        """Queue ``message`` (a string) for delivery to ``to``."""
+        self.start()
+        with self._lock:
+            if self.pending >= self.max_pending:
+                MESSAGES_TOTAL.inc(status='rejected')
+                raise OutboxFull(f"Mail outbox is full ({self.pending} pending)")
+            self.pending += 1
+            OUTBOX_DEPTH.set(self.pending)
+        self._outbox.put(_Envelope(to, message))
+
+    def _next_batch(self):
+        batch = [self._outbox.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._outbox.get(timeout=timeout) if timeout > 0 else self._outbox.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.send_batch(batch)
+            except Exception as e:
+                logger.error(f"Mail sender error: {e}", exc_info=True)
+
+    def send_batch(self, batch):
+        """Send ``batch`` over one pooled connection, reconnecting once if it drops."""
+        started = time.perf_counter()
+        remaining = list(batch)
+        for _ in range(2):
+            try:
+                with self.pool.connection() as connection:
+                    while remaining:
+                        envelope = remaining[0]
+                        try:
+                            connection.smtp.sendmail(self.sender, envelope.to, envelope.message)
+                        except (smtplib.SMTPServerDisconnected, OSError):
+                            raise
+                        except smtplib.SMTPException as e:
+                            remaining.pop(0)
+                            self._failed(envelope, e)
+                            # Clear any half-finished transaction before the next message
+                            connection.smtp.rset()
+                            continue
+                        remaining.pop(0)
+                        self._finished(envelope, 'sent')
+                break
+            except Exception as e:
+                error = e
+                logger.warning(f"SMTP connection failed with {len(remaining)} messages unsent: {e}")
+        else:
+            for envelope in remaining:
+                self._failed(envelope, error)
+        BATCH_SIZE.observe(len(batch))
+        BATCH_SECONDS.observe(time.perf_counter() - started)
+
+    def _failed(self, envelope, error):
+        envelope.attempts += 1
+        if _temporary(error) and envelope.attempts < self.max_attempts:
+            delay = self.backoff * 2 ** (envelope.attempts - 1)
+            logger.warning(f"Mail to {envelope.to} failed (attempt {envelope.attempts}), "
+                           f"retrying in {delay:.1f}s: {error}")
+            MESSAGES_TOTAL.inc(status='retry')
+            timer = threading.Timer(delay, self._outbox.put, (envelope,))
+            timer.daemon = True
+            timer.start()
+            return
+        logger.error(f"Mail to {envelope.to} failed after {envelope.attempts} attempts: {error}")
+        self._finished(envelope, 'failed')
+
+    def _finished(self, envelope, status):
+        MESSAGES_TOTAL.inc(status=status)
+        with self._lock:
+            self.pending -= 1
+            OUTBOX_DEPTH.set(self.pending)
+
+    def flush(self, timeout=None):
+        """Wait until the outbox is empty, or ``timeout`` seconds. Returns True if drained."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self):
+        self.pool.close()
+
+
+def settings_from_env():
+    return {
+        'host': os.environ.get('MAIL_SERVER', 'smtp.gmail.com'),
+        'port': int(os.environ.get('MAIL_PORT', '587')),
+        'username': os.environ.get('MAIL_USERNAME', ''),
+        'password': os.environ.get('MAIL_PASSWORD', ''),
+        'use_tls': os.environ.get('MAIL_USE_TLS', '1') == '1',
+    }
+
+
+def is_configured():
+    settings = settings_from_env()
+    return bool(settings['username'] and settings['password'])
+
+
+def from_env():
+    settings = settings_from_env()
+    pool = SMTPConnectionPool(
+        size=int(os.environ.get('MAIL_POOL_SIZE', '2')),
+        health_check_seconds=float(os.environ.get('MAIL_HEALTH_CHECK_SECONDS', '30')),
+        idle_timeout=float(os.environ.get('MAIL_IDLE_TIMEOUT_SECONDS', '240')),
+        **settings,
+    )
+    return MailTransport(
+        pool,
+        sender=settings['username'],
+        batch_size=int(os.environ.get('MAIL_BATCH_SIZE', '50')),
+        batch_window_ms=float(os.environ.get('MAIL_BATCH_WINDOW_MS', '50')),
+        max_pending=int(os.environ.get('MAIL_OUTBOX_MAX', '1000')),
+        max_attempts=int(os.environ.get('MAIL_MAX_ATTEMPTS', '3')),
+        backoff=float(os.environ.get('MAIL_RETRY_BACKOFF_SECONDS', '1')),
+    )
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = from_env()
+    return _transport
+
+
+def set_transport(transport):
+    """Replace the shared transport (used by benchmarks pointing at a local server)."""
+    global _transport
+    _transport = transport
+
+
+@atexit.register
+def _flush_on_exit():
+    if _transport is not None and _transport.pending:
+        _transport.flush(timeout=float(os.environ.get('MAIL_SHUTDOWN_TIMEOUT_SECONDS', '5')))
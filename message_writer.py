@@ -0,0 +1,226 @@
+"""Group commit for chat message writes.
+
+Every chat turn writes twice: the user message when the turn starts, and the AI
+message with the ``chat.updated_at`` bump when it ends. Committed one by one,
+each write costs a transaction and, on PostgreSQL, a WAL flush. Under load that
+flush is the bottleneck.
+
+``write()`` hands the write to a single writer thread instead. The thread
+takes every write that is waiting, up to ``WRITE_BATCH_MAX_SIZE``, and applies
+them in one transaction: one multi-row INSERT of new chats, one of messages,
+and one UPDATE of ``updated_at``. Writes that arrive while a batch commits form
+the next one, so batches grow with load on their own. While writes are coming
+in together, the first of a batch also waits up to ``WRITE_BATCH_MAX_DELAY_MS``
+for more to join; a lone write is committed at once.
+
+Durability is unchanged: ``write()`` returns only after the commit that holds
+the write, and raises if that commit failed. When a batch fails, its writes are
+retried one per transaction, so one bad write (a chat deleted meanwhile)
+cannot fail the others.
+
+    WRITE_BATCHING=1                 0 commits every write in the caller, as before
+    WRITE_BATCH_MAX_SIZE=200         writes per transaction
+    WRITE_BATCH_MAX_DELAY_MS=2       longest a write waits for others to join its batch
+    WRITE_BATCH_TIMEOUT_SECONDS=10   how long write() waits for its batch to start
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from sqlalchemy import insert, update
+
+import metrics
+from app import db
+from models import Chat, Message
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('WRITE_BATCHING', '1') == '1'
+MAX_SIZE = int(os.environ.get('WRITE_BATCH_MAX_SIZE', '200'))
+MAX_DELAY = float(os.environ.get('WRITE_BATCH_MAX_DELAY_MS', '2')) / 1000
+TIMEOUT_SECONDS = float(os.environ.get('WRITE_BATCH_TIMEOUT_SECONDS', '10'))
+
+BATCH_SIZE = metrics.histogram(
+    'write_batch_size', 'Message writes committed per transaction',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+BATCH_SECONDS = metrics.histogram(
+    'write_batch_seconds', 'Time to apply and commit one batch of message writes',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+WRITE_WAIT_SECONDS = metrics.histogram(
+    'write_wait_seconds', 'Time from write() to its commit',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+
+
+class PendingWrite:
+    """One message to append; with ``new_chat_title`` it also creates the chat."""
+
+    def __init__(self, chat_id, content, is_user, touch_chat, user_id=None, new_chat_title=None):
+        self.chat_id = chat_id
+        self.content = content
+        self.is_user = is_user
+        self.touch_chat = touch_chat
+        self.user_id = user_id
+        self.new_chat_title = new_chat_title
+        self.future = Future()
+
+
+def apply(writes):
+    """Apply ``writes`` in the current session; the caller commits.
+
+    Returns ``(chat_id, message_id)`` per write, or None for a write whose chat
+    is gone.
+    """
+    now = datetime.utcnow()
+    new_chats = [w for w in writes if w.new_chat_title is not None]
+    if new_chats:
+        ids = db.session.scalars(
+            insert(Chat).returning(Chat.id, sort_by_parameter_order=True),
+            [{'title': w.new_chat_title, 'user_id': w.user_id, 'created_at': now, 'updated_at': now}
+             for w in new_chats],
+        ).all()
+        for w, chat_id in zip(new_chats, ids):
+            w.chat_id = chat_id
+
+    live = set(db.session.scalars(
+        db.select(Chat.id).where(Chat.id.in_({w.chat_id for w in writes}), Chat.deleted_at.is_(None))
+    ))
+    kept = [w for w in writes if w.chat_id in live]
+    message_ids = {}
+    if kept:
+        ids = db.session.scalars(
+            insert(Message).returning(Message.id, sort_by_parameter_order=True),
+            [{'content': w.content, 'is_user': w.is_user, 'chat_id': w.chat_id, 'created_at': now}
+             for w in kept],
+        ).all()
+        message_ids = {id(w): message_id for w, message_id in zip(kept, ids)}
+    touched = {w.chat_id for w in kept if w.touch_chat and w.new_chat_title is None}
+    if touched:
+        db.session.execute(
+            update(Chat).where(Chat.id.in_(touched)).values(updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    return [(w.chat_id, message_ids[id(w)]) if id(w) in message_ids else None for w in writes]
+
+
+class MessageWriter:
+    """Single writer thread that commits queued writes in batches."""
+
+    def __init__(self, app, max_size=MAX_SIZE, max_delay=MAX_DELAY):
+        self.app = app
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._queue = queue.SimpleQueue()
+        self._last_size = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, pending):
+        self.start()
+        self._queue.put(pending)
+        return pending.future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # Only wait for company when the last batch had some; a lone writer
+        # would just pay the delay
+        deadline = time.monotonic() + (self.max_delay if self._last_size > 1 else 0)
+        while len(batch) < self.max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._last_size = len(batch)
+        # Writers that gave up waiting have cancelled theirs
+        return [w for w in batch if w.future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                with self.app.app_context():
+                    self._commit(batch)
+            except Exception as e:
+                logger.error(f"Message writer failed on a batch of {len(batch)}: {e}")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        try:
+            results = apply(batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            logger.warning(f"Write batch of {len(batch)} failed, retrying one by one: {e}")
+            for pending in batch:
+                self._commit([pending])
+            return
+        BATCH_SIZE.observe(len(batch))
+        BATCH_SECONDS.observe(time.perf_counter() - started)
+        for pending, result in zip(batch, results):
+            pending.future.set_result(result)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                from app import app
+                _writer = MessageWriter(app)
+    return _writer
+
+
+def write(pending):
+    """Commit ``pending`` and return ``(chat_id, message_id)``, or None if its chat is gone.
+
+    Callers must not hold an open write transaction of their own: on SQLite it
+    would lock out the writer thread.
+    """
+    started = time.perf_counter()
+    if not ENABLED:
+        result = apply([pending])[0]
+        db.session.commit()
+        return result
+    future = get_writer().submit(pending)
+    try:
+        result = future.result(timeout=TIMEOUT_SECONDS)
+    except TimeoutError:
+        # Still queued: withdraw it. Already being committed: see it through.
+        if future.cancel():
+            raise
+        result = future.result()
+    WRITE_WAIT_SECONDS.observe(time.perf_counter() - started)
+    return result
+
+
+def append_message(chat_id, content, is_user, touch_chat=True):
+    """Append a message to an existing chat. Returns the message id, or None if the chat is gone."""
+    result = write(PendingWrite(chat_id, content, is_user, touch_chat))
+    return result[1] if result else None
+
+
+def start_chat(user_id, title, content):
+    """Create a chat with its first (user) message. Returns ``(chat_id, message_id)``."""
+    return write(PendingWrite(None, content, True, False, user_id=user_id, new_chat_title=title))
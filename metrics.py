@@ -0,0 +1,171 @@
+"""In-process metrics shared by the request and streaming code.
+
+Counters and histograms live in memory for the lifetime of the worker process.
+They are cheap enough to update on every event: one lock and a dict lookup.
+``render()`` writes the registry in the Prometheus text format served at
+/metrics (see observability.py).
+"""
+import bisect
+import threading
+
+# Default buckets, roughly log-spaced, wide enough for counts, bytes and rates
+DEFAULT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(dict(key), value) for key, value in self._values.items()]
+
+
+class Gauge:
+    """Value that can go up and down, optionally split by labels."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(dict(key), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets plus sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def samples(self):
+        """``(labels, cumulative bucket counts, sum, count)`` per label set."""
+        result = []
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative = []
+                running = 0
+                for count in series['counts']:
+                    running += count
+                    cumulative.append(running)
+                result.append((dict(key), cumulative, series['sum'], series['count']))
+        return result
+
+
+def _register(cls, name, description, **kwargs):
+    with _registry_lock:
+        metric = REGISTRY.get(name)
+        if metric is None:
+            metric = REGISTRY[name] = cls(name, description, **kwargs)
+        return metric
+
+
+def counter(name, description):
+    return _register(Counter, name, description)
+
+
+def gauge(name, description):
+    return _register(Gauge, name, description)
+
+
+def histogram(name, description, buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, description, buckets=buckets)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels, **extra):
+    pairs = {**labels, **extra}
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(pairs.items())) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _registry_lock:
+        registered = sorted(REGISTRY.items())
+    for name, metric in registered:
+        help_text = metric.description.replace('\\', '\\\\').replace('\n', '\\n')
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        if metric.kind == 'histogram':
+            for labels, cumulative, total, count in metric.samples():
+                for bound, value in zip(metric.buckets + (float('inf'),), cumulative):
+                    lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {value}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        else:
+            for labels, value in metric.samples():
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,210 @@
+"""Versioned schema migrations.
+
+``db.create_all()`` only creates missing tables; it never changes tables that
+already exist. Changes to existing production databases are applied here
+instead. Each migration has an increasing version, and applied versions are
+recorded in the ``schema_migrations`` table, so ``upgrade()`` is idempotent.
+Run it with ``flask --app app db-upgrade`` before each deploy; the app only
+applies migrations itself to a brand-new database, or with AUTO_MIGRATE=1.
+
+Migrations must stay online-safe. Indexes are created with ``IF NOT EXISTS``,
+and ``CONCURRENTLY`` on PostgreSQL, so writers are not blocked while they build.
+"""
+import logging
+from datetime import datetime
+
+import click
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+# Arbitrary key for pg_advisory_lock so concurrent workers upgrade one at a time
+_PG_LOCK_KEY = 724_115_001
+
+
+def migration(version, description, transactional=True):
+    """Register a migration. Non-transactional ones run in autocommit mode."""
+    def register(fn):
+        MIGRATIONS.append((version, description, transactional, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def create_index(conn, name, table, columns, unique=False):
+    """CREATE INDEX that is idempotent and, on PostgreSQL, non-blocking."""
+    concurrently = 'CONCURRENTLY ' if conn.dialect.name == 'postgresql' else ''
+    unique_sql = 'UNIQUE ' if unique else ''
+    conn.execute(text(
+        f'CREATE {unique_sql}INDEX {concurrently}IF NOT EXISTS {name} ON "{table}" ({columns})'
+    ))
+
+
+def add_column(conn, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless ``db.create_all()`` already created it."""
+    if column in {c['name'] for c in inspect(conn).get_columns(table)}:
+        return
+    conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+@migration(1, 'Composite indexes for the sidebar, message paging and reset tokens', transactional=False)
+def _add_hot_path_indexes(conn):
+    create_index(conn, 'ix_chat_user_id_updated_at', 'chat', 'user_id, updated_at DESC, id DESC')
+    create_index(conn, 'ix_message_chat_id_id', 'message', 'chat_id, id')
+    create_index(conn, 'ix_password_reset_token_user_id', 'password_reset_token', 'user_id')
+
+
+@migration(2, 'Per-user opt-out from the LLM response cache')
+def _add_response_cache_opt_out(conn):
+    add_column(conn, 'user', 'response_cache_opt_out', 'BOOLEAN NOT NULL DEFAULT FALSE')
+
+
+@migration(3, 'Rolling conversation summaries on chat')
+def _add_chat_summary(conn):
+    add_column(conn, 'chat', 'summary', 'TEXT')
+    add_column(conn, 'chat', 'summary_through_id', 'INTEGER')
+
+
+@migration(4, 'Cascade message deletes in the database; purge marker on chat', transactional=False)
+def _cascade_message_deletes(conn):
+    add_column(conn, 'chat', 'deleted_at', 'TIMESTAMP')
+    # SQLite cannot alter a constraint; chat_purge deletes messages explicitly there
+    if conn.dialect.name != 'postgresql':
+        return
+    for fk in inspect(conn).get_foreign_keys('message'):
+        if fk['referred_table'] != 'chat' or fk['options'].get('ondelete', '').upper() == 'CASCADE':
+            continue
+        # Swap the constraint in one statement without checking rows, then validate
+        # separately, which scans the table without blocking writes
+        conn.execute(text(
+            f'ALTER TABLE message DROP CONSTRAINT "{fk["name"]}", '
+            'ADD CONSTRAINT message_chat_id_fkey FOREIGN KEY (chat_id) REFERENCES chat (id) '
+            'ON DELETE CASCADE NOT VALID'
+        ))
+        conn.execute(text('ALTER TABLE message VALIDATE CONSTRAINT message_chat_id_fkey'))
+
+
+@migration(5, 'Full-text index on message content', transactional=False)
+def _add_message_search_index(conn):
+    if conn.dialect.name == 'postgresql':
+        from search import PG_DOCUMENT
+        conn.execute(text(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_message_search ON message USING gin ({PG_DOCUMENT})'
+        ))
+        return
+    # External-content FTS5 table: it stores only the index and reads text from
+    # the view. Each row also indexes its owner ("u<user_id>"), so a search can
+    # ask for one user's matches instead of ranking everyone's. Chats never
+    # change owner, and their messages are deleted before them, so the owner a
+    # delete trigger looks up is the one that was indexed.
+    conn.execute(text(
+        "CREATE VIEW IF NOT EXISTS message_search_source AS "
+        "SELECT m.id, m.content, 'u' || c.user_id AS owner FROM message m JOIN chat c ON c.id = m.chat_id"
+    ))
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(content, owner, "
+        "content='message_search_source', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    ))
+    owner = lambda row: f"(SELECT 'u' || user_id FROM chat WHERE id = {row}.chat_id)"
+    conn.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message BEGIN '
+        f'INSERT INTO message_fts (rowid, content, owner) VALUES (new.id, new.content, {owner("new")}); END'
+    ))
+    conn.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN '
+        "INSERT INTO message_fts (message_fts, rowid, content, owner) "
+        f"VALUES ('delete', old.id, old.content, {owner('old')}); END"
+    ))
+    conn.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS message_fts_update AFTER UPDATE OF content ON message BEGIN '
+        "INSERT INTO message_fts (message_fts, rowid, content, owner) "
+        f"VALUES ('delete', old.id, old.content, {owner('old')}); "
+        f'INSERT INTO message_fts (rowid, content, owner) VALUES (new.id, new.content, {owner("new")}); END'
+    ))
+    # Index the messages written before the triggers existed
+    conn.execute(text("INSERT INTO message_fts (message_fts) VALUES ('rebuild')"))
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def pending_versions(engine):
+    done = applied_versions(engine)
+    return [version for version, _description, _transactional, _fn in MIGRATIONS if version not in done]
+
+
+def current_version(engine):
+    return max(applied_versions(engine), default=0)
+
+
+def upgrade(engine):
+    """Apply every pending migration in version order. Returns versions applied."""
+    applied = []
+    # Autocommit: an open transaction here would stall CREATE INDEX CONCURRENTLY
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock_conn:
+        if engine.dialect.name == 'postgresql':
+            lock_conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': _PG_LOCK_KEY})
+        try:
+            done = applied_versions(engine)
+            for version, description, transactional, fn in MIGRATIONS:
+                if version in done:
+                    continue
+                logger.info(f"Applying migration {version}: {description}")
+                if transactional:
+                    with engine.begin() as conn:
+                        fn(conn)
+                        _record(conn, version, description)
+                else:
+                    with engine.connect() as conn:
+                        fn(conn.execution_options(isolation_level='AUTOCOMMIT'))
+                    with engine.begin() as conn:
+                        _record(conn, version, description)
+                applied.append(version)
+        finally:
+            if engine.dialect.name == 'postgresql':
+                lock_conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': _PG_LOCK_KEY})
+    return applied
+
+
+def _record(conn, version, description):
+    try:
+        with conn.begin_nested():
+            conn.execute(
+                text('INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.utcnow()},
+            )
+    except IntegrityError:
+        # Another worker recorded it first (SQLite has no advisory lock)
+        pass
+
+
+def register_commands(app):
+    from app import db
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade():
+        """Create missing tables and apply pending schema migrations."""
+        db.create_all()
+        applied = upgrade(db.engine)
+        click.echo(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+
+    @app.cli.command('db-status')
+    def db_status():
+        """Show applied and pending schema migrations."""
+        done = applied_versions(db.engine)
+        for version, description, _transactional, _fn in MIGRATIONS:
+            state = 'applied' if version in done else 'pending'
+            click.echo(f"{version:>4}  {state:<8} {description}")
@@ -1,5 +1,6 @@
 from app import db
 from flask_login import UserMixin
+import user_cache
 from datetime import datetime
 import secrets
 
@@ -10,6 +11,8 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256))
     display_name = db.Column(db.String(100))
     theme_preference = db.Column(db.String(20), default='light')
+    # Opt out of the shared LLM response cache (see response_cache.py)
+    response_cache_opt_out = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -19,34 +22,59 @@ class User(UserMixin, db.Model):
     def get_display_name(self):
         return self.display_name or self.username
 
+# load_user serves users from a short-lived cache; drop entries when a user changes
+user_cache.register(User)
+
 class Chat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False, default='New Chat')
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Rolling summary of the turns that no longer fit the prompt (see chat_history.py),
+    # covering every message up to and including summary_through_id
+    summary = db.Column(db.Text)
+    summary_through_id = db.Column(db.Integer)
+    # Set when a background purge has taken the chat (see chat_purge.py); such chats are hidden
+    deleted_at = db.Column(db.DateTime)
     
-    # Relationships
-    messages = db.relationship('Message', backref='chat', lazy=True, cascade='all, delete-orphan')
+    # Relationships. Messages go with their chat in the database (ON DELETE CASCADE),
+    # so deleting a chat never loads them
+    messages = db.relationship('Message', backref='chat', lazy=True, cascade='all, delete-orphan',
+                               passive_deletes=True)
+
+    __table_args__ = (
+        # Sidebar: a user's chats, most recently updated first
+        db.Index('ix_chat_user_id_updated_at', user_id, updated_at.desc(), id.desc()),
+    )
     
     def get_preview(self):
-        messages_list = list(self.messages)
-        if messages_list:
-            first_message = messages_list[0]
-            return first_message.content[:50] + "..." if len(first_message.content) > 50 else first_message.content
-        return "Empty chat"
+        first_message = Message.query.filter_by(chat_id=self.id).order_by(Message.id).first()
+        return self.format_preview(first_message.content if first_message else None)
+
+    @staticmethod
+    def format_preview(content):
+        if content is None:
+            return "Empty chat"
+        return content[:50] + "..." if len(content) > 50 else content
 
 class Message(db.Model):
+    __table_args__ = (
+        # Serves history paging and "first/latest message of a chat" lookups
+        db.Index('ix_message_chat_id_id', 'chat_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     is_user = db.Column(db.Boolean, nullable=False, default=True)
-    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), nullable=False)
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class PasswordResetToken(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # The unique constraint doubles as the index for token lookups
     token = db.Column(db.String(100), unique=True, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
     used = db.Column(db.Boolean, default=False)
@@ -55,3 +83,17 @@ class PasswordResetToken(db.Model):
         self.user_id = user_id
         self.expires_at = expires_at
         self.token = secrets.token_urlsafe(32)
+
+class BackgroundJob(db.Model):
+    """Durable copy of a queued job, used when JOB_QUEUE_PERSIST is on (see jobs.py)."""
+    id = db.Column(db.String(32), primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    owner_id = db.Column(db.Integer)
+    # pending -> running -> done | failed; running jobs go back to pending to retry
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.Text)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,180 @@
+"""Logging setup, request instrumentation and the /metrics endpoint.
+
+``configure_logging()`` replaces the old ``logging.basicConfig(level=DEBUG)``.
+That setting turned on debug output from every library, including one line per
+SQL statement from SQLAlchemy. Now the level comes from ``LOG_LEVEL``
+(default INFO), and ``LOG_FORMAT=json`` writes one JSON object per record, with
+any ``extra=`` fields as keys.
+
+``init_app(app)`` times every request per endpoint. It counts the SQL
+statements each request runs, and their total time, with SQLAlchemy cursor
+events, and tracks pooled connections in use with pool events. It also serves
+everything in the metrics registry at /metrics in the Prometheus text format,
+but only when configured to: route names, request rates, latencies and pool
+usage are not for the public. Set ``METRICS_TOKEN`` and scrape with it, or set
+``METRICS_ENABLED=1`` where only the scraper can reach /metrics.
+
+Other modules record their own series: the LLM series (time to first token,
+tokens/sec, active generations) in gemini_chat, and the SSE series (stream
+duration, active streams) in streaming.
+
+    LOG_LEVEL=INFO       root log level
+    LOG_FORMAT=text      text or json
+    METRICS_TOKEN        serves /metrics to "Authorization: Bearer <token>"
+    METRICS_ENABLED=0    1 serves /metrics without a token (private network only)
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from flask import Blueprint, Response, g, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+import metrics
+
+REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', 'Time to build a response by endpoint, method and status; '
+    'streamed bodies are covered by sse_stream_duration_seconds',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+REQUEST_QUERIES = metrics.histogram(
+    'db_queries_per_request', 'SQL statements executed while handling a request, by endpoint',
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100))
+REQUEST_QUERY_SECONDS = metrics.histogram(
+    'db_query_seconds_per_request', 'Total SQL time while handling a request, by endpoint',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+CONNECTIONS_CHECKED_OUT = metrics.gauge(
+    'db_connections_checked_out', 'Pooled database connections in use; open streams should not add to it')
+QUERY_SECONDS = metrics.histogram(
+    'db_query_duration_seconds', 'Latency of single SQL statements, in and out of requests',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+
+# [statements, seconds] for the request running in this context, or None outside one
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+observability = Blueprint('observability', __name__)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; fields passed with ``extra=`` become keys."""
+
+    _reserved = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self._reserved:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Set the root level from LOG_LEVEL and, unless a server already did, add a handler."""
+    root = logging.getLogger()
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    if os.environ.get('LOG_FORMAT', 'text') == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root.addHandler(handler)
+
+
+# --- SQL statements --------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    QUERY_SECONDS.observe(elapsed)
+    counts = _request_queries.get()
+    if counts is not None:
+        counts[0] += 1
+        counts[1] += elapsed
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    CONNECTIONS_CHECKED_OUT.inc()
+
+
+def _checkin(dbapi_connection, connection_record):
+    CONNECTIONS_CHECKED_OUT.dec()
+
+
+def instrument_engines():
+    """Time the statements of every engine, current and future, and count connections in use. Idempotent."""
+    if event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    event.listen(Pool, 'checkout', _checkout)
+    event.listen(Pool, 'checkin', _checkin)
+
+
+# --- Requests --------------------------------------------------------------
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.request_queries_token = _request_queries.set([0, 0.0])
+
+
+def _record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unmatched',
+                                method=request.method, status=str(response.status_code))
+    return response
+
+
+def _finish_request(exc):
+    token = g.pop('request_queries_token', None)
+    if token is None:
+        return
+    statements, seconds = _request_queries.get()
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_QUERIES.observe(statements, endpoint=endpoint)
+    REQUEST_QUERY_SECONDS.observe(seconds, endpoint=endpoint)
+    _request_queries.reset(token)
+
+
+@observability.route('/metrics')
+def metrics_endpoint():
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def metrics_exposed():
+    return bool(os.environ.get('METRICS_TOKEN')) or os.environ.get('METRICS_ENABLED', '0') == '1'
+
+
+def init_app(app):
+    instrument_engines()
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.teardown_request(_finish_request)
+    if metrics_exposed():
+        app.register_blueprint(observability)
@@ -0,0 +1,180 @@
+"""Outbound HTTP for Google sign-in: a pooled session, cached documents and local id_token checks.
+
+Sign-in used to fetch the OpenID discovery document on both legs of the flow,
+then call the token and userinfo endpoints, each over a fresh TCP and TLS
+connection. Now:
+
+- All calls share one keep-alive ``requests.Session`` with connect and read
+  timeouts. Idempotent GETs are retried.
+- The discovery document and Google's signing certificates are cached for as
+  long as their ``Cache-Control``/``Expires`` headers allow. They are
+  revalidated with ``ETag``/``Last-Modified`` when stale. If a refresh fails,
+  the stale copy is served so a Google hiccup doesn't block every login.
+- The id_token from the token response is verified locally against the cached
+  certificates, so the userinfo round trip is gone. A token signed with an
+  unknown key id forces a single certificate refresh, which covers key
+  rotation.
+
+    GOOGLE_DISCOVERY_URL           OpenID configuration (default: Google's)
+    GOOGLE_CERTS_URL               PEM signing certificates keyed by kid
+    OAUTH_HTTP_TIMEOUT_SECONDS=5   read timeout for outbound calls
+    OAUTH_HTTP_CONNECT_TIMEOUT_SECONDS=3
+"""
+import email.utils
+import logging
+import os
+import re
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_DISCOVERY_URL = os.environ.get(
+    'GOOGLE_DISCOVERY_URL', 'https://accounts.google.com/.well-known/openid-configuration')
+# Same keys as the discovery document's jwks_uri, but as PEM certificates, which
+# google-auth can verify without an extra JWK dependency
+GOOGLE_CERTS_URL = os.environ.get('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v1/certs')
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+HTTP_TIMEOUT = (
+    float(os.environ.get('OAUTH_HTTP_CONNECT_TIMEOUT_SECONDS', '3')),
+    float(os.environ.get('OAUTH_HTTP_TIMEOUT_SECONDS', '5')),
+)
+# Clock skew tolerated on iat/exp when verifying id_tokens
+CLOCK_SKEW_SECONDS = 10
+# After a failed refresh, keep serving the stale copy this long before trying again
+STALE_RETRY_SECONDS = 60
+
+DOCUMENT_REQUESTS = metrics.counter(
+    'oidc_document_requests_total', 'Cached OpenID document lookups by document and result')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The shared keep-alive session for calls to the identity provider."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # requests is only needed once someone signs in with Google
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                session = requests.Session()
+                retry = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                              allowed_methods=frozenset({'GET'}))
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+    return get_session().request(method, url, **kwargs)
+
+
+def freshness_seconds(headers, now=None):
+    """How long a response may be served from cache, from its caching headers."""
+    cache_control = headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    match = re.search(r'(?:^|,)\s*max-age\s*=\s*"?(\d+)', cache_control)
+    if match:
+        age = headers.get('Age', '0')
+        return max(0, int(match.group(1)) - (int(age) if age.isdigit() else 0))
+    expires = headers.get('Expires')
+    if expires:
+        try:
+            expires_at = email.utils.parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            return 0
+        return max(0, expires_at - (now or time.time()))
+    return 0
+
+
+class CachedDocument:
+    """A JSON document fetched over HTTP and reused while its cache headers allow."""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.data = None
+        self.expires_at = 0
+        self._validators = {}
+        self._lock = threading.Lock()
+
+    def get(self, force_refresh=False):
+        if not force_refresh and self.data is not None and time.monotonic() < self.expires_at:
+            DOCUMENT_REQUESTS.inc(document=self.name, result='hit')
+            return self.data
+        # One refresh at a time; others wait and then reuse its result
+        with self._lock:
+            if not force_refresh and self.data is not None and time.monotonic() < self.expires_at:
+                DOCUMENT_REQUESTS.inc(document=self.name, result='hit')
+                return self.data
+            return self._refresh()
+
+    def _refresh(self):
+        headers = {}
+        if self.data is not None:
+            if 'etag' in self._validators:
+                headers['If-None-Match'] = self._validators['etag']
+            if 'last_modified' in self._validators:
+                headers['If-Modified-Since'] = self._validators['last_modified']
+        try:
+            response = request('GET', self.url, headers=headers)
+            if response.status_code == 304 and self.data is not None:
+                result = 'revalidated'
+            else:
+                response.raise_for_status()
+                self.data = response.json()
+                self._validators = {}
+                if response.headers.get('ETag'):
+                    self._validators['etag'] = response.headers['ETag']
+                if response.headers.get('Last-Modified'):
+                    self._validators['last_modified'] = response.headers['Last-Modified']
+                result = 'miss'
+        except Exception as e:
+            if self.data is None:
+                raise
+            logger.warning(f"Refreshing {self.name} failed, serving the cached copy: {e}")
+            DOCUMENT_REQUESTS.inc(document=self.name, result='stale')
+            self.expires_at = time.monotonic() + STALE_RETRY_SECONDS
+            return self.data
+        self.expires_at = time.monotonic() + freshness_seconds(response.headers)
+        DOCUMENT_REQUESTS.inc(document=self.name, result=result)
+        return self.data
+
+
+discovery = CachedDocument('discovery', GOOGLE_DISCOVERY_URL)
+certificates = CachedDocument('certs', GOOGLE_CERTS_URL)
+
+
+def provider_config():
+    """The (cached) OpenID discovery document."""
+    return discovery.get()
+
+
+def verify_id_token(token, audience):
+    """Check an id_token's signature, audience, issuer and expiry; return its claims.
+
+    Raises ValueError if the token is not valid.
+    """
+    from google.auth import jwt
+
+    kid = jwt.decode_header(token).get('kid')
+    certs = certificates.get()
+    if kid not in certs:
+        # Google rotates its keys; a new kid means our copy is out of date
+        certs = certificates.get(force_refresh=True)
+    claims = jwt.decode(token, certs=certs, audience=audience, clock_skew_in_seconds=CLOCK_SKEW_SECONDS)
+    if claims.get('iss') not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+    return claims
@@ -0,0 +1,204 @@
+"""Cache of LLM responses for repeated prompts.
+
+Identical requests are common, canned openers like "hello" on an empty chat
+above all. A retry (/api/retry) never reads the cache, since the user is asking
+for a different answer; its fresh answer replaces the entry, so later identical
+requests get the newer one. Responses are keyed on a hash of the provider, the
+system prompt, the history and the input. Each is only NFKC-normalized and
+stripped of outer whitespace. Case and inner whitespace stay in the key,
+because prompts that differ in identifier case or code indentation are
+different questions.
+
+Entries live in an in-process LRU bounded by entry count and total size, with
+a TTL. When ``RESPONSE_CACHE_URL`` points at a Redis server, a shared tier is
+consulted on local misses so workers and restarts share hits. Cached responses
+are replayed in small chunks so clients still see a stream.
+
+    RESPONSE_CACHE_ENABLED=0            turn the cache off
+    RESPONSE_CACHE_TTL_SECONDS=3600     entry lifetime
+    RESPONSE_CACHE_MAX_ENTRIES=1000     in-process entry limit
+    RESPONSE_CACHE_MAX_BYTES=33554432   in-process size limit
+    RESPONSE_CACHE_URL=redis://...      optional shared tier (needs the redis package)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REPLAY_CHUNK_CHARS = int(os.environ.get('RESPONSE_CACHE_REPLAY_CHUNK_CHARS', '48'))
+REPLAY_DELAY_MS = float(os.environ.get('RESPONSE_CACHE_REPLAY_DELAY_MS', '5'))
+
+CACHE_REQUESTS = metrics.counter('llm_cache_requests_total', 'LLM response cache lookups by result')
+CACHE_SECONDS_SAVED = metrics.counter(
+    'llm_cache_seconds_saved_total', 'Generation time avoided by serving cached responses')
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text or '').strip()
+
+
+def make_key(namespace, system_prompt, chat_history, message):
+    """Stable hash of everything that determines the model's answer."""
+    payload = json.dumps([
+        namespace,
+        normalize(system_prompt),
+        [[bool(m.get('is_user')), normalize(m.get('content'))] for m in chat_history or []],
+        normalize(message),
+    ], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryCache:
+    """Thread-safe LRU with a TTL and limits on entry count and total bytes."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(entry):
+        return len(entry['text'].encode('utf-8'))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = self._size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= self._size(entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """Shared tier stored as JSON with a server-side expiry."""
+
+    prefix = 'sarkar:llm-cache:'
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key, entry):
+        ttl = max(1, int(entry['expires_at'] - time.time()))
+        self.client.setex(self.prefix + key, ttl, json.dumps(entry))
+
+
+class ResponseCache:
+    def __init__(self, local, shared=None, ttl=3600):
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+
+    def get(self, key):
+        """Return the cached entry (``text``, ``generation_seconds``) or None."""
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"Shared response cache read failed: {e}")
+            if entry is not None:
+                self.local.set(key, entry)
+        CACHE_REQUESTS.inc(result='hit' if entry else 'miss')
+        if entry:
+            CACHE_SECONDS_SAVED.inc(entry['generation_seconds'])
+        return entry
+
+    def set(self, key, text, generation_seconds):
+        if not text:
+            return
+        entry = {
+            'text': text,
+            'generation_seconds': generation_seconds,
+            'expires_at': time.time() + self.ttl,
+        }
+        self.local.set(key, entry)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, entry)
+            except Exception as e:
+                logger.warning(f"Shared response cache write failed: {e}")
+
+
+def _replay_chunks(text):
+    """Split on word boundaries into chunks of about REPLAY_CHUNK_CHARS."""
+    chunk = ''
+    for piece in re.findall(r'\S*\s*', text):
+        chunk += piece
+        if len(chunk) >= REPLAY_CHUNK_CHARS:
+            yield chunk
+            chunk = ''
+    if chunk:
+        yield chunk
+
+
+def replay(text):
+    """Yield a cached response as a paced stream of chunks."""
+    for index, chunk in enumerate(_replay_chunks(text)):
+        if index and REPLAY_DELAY_MS > 0:
+            time.sleep(REPLAY_DELAY_MS / 1000)
+        yield chunk
+
+
+async def areplay(text):
+    for index, chunk in enumerate(_replay_chunks(text)):
+        if index and REPLAY_DELAY_MS > 0:
+            await asyncio.sleep(REPLAY_DELAY_MS / 1000)
+        yield chunk
+
+
+def from_env():
+    """Build the cache described by the environment, or None if disabled."""
+    if os.environ.get('RESPONSE_CACHE_ENABLED', '1') == '0':
+        return None
+    ttl = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '3600'))
+    local = MemoryCache(
+        max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+        max_bytes=int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+    )
+    shared = None
+    url = os.environ.get('RESPONSE_CACHE_URL')
+    if url:
+        try:
+            shared = RedisCache(url)
+        except Exception as e:
+            logger.warning(f"Shared response cache unavailable, using in-process cache only: {e}")
+    return ResponseCache(local, shared, ttl)
@@ -1,14 +1,21 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
-import json
-import asyncio
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response
 import logging
+import threading
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
 from models import User, Chat, Message, PasswordResetToken
-from gemini_chat import generate_chat_response, generate_chat_response_streaming, generate_chat_title
+from gemini_chat import generate_chat_response_streaming, generate_chat_title
 from email_service import send_password_reset_email
+import jobs
+from chat_history import load_context, schedule_summary
+from chat_purge import delete_chats, exceeds_inline_limit, hide_chats
+from search import parse_query, search_messages
+from message_writer import append_message, start_chat
+from database import read_session
+from streaming import FRAMINGS, ResumableStream, StreamWriter, coalesce, get_stream, register_stream
 from datetime import datetime
+from sqlalchemy import and_, func, or_
 
 logger = logging.getLogger(__name__)
 
@@ -175,190 +182,421 @@ def reset_password():
         flash('Failed to reset password. Please try again.', 'error')
         return redirect(url_for('main_routes.reset_password_page') + f'?token={token}')
 
+SIDEBAR_PAGE_SIZE = 50
+SIDEBAR_MAX_PAGE_SIZE = 200
+
+
+def _encode_sidebar_cursor(row):
+    return f"{row.updated_at.isoformat()}|{row.id}"
+
+
+def _decode_sidebar_cursor(cursor):
+    updated_at, chat_id = cursor.rsplit('|', 1)
+    return datetime.fromisoformat(updated_at), int(chat_id)
+
+
+def _sidebar_page(user_id, cursor=None, limit=SIDEBAR_PAGE_SIZE):
+    """Return one page of sidebar entries and the cursor for the next page.
+
+    Title, timestamp and a 51-character slice of the first message come back
+    in a single query, so message bodies are never loaded. Pages are keyset
+    paginated on ``(updated_at, id)``, newest first. Read from the replica when
+    one is configured, so a chat created a moment ago may not be listed yet.
+    """
+    first_message = (
+        db.select(func.substr(Message.content, 1, 51))
+        .where(Message.chat_id == Chat.id)
+        .order_by(Message.id)
+        .limit(1)
+        .correlate(Chat)
+        .scalar_subquery()
+    )
+    query = (
+        db.select(Chat.id, Chat.title, Chat.updated_at, first_message.label('first_message'))
+        .where(Chat.user_id == user_id, Chat.deleted_at.is_(None))
+        .order_by(Chat.updated_at.desc(), Chat.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        updated_at, chat_id = _decode_sidebar_cursor(cursor)
+        query = query.where(or_(
+            Chat.updated_at < updated_at,
+            and_(Chat.updated_at == updated_at, Chat.id < chat_id),
+        ))
+
+    rows = read_session().execute(query).all()
+    next_cursor = _encode_sidebar_cursor(rows[limit - 1]) if len(rows) > limit else None
+    chats = [{
+        'id': row.id,
+        'title': row.title,
+        'preview': Chat.format_preview(row.first_message),
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+    } for row in rows[:limit]]
+    return chats, next_cursor
+
+
 @main_routes.route('/chat')
 @login_required
 def chat():
-    user_chats = Chat.query.filter_by(user_id=current_user.id).order_by(Chat.updated_at.desc()).all()
-    return render_template('chat.html', chats=user_chats)
+    user_chats, next_cursor = _sidebar_page(current_user.id)
+    return render_template('chat.html', chats=user_chats, next_cursor=next_cursor)
+
+
+@main_routes.route('/api/chats')
+@login_required
+def list_chats():
+    cursor = request.args.get('cursor')
+    limit = min(max(request.args.get('limit', SIDEBAR_PAGE_SIZE, type=int), 1), SIDEBAR_MAX_PAGE_SIZE)
+    try:
+        chats, next_cursor = _sidebar_page(current_user.id, cursor, limit)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify({'chats': chats, 'next_cursor': next_cursor})
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+
+
+@main_routes.route('/api/search')
+@login_required
+def search_chats():
+    """Search the user's messages; ``q`` is required.
+
+    Hits come best match first, each with a highlighted snippet. ``offset``
+    pages through them; ``next_offset`` is null on the last page.
+    """
+    terms = parse_query(request.args.get('q'))
+    if not terms:
+        return jsonify({'error': 'q must contain at least one word'}), 400
+    limit = min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_MAX_PAGE_SIZE)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    try:
+        hits, has_more = search_messages(current_user.id, terms, limit, offset)
+    except Exception as e:
+        logger.error(f"Search failed: {e}")
+        db.session.rollback()
+        return jsonify({'error': 'Search failed'}), 500
+    return jsonify({'results': hits, 'next_offset': offset + limit if has_more else None})
+
+@jobs.job('persist_ai_message')
+def _save_ai_message(chat_id: int, content: str):
+    """Insert the AI message and bump the chat. Returns its id, or None if the chat is gone."""
+    return append_message(chat_id, content, is_user=False)
 
 def _persist_ai_message(chat_id: int, content: str):
-    """Persist AI message in background to avoid delaying API response."""
-    from app import app, db
-    from models import Message, Chat
-    from datetime import datetime
+    """Persist AI message in background to avoid delaying API response. Returns its id.
+
+    The first attempt runs inline because the end event carries the message id;
+    it is committed together with other streams' writes (see message_writer.py).
+    If it fails, the write is handed to the job queue to retry with backoff.
+    """
+    from app import app
     with app.app_context():
         try:
-            chat = Chat.query.filter_by(id=chat_id).first()
-            if not chat:
-                return
-            ai_message = Message()
-            ai_message.content = content
-            ai_message.is_user = False
-            ai_message.chat_id = chat.id
-            db.session.add(ai_message)
-            chat.updated_at = datetime.utcnow()
-            db.session.commit()
-        except Exception:
+            return _save_ai_message(chat_id, content)
+        except Exception as e:
+            logger.error(f"Failed to persist AI message, queueing a retry: {e}")
             db.session.rollback()
+    try:
+        jobs.enqueue('persist_ai_message', chat_id=chat_id, content=content)
+    except jobs.QueueFull as e:
+        logger.error(f"AI message for chat {chat_id} lost, job queue full: {e}")
+    return None
+
+
+STREAM_ERROR_TEXT = 'I apologize, but I encountered an error. Please try again.'
+
+
+def _invalid_framing(framing):
+    """Error tuple for an unknown SSE framing, or None if it is valid or absent."""
+    if framing is not None and framing not in FRAMINGS:
+        return {'error': f"framing must be one of: {', '.join(FRAMINGS)}"}, 400
+    return None
+
+
+def _new_turn(chat_id, message, history, framing, user_message_id, refresh_cache=False):
+    return {
+        'chat_id': chat_id,
+        'message': message,
+        'history': history,
+        'framing': framing,
+        'user_message_id': user_message_id,
+        'user_id': current_user.id,
+        'use_cache': not current_user.response_cache_opt_out,
+        'refresh_cache': refresh_cache,
+    }
+
+
+def _begin_chat_turn(data):
+    """Validate a send_message payload, save the user message and return the turn.
+
+    Shared by the WSGI route and the ASGI stream handler. Returns
+    ``(turn, None)`` on success or ``(None, (error_payload, status))``.
+    """
+    message_content = (data or {}).get('message', '').strip()
+    chat_id = (data or {}).get('chat_id')
+    framing = (data or {}).get('framing')
+    
+    if not message_content:
+        return None, ({'error': 'Message cannot be empty'}, 400)
+    
+    if _invalid_framing(framing):
+        return None, _invalid_framing(framing)
+    
+    # Get or create chat, and save the user message. The message is committed
+    # by the message writer, batched with other requests' writes.
+    if chat_id:
+        chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id, deleted_at=None).first()
+        if not chat:
+            return None, ({'error': 'Chat not found'}, 404)
+        chat_id = chat.id
+        # Get chat history BEFORE saving user message
+        chat_history, needs_summary = load_context(chat)
+        # Nothing to write here: end the read and hand the connection back before
+        # waiting on the writer. close() keeps current_user loaded, where commit()
+        # would expire it and cost another SELECT (and checkout) in _new_turn.
+        db.session.close()
+        user_message_id = append_message(chat_id, message_content, is_user=True, touch_chat=False)
+        if user_message_id is None:
+            return None, ({'error': 'Chat not found'}, 404)
+    else:
+        preview = (message_content or '')[:50].strip()
+        # Loading current_user checked out a connection; release it as above
+        db.session.close()
+        chat_id, user_message_id = start_chat(current_user.id, preview if preview else 'New Chat', message_content)
+        chat_history, needs_summary = [], False
+    if needs_summary:
+        schedule_summary(chat_id)
+    
+    return _new_turn(chat_id, message_content, chat_history, framing, user_message_id), None
+
+
+def _begin_retry_turn(data):
+    """Validate a retry payload, truncate after the anchor and return the turn.
+
+    The anchor is the user message to answer again, looked up by id. Older
+    clients that only send ``anchor_user_text`` get the latest user message
+    with that text. Same return convention as ``_begin_chat_turn``.
+    """
+    data = data or {}
+    chat_id = data.get('chat_id')
+    anchor_id = data.get('anchor_message_id')
+    anchor_user_text = (data.get('anchor_user_text') or '').strip()
+    truncate = bool(data.get('truncate', True))
+    framing = data.get('framing')
+    
+    if not chat_id or not (anchor_id or anchor_user_text):
+        return None, ({'error': 'chat_id and anchor_message_id are required'}, 400)
+    
+    if _invalid_framing(framing):
+        return None, _invalid_framing(framing)
+    
+    chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id, deleted_at=None).first()
+    if not chat:
+        return None, ({'error': 'Chat not found'}, 404)
+    
+    anchor_query = Message.query.filter_by(chat_id=chat.id, is_user=True)
+    if anchor_id:
+        try:
+            anchor = anchor_query.filter_by(id=int(anchor_id)).first()
+        except (TypeError, ValueError):
+            return None, ({'error': 'Invalid anchor_message_id'}, 400)
+    else:
+        # The text arrives stripped; rows saved before messages were stripped may not be
+        anchor = (anchor_query.filter(db.func.trim(Message.content, ' \t\r\n') == anchor_user_text)
+                  .order_by(Message.id.desc()).first())
+    
+    if not anchor:
+        return None, ({'error': 'Anchor user message not found'}, 400)
+    
+    # Optionally truncate everything AFTER the anchor, so the conversation restarts from there.
+    # One set-based DELETE over the (chat_id, id) index instead of loading every row.
+    if truncate:
+        db.session.execute(
+            db.delete(Message).where(Message.chat_id == chat.id, Message.id > anchor.id)
+        )
+        if chat.summary_through_id is not None and chat.summary_through_id >= anchor.id:
+            # The summary covers turns that were just deleted
+            chat.summary = None
+            chat.summary_through_id = None
+    
+    # History up to the anchor for model context (without the anchor itself duplicated)
+    chat_history, needs_summary = load_context(chat, before_id=anchor.id)
+    chat.updated_at = datetime.utcnow()
+    # Built before the commit expires current_user and the anchor
+    # A retry wants a new answer, not the cached one it is retrying
+    turn = _new_turn(chat.id, anchor.content, chat_history, framing, anchor.id, refresh_cache=True)
+    db.session.commit()
+    if needs_summary:
+        schedule_summary(turn['chat_id'])
+    
+    return turn, None
+
+
+def _run_stream(stream, turn):
+    """Generate the AI response into ``stream``.
+
+    Runs on its own thread so generation and persistence finish even if the
+    client disconnects; clients follow along through ``stream.events``.
+    """
+    full_response = ""
+    message_id = None
+    try:
+        # Send initial metadata
+        stream.publish('start', chat_id=turn['chat_id'], stream_id=stream.id,
+                       user_message_id=turn['user_message_id'])
+        
+        # Stream AI response, batching tiny chunks into fewer events
+        for chunk in coalesce(generate_chat_response_streaming(turn['message'], turn['history'],
+                                                             use_cache=turn['use_cache'],
+                                                             refresh_cache=turn['refresh_cache'])):
+            full_response += chunk
+            stream.publish('chunk', content=chunk)
+        
+        # Save AI message to database
+        if full_response:
+            message_id = _persist_ai_message(turn['chat_id'], full_response)
+    except Exception as e:
+        logger.error(f"Streaming error: {e}")
+        if not full_response:
+            stream.publish('chunk', content=STREAM_ERROR_TEXT)
+    finally:
+        # Send completion signal
+        stream.publish('end', message_id=message_id)
+
+
+def _stream_response(stream, cursor=0, framing=None):
+    """SSE response that follows ``stream`` from event id ``cursor``."""
+    def generate():
+        writer = StreamWriter(framing)
+        try:
+            for event in stream.events(cursor):
+                yield writer.event(*event)
+        finally:
+            writer.close()
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _start_stream(turn):
+    """Start generating ``turn`` in the background and stream it to this client."""
+    # The turn carries plain values only; hand the connection back to the pool
+    # now rather than when the request context ends
+    db.session.close()
+    stream = ResumableStream(turn['user_id'])
+    register_stream(stream)
+    threading.Thread(target=_run_stream, args=(stream, turn), daemon=True).start()
+    return _stream_response(stream, framing=turn['framing'])
+
+
+def _open_resume(stream_id):
+    """Validate a stream reconnect. Returns ``((stream, cursor, framing), None)`` or an error."""
+    stream = get_stream(stream_id)
+    if not stream or stream.user_id != current_user.id:
+        return None, ({'error': 'Stream not found'}, 404)
+    
+    try:
+        cursor = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id', 0))
+    except ValueError:
+        return None, ({'error': 'Invalid Last-Event-ID'}, 400)
+    
+    framing = request.args.get('framing')
+    if _invalid_framing(framing):
+        return None, _invalid_framing(framing)
+    
+    return (stream, cursor, framing), None
 
 
 @main_routes.route('/api/send_message', methods=['POST'])
 @login_required
 def send_message():
     try:
-        data = request.get_json()
-        message_content = data.get('message', '').strip()
-        chat_id = data.get('chat_id')
-        
-        if not message_content:
-            return jsonify({'error': 'Message cannot be empty'}), 400
-        
-        # Get or create chat
-        if chat_id:
-            chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id).first()
-            if not chat:
-                return jsonify({'error': 'Chat not found'}), 404
-        else:
-            chat = Chat()
-            preview = (message_content or '')[:50].strip()
-            chat.title = preview if preview else 'New Chat'
-            chat.user_id = current_user.id
-            db.session.add(chat)
-            db.session.flush()
-        
-        # Get chat history BEFORE saving user message
-        chat_history = []
-        messages_list = list(chat.messages)
-        recent_messages = messages_list[-10:] if len(messages_list) > 10 else messages_list
-        for msg in recent_messages:
-            chat_history.append({
-                'content': msg.content,
-                'is_user': msg.is_user
-            })
-        
-        # Save user message
-        user_message = Message()
-        user_message.content = message_content
-        user_message.is_user = True
-        user_message.chat_id = chat.id
-        db.session.add(user_message)
-        db.session.commit()
-        
-        # Store chat_id for use in generator
-        current_chat_id = chat.id
+        turn, error = _begin_chat_turn(request.get_json())
+        if error:
+            payload, status = error
+            return jsonify(payload), status
         
-        def generate():
-            full_response = ""
-            try:
-                # Send initial metadata
-                yield f"data: {json.dumps({'type': 'start', 'chat_id': current_chat_id})}\n\n"
-                
-                # Stream AI response
-                for chunk in generate_chat_response_streaming(message_content, chat_history):
-                    if chunk:
-                        full_response += chunk
-                        yield f"data: {json.dumps({'type': 'chunk', 'content': chunk})}\n\n"
-                
-                # Save AI message to database
-                if full_response:
-                    ai_message = Message()
-                    ai_message.content = full_response
-                    ai_message.is_user = False
-                    ai_message.chat_id = current_chat_id
-                    db.session.add(ai_message)
-                    chat.updated_at = datetime.utcnow()
-                    db.session.commit()
-                
-                # Send completion signal
-                yield f"data: {json.dumps({'type': 'end'})}\n\n"
-            except Exception as e:
-                logger.error(f"Streaming error: {e}")
-                if not full_response:
-                    yield f"data: {json.dumps({'type': 'chunk', 'content': 'I apologize, but I encountered an error. Please try again.'})}\n\n"
-                yield f"data: {json.dumps({'type': 'end'})}\n\n"
-        
-        response = Response(stream_with_context(generate()), mimetype='text/event-stream')
-        response.headers['Cache-Control'] = 'no-cache'
-        response.headers['X-Accel-Buffering'] = 'no'
-        return response
+        return _start_stream(turn)
         
     except Exception as e:
         logger.error(f"Send message error: {e}")
         db.session.rollback()
         return jsonify({'error': 'Failed to send message'}), 500
 
+
+@main_routes.route('/api/stream/<stream_id>')
+@login_required
+def resume_stream(stream_id):
+    """Reconnect to a response stream, replaying events after Last-Event-ID."""
+    resume, error = _open_resume(stream_id)
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+    stream, cursor, framing = resume
+    return _stream_response(stream, cursor, framing)
+
 @main_routes.route('/api/retry', methods=['POST'])
 @login_required
 def retry_from_point():
+    """Answer an earlier user message again, streamed like send_message."""
     try:
-        data = request.get_json()
-        chat_id = data.get('chat_id')
-        anchor_user_text = (data.get('anchor_user_text') or '').strip()
-        truncate = bool(data.get('truncate', True))
-
-        if not chat_id or not anchor_user_text:
-            return jsonify({'error': 'chat_id and anchor_user_text are required'}), 400
-
-        chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id).first()
-        if not chat:
-            return jsonify({'error': 'Chat not found'}), 404
-
-        # Locate the anchor: the last user message whose content matches
-        messages_list = list(chat.messages)
-        anchor_index = -1
-        for i in range(len(messages_list) - 1, -1, -1):
-            m = messages_list[i]
-            if m.is_user and (m.content or '').strip() == anchor_user_text:
-                anchor_index = i
-                break
-
-        if anchor_index == -1:
-            return jsonify({'error': 'Anchor user message not found'}), 400
-
-        # Optionally truncate everything AFTER the anchor in DB, so the conversation restarts from there
-        if truncate:
-            for j in range(len(messages_list) - 1, anchor_index, -1):
-                db.session.delete(messages_list[j])
-
-        # Build history up to the anchor for model context (without the anchor user text itself duplicated)
-        slice_upto = messages_list[:anchor_index]
-        recent = slice_upto[-10:] if len(slice_upto) > 10 else slice_upto
-        chat_history = [{ 'content': m.content, 'is_user': m.is_user } for m in recent]
-
-        # Generate AI response based on the anchor user text and prior context
-        ai_response = generate_chat_response(anchor_user_text, chat_history)
-
-        ai_message = Message()
-        ai_message.content = ai_response
-        ai_message.is_user = False
-        ai_message.chat_id = chat.id
-        db.session.add(ai_message)
-
-        chat.updated_at = datetime.utcnow()
-        db.session.commit()
-
-        return jsonify({
-            'ai_message': {
-                'id': ai_message.id,
-                'content': ai_message.content,
-                'is_user': False,
-                'created_at': ai_message.created_at.isoformat()
-            },
-            'chat_id': chat.id
-        })
-    except Exception:
+        turn, error = _begin_retry_turn(request.get_json())
+        if error:
+            payload, status = error
+            return jsonify(payload), status
+        
+        return _start_stream(turn)
+    except Exception as e:
+        logger.error(f"Retry error: {e}")
         db.session.rollback()
         return jsonify({'error': 'Failed to retry from point'}), 500
 
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_MAX_PAGE_SIZE = 200
+
+
 @main_routes.route('/api/get_chat/<int:chat_id>')
 @login_required
 def get_chat(chat_id):
-    chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id).first()
+    """Return a chat with one page of its messages, oldest first.
+
+    Without a cursor the newest ``limit`` messages are returned. ``before=<id>``
+    pages backwards through older messages and ``after=<id>`` forwards through
+    newer ones; ``next_before`` / ``next_after`` hold the cursor for the next
+    page in that direction, or null once there is nothing left.
+
+    Reads the primary, never the replica: the client fetches a chat right after
+    send_message, and a lagging replica would answer 404 or miss the new messages.
+    """
+    chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id, deleted_at=None).first()
     if not chat:
         return jsonify({'error': 'Chat not found'}), 404
     
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    limit = min(max(request.args.get('limit', MESSAGE_PAGE_SIZE, type=int), 1), MESSAGE_MAX_PAGE_SIZE)
+    if before is not None and after is not None:
+        return jsonify({'error': 'Use either before or after, not both'}), 400
+    
+    # Both directions walk the (chat_id, id) index and stop after limit + 1 rows
+    query = Message.query.filter(Message.chat_id == chat.id)
+    if after is not None:
+        page = query.filter(Message.id > after).order_by(Message.id.asc()).limit(limit + 1).all()
+        has_more = len(page) > limit
+        page = page[:limit]
+    else:
+        if before is not None:
+            query = query.filter(Message.id < before)
+        page = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more = len(page) > limit
+        page = list(reversed(page[:limit]))
+    
     messages = []
-    for message in chat.messages:
+    for message in page:
         messages.append({
             'id': message.id,
             'content': message.content,
@@ -366,12 +604,21 @@ def get_chat(chat_id):
             'created_at': message.created_at.isoformat()
         })
     
+    next_before = next_after = None
+    if has_more and page:
+        if after is not None:
+            next_after = page[-1].id
+        else:
+            next_before = page[0].id
+    
     return jsonify({
         'chat': {
             'id': chat.id,
             'title': chat.title,
             'created_at': chat.created_at.isoformat(),
-            'messages': messages
+            'messages': messages,
+            'next_before': next_before,
+            'next_after': next_after
         }
     })
 
@@ -397,38 +644,69 @@ def new_chat():
         db.session.rollback()
         return jsonify({'error': 'Failed to create new chat'}), 500
 
+def _delete_chats(chat_ids, error_message):
+    """Delete the user's chats inline, or hide them and queue the purge when they are large.
+
+    Small deletes respond 200. Large ones respond 202 with the purge job id.
+    """
+    user_id = current_user.id
+    try:
+        if not exceeds_inline_limit(user_id, chat_ids):
+            delete_chats(user_id, chat_ids)
+            db.session.commit()
+            return jsonify({'success': True})
+        hide_chats(user_id, chat_ids)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': error_message}), 500
+
+    try:
+        job_id = jobs.enqueue('purge_chats', owner_id=user_id, user_id=user_id)
+    except jobs.QueueFull as e:
+        # The chats are already gone for the user; the user's next delete or
+        # the sweep_hidden_chats job purges them
+        logger.error(f"Chat purge for user {user_id} not queued: {e}")
+        job_id = None
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
 @main_routes.route('/api/delete_chat/<int:chat_id>', methods=['DELETE'])
 @login_required
 def delete_chat(chat_id):
-    chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id).first()
+    chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id, deleted_at=None).first()
     if not chat:
         return jsonify({'error': 'Chat not found'}), 404
-    
-    try:
-        db.session.delete(chat)
-        db.session.commit()
-        return jsonify({'success': True})
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'Failed to delete chat'}), 500
+    return _delete_chats([chat.id], 'Failed to delete chat')
 
 @main_routes.route('/api/delete_all_chats', methods=['DELETE'])
 @login_required
 def delete_all_chats():
+    """Delete every chat of the user, with any hidden chats left from an earlier purge."""
+    return _delete_chats(None, 'Failed to delete all chats')
+
+@jobs.job('retitle_chat')
+def _retitle_chat(chat_id: int, first_message: str):
+    """Generate a concise title with the model and save it. Runs on the job queue."""
     try:
-        chats = Chat.query.filter_by(user_id=current_user.id).all()
-        for chat in chats:
-            db.session.delete(chat)
-        db.session.commit()
-        return jsonify({'success': True})
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'Failed to delete all chats'}), 500
+        title = generate_chat_title(first_message)
+        title = (title or '').strip() or 'New Chat'
+    except Exception:
+        title = (first_message[:50].strip() or 'New Chat')
+
+    chat = Chat.query.filter_by(id=chat_id, deleted_at=None).first()
+    if not chat:
+        return None
+    chat.title = title
+    db.session.commit()
+    return {'title': title}
 
 @main_routes.route('/api/retitle_chat', methods=['POST'])
 @login_required
 def retitle_chat_async():
-    """Generate a better chat title asynchronously without affecting first response latency."""
+    """Queue a better chat title without affecting first response latency.
+
+    Responds 202 with a job id; poll /api/jobs/<job_id> for the new title.
+    """
     try:
         data = request.get_json()
         chat_id = data.get('chat_id')
@@ -437,25 +715,27 @@ def retitle_chat_async():
         if not chat_id or not first_message:
             return jsonify({'error': 'chat_id and first_message are required'}), 400
 
-        chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id).first()
+        chat = Chat.query.filter_by(id=chat_id, user_id=current_user.id, deleted_at=None).first()
         if not chat:
             return jsonify({'error': 'Chat not found'}), 404
 
-        # Generate a concise title using the model (runs after initial response)
-        try:
-            title = generate_chat_title(first_message)
-            title = (title or '').strip() or 'New Chat'
-        except Exception:
-            title = (first_message[:50].strip() or 'New Chat')
-
-        chat.title = title
-        db.session.commit()
-
-        return jsonify({'success': True, 'title': title})
+        job_id = jobs.enqueue('retitle_chat', owner_id=current_user.id,
+                              chat_id=chat.id, first_message=first_message)
+        return jsonify({'success': True, 'job_id': job_id, 'title': chat.title}), 202
+    except jobs.QueueFull:
+        return jsonify({'error': 'Server is busy, try again shortly'}), 503
     except Exception:
         db.session.rollback()
         return jsonify({'error': 'Failed to retitle chat'}), 500
 
+@main_routes.route('/api/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    job = jobs.get_job(job_id)
+    if not job or job.owner_id != current_user.id:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
 @main_routes.route('/api/update_profile', methods=['POST'])
 @login_required
 def update_profile():
@@ -465,6 +745,7 @@ def update_profile():
         current_password = data.get('current_password', '')
         new_password = data.get('new_password', '')
         theme_preference = data.get('theme_preference', 'light')
+        response_cache_opt_out = data.get('response_cache_opt_out')
         
         # Update display name
         if display_name:
@@ -474,6 +755,10 @@ def update_profile():
         if theme_preference in ['light', 'dark']:
             current_user.theme_preference = theme_preference
         
+        # Update response cache preference
+        if isinstance(response_cache_opt_out, bool):
+            current_user.response_cache_opt_out = response_cache_opt_out
+        
         # Update password if provided
         if new_password:
             if not current_password:
@@ -492,7 +777,8 @@ def update_profile():
             'success': True,
             'user': {
                 'display_name': current_user.get_display_name(),
-                'theme_preference': current_user.theme_preference
+                'theme_preference': current_user.theme_preference,
+                'response_cache_opt_out': current_user.response_cache_opt_out
             }
         })
         
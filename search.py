@@ -0,0 +1,119 @@
+"""Full-text search over a user's messages.
+
+The index lives in the database and is updated in the same transaction as the
+message write, whichever code path writes it (send_message, retries, the
+persist job, chat deletes):
+
+- SQLite: ``message_fts``, an FTS5 table over ``message.content`` and the
+  owning user, kept in step by insert/update/delete triggers on ``message``.
+  Queries only look at the user's own rows, ranked by bm25.
+- PostgreSQL: a GIN expression index on ``PG_DOCUMENT``, which Postgres
+  maintains itself. Results are ranked by ts_rank.
+
+Both are created by migration 5. A query matches messages containing every
+word in it, the last one as a prefix, so results keep up while the user types.
+Snippets mark matches with ``<mark>``; everything else in them is escaped.
+
+    SEARCH_SNIPPET_WORDS=16
+"""
+import os
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import DateTime, text
+
+from app import db
+from database import read_session
+
+SNIPPET_WORDS = min(int(os.environ.get('SEARCH_SNIPPET_WORDS', '16')), 64)
+MAX_TERMS = 16
+
+# Text search configuration and document expression of the Postgres index; a
+# query only uses the index if it repeats the expression exactly. The cap keeps
+# to_tsvector under its 1MB limit, which would otherwise fail the insert.
+PG_CONFIG = 'english'
+PG_DOCUMENT = f"to_tsvector('{PG_CONFIG}', left(content, 100000))"
+
+# Match delimiters in raw snippets, swapped for <mark> after escaping
+_START, _STOP = '\x02', '\x03'
+
+_WORD = re.compile(r'\w+')
+
+_SQLITE_SEARCH = text(f"""
+    SELECT m.id, m.chat_id, m.is_user, m.created_at, c.title,
+           snippet(message_fts, 0, char(2), char(3), '…', {SNIPPET_WORDS}) AS snippet
+    FROM message_fts
+    JOIN message m ON m.id = message_fts.rowid
+    JOIN chat c ON c.id = m.chat_id
+    WHERE message_fts MATCH :query AND c.user_id = :user_id AND c.deleted_at IS NULL
+    ORDER BY bm25(message_fts, 1.0, 0.0), m.id DESC
+    LIMIT :limit OFFSET :offset
+""").columns(created_at=DateTime)
+
+_PG_HEADLINE_OPTIONS = (f"StartSel={_START}, StopSel={_STOP}, MaxWords={SNIPPET_WORDS}, "
+                        f"MinWords={max(SNIPPET_WORDS // 2, 1)}, MaxFragments=1, FragmentDelimiter=…")
+
+# Ranks inside, so ts_headline only runs on the page that is returned
+_PG_SEARCH = text(f"""
+    SELECT hit.id, hit.chat_id, hit.is_user, hit.created_at, hit.title,
+           ts_headline('{PG_CONFIG}', hit.content, to_tsquery('{PG_CONFIG}', :query), :options) AS snippet
+    FROM (
+        SELECT m.id, m.chat_id, m.is_user, m.created_at, m.content, c.title,
+               ts_rank({PG_DOCUMENT}, to_tsquery('{PG_CONFIG}', :query)) AS rank
+        FROM message m
+        JOIN chat c ON c.id = m.chat_id
+        WHERE {PG_DOCUMENT} @@ to_tsquery('{PG_CONFIG}', :query)
+          AND c.user_id = :user_id AND c.deleted_at IS NULL
+        ORDER BY rank DESC, m.id DESC
+        LIMIT :limit OFFSET :offset
+    ) AS hit
+    ORDER BY hit.rank DESC, hit.id DESC
+""").columns(created_at=DateTime)
+
+
+def parse_query(raw):
+    """Words of ``raw`` (at most MAX_TERMS), or an empty list if there are none."""
+    return _WORD.findall(raw or '')[:MAX_TERMS]
+
+
+def _sqlite_query(user_id, terms):
+    # Quoted so FTS5 operators in the input are taken as words
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return f'owner : "u{user_id}" AND content : ({" ".join(quoted)})'
+
+
+def _pg_query(terms):
+    # \w+ words contain none of to_tsquery's operators
+    return ' & '.join(terms) + ':*'
+
+
+def highlight(snippet):
+    """Escape a raw snippet and turn its match delimiters into <mark> tags."""
+    escaped = str(escape(snippet or ''))
+    return Markup(escaped.replace(_START, '<mark>').replace(_STOP, '</mark>'))
+
+
+def search_messages(user_id, terms, limit, offset=0):
+    """One page of the user's messages matching every term, best first.
+
+    Returns ``(hits, has_more)``.
+    """
+    params = {'user_id': user_id, 'limit': limit + 1, 'offset': offset}
+    if db.engine.dialect.name == 'postgresql':
+        statement = _PG_SEARCH
+        params.update(query=_pg_query(terms), options=_PG_HEADLINE_OPTIONS)
+    else:
+        statement = _SQLITE_SEARCH
+        params.update(query=_sqlite_query(user_id, terms))
+    # Search tolerates replica lag: a message sent a moment ago may be missing
+    rows = read_session().execute(statement, params).all()
+    hits = [{
+        'message_id': row.id,
+        'chat_id': row.chat_id,
+        'chat_title': row.title,
+        'is_user': bool(row.is_user),
+        'created_at': row.created_at.isoformat(),
+        'snippet': str(highlight(row.snippet)),
+    } for row in rows[:limit]]
+    return hits, len(rows) > limit
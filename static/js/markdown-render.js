@@ -0,0 +1,157 @@
+// SARKAR AI - Markdown rendering for chat messages
+// Shared by the chat page and benchmarks/markdown_render.html.
+
+const MARKDOWN_SANITIZE_OPTIONS = {
+    ALLOWED_TAGS: ['p', 'br', 'strong', 'em', 'u', 'del', 's', 'code', 'pre', 'blockquote', 'ul', 'ol', 'li', 'a', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'thead', 'tbody', 'tr', 'th', 'td', 'div', 'span', 'hr', 'sup', 'sub', 'kbd', 'mark', 'dl', 'dt', 'dd', 'i', 'button'],
+    ALLOWED_ATTR: ['class', 'href', 'target', 'rel', 'src', 'alt', 'title', 'data-action'],
+    ALLOWED_URI_REGEXP: /^(?:(?:(?:f|ht)tps?|mailto|tel|callto|sms|cid|xmpp):|[^a-z]|[a-z+.\-]+(?:[^a-z+.\-:]|$))/i,
+    ALLOW_DATA_ATTR: false,
+    FORBID_TAGS: ['iframe', 'object', 'embed', 'base', 'link', 'meta', 'script', 'style'],
+    FORBID_ATTR: ['onerror', 'onload', 'onclick', 'onmouseover']
+};
+
+let markedConfigured = false;
+
+// Configure marked once instead of rebuilding the renderer on every call
+function configureMarked() {
+    if (markedConfigured) return;
+
+    // Custom renderer for code blocks with copy button
+    const renderer = new marked.Renderer();
+
+    renderer.code = function(code, language) {
+        const langName = language || 'text';
+        const validLang = hljs.getLanguage(langName) ? langName : 'plaintext';
+        const highlighted = hljs.highlight(code, { language: validLang }).value;
+
+        return `
+            <div class="codeblock-wrapper">
+                <div class="codeblock-header">
+                    <span class="codeblock-lang">${langName}</span>
+                    <button class="codeblock-copy" data-action="copy-code">
+                        <i class="fas fa-copy"></i> Copy
+                    </button>
+                </div>
+                <pre><code class="hljs language-${validLang}">${highlighted}</code></pre>
+            </div>
+        `;
+    };
+
+    marked.setOptions({
+        renderer: renderer,
+        breaks: true,
+        gfm: true,
+        headerIds: false,
+        mangle: false
+    });
+    markedConfigured = true;
+}
+
+function renderMarkdown(text) {
+    if (!text) return '';
+
+    if (typeof marked !== 'undefined' && typeof hljs !== 'undefined') {
+        configureMarked();
+
+        try {
+            let html = marked.parse(text);
+            // Sanitize HTML to prevent XSS attacks
+            if (typeof DOMPurify !== 'undefined') {
+                html = DOMPurify.sanitize(html, MARKDOWN_SANITIZE_OPTIONS);
+            }
+            return html;
+        } catch (e) {
+            console.error('Markdown parsing error:', e);
+            return escapeHtml(text).replace(/\n/g, '<br>');
+        }
+    }
+
+    return escapeHtml(text).replace(/\n/g, '<br>');
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+// Offset into `source` up to which top-level blocks are complete.
+// Every block before the last non-blank one is finished: later text can only
+// extend or change the final block, never an earlier one.
+function completedBlocksLength(source) {
+    if (typeof marked === 'undefined' || !marked.lexer) return 0;
+    let tokens;
+    try {
+        tokens = marked.lexer(source);
+    } catch (e) {
+        return 0;
+    }
+
+    let lastBlock = tokens.length - 1;
+    while (lastBlock >= 0 && tokens[lastBlock].type === 'space') lastBlock--;
+
+    let length = 0;
+    for (let i = 0; i < lastBlock; i++) {
+        length += tokens[i].raw.length;
+    }
+    return length;
+}
+
+// Renders a streamed response without re-parsing it from the start each time.
+// Finished blocks are rendered once and appended; only the trailing, still
+// growing block is re-rendered, at most once per animation frame.
+class IncrementalMarkdownRenderer {
+    constructor(container) {
+        this.container = container;
+        this.frame = null;
+        this.reset('');
+    }
+
+    // Discard what was rendered and start over from `text`
+    reset(text) {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        this.container.innerHTML = '';
+        this.tail = document.createElement('div');
+        this.tail.className = 'markdown-tail';
+        this.tail.style.display = 'contents';
+        this.container.appendChild(this.tail);
+        this.text = '';
+        this.committed = 0;
+        this.append(text);
+    }
+
+    append(chunk) {
+        if (!chunk) return;
+        this.text += chunk;
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => {
+                this.frame = null;
+                this.render();
+            });
+        }
+    }
+
+    render() {
+        const pending = this.text.slice(this.committed);
+        const done = completedBlocksLength(pending);
+        if (done > 0) {
+            this.tail.insertAdjacentHTML('beforebegin', renderMarkdown(pending.slice(0, done)));
+            this.committed += done;
+        }
+        this.tail.innerHTML = renderMarkdown(this.text.slice(this.committed));
+    }
+
+    // Render whatever is left synchronously and drop the tail wrapper
+    finish() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        this.render();
+        this.tail.replaceWith(...this.tail.childNodes);
+        return this.text;
+    }
+}
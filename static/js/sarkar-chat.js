@@ -1,4 +1,5 @@
 // SARKAR AI - Modern Chat Interface JavaScript
+// Markdown rendering lives in markdown-render.js, loaded before this file.
 document.addEventListener('DOMContentLoaded', function () {
     initializeSarkarInterface();
 });
@@ -7,69 +8,6 @@ let currentChatId = null;
 let isLoading = false;
 let sidebarExpanded = false;
 
-function renderMarkdown(text) {
-    if (!text) return '';
-    
-    if (typeof marked !== 'undefined' && typeof hljs !== 'undefined') {
-        // Custom renderer for code blocks with copy button
-        const renderer = new marked.Renderer();
-        const originalCodeRenderer = renderer.code.bind(renderer);
-        
-        renderer.code = function(code, language) {
-            const langName = language || 'text';
-            const validLang = hljs.getLanguage(langName) ? langName : 'plaintext';
-            const highlighted = hljs.highlight(code, { language: validLang }).value;
-            
-            return `
-                <div class="codeblock-wrapper">
-                    <div class="codeblock-header">
-                        <span class="codeblock-lang">${langName}</span>
-                        <button class="codeblock-copy" data-action="copy-code">
-                            <i class="fas fa-copy"></i> Copy
-                        </button>
-                    </div>
-                    <pre><code class="hljs language-${validLang}">${highlighted}</code></pre>
-                </div>
-            `;
-        };
-        
-        marked.setOptions({
-            renderer: renderer,
-            breaks: true,
-            gfm: true,
-            headerIds: false,
-            mangle: false
-        });
-        
-        try {
-            let html = marked.parse(text);
-            // Sanitize HTML to prevent XSS attacks
-            if (typeof DOMPurify !== 'undefined') {
-                html = DOMPurify.sanitize(html, {
-                    ALLOWED_TAGS: ['p', 'br', 'strong', 'em', 'u', 'del', 's', 'code', 'pre', 'blockquote', 'ul', 'ol', 'li', 'a', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'thead', 'tbody', 'tr', 'th', 'td', 'div', 'span', 'hr', 'sup', 'sub', 'kbd', 'mark', 'dl', 'dt', 'dd', 'i', 'button'],
-                    ALLOWED_ATTR: ['class', 'href', 'target', 'rel', 'src', 'alt', 'title', 'data-action'],
-                    ALLOWED_URI_REGEXP: /^(?:(?:(?:f|ht)tps?|mailto|tel|callto|sms|cid|xmpp):|[^a-z]|[a-z+.\-]+(?:[^a-z+.\-:]|$))/i,
-                    ALLOW_DATA_ATTR: false,
-                    FORBID_TAGS: ['iframe', 'object', 'embed', 'base', 'link', 'meta', 'script', 'style'],
-                    FORBID_ATTR: ['onerror', 'onload', 'onclick', 'onmouseover']
-                });
-            }
-            return html;
-        } catch (e) {
-            console.error('Markdown parsing error:', e);
-            return escapeHtml(text).replace(/\n/g, '<br>');
-        }
-    }
-    
-    return escapeHtml(text).replace(/\n/g, '<br>');
-}
-
-function escapeHtml(text) {
-    const div = document.createElement('div');
-    div.textContent = text;
-    return div.innerHTML;
-}
-
 // Event delegation for copy code blocks - hardened to prevent abuse
 document.addEventListener('click', function(e) {
     const copyButton = e.target.closest('[data-action="copy-code"]');
@@ -175,6 +113,9 @@ function initializeSarkarInterface() {
     // Setup enhanced scroll detection
     setupScrollDetection();
 
+    // Page in older chats as the history panel scrolls
+    setupChatHistoryPaging();
+
     // Restore last opened chat and view (prevents welcome flicker on refresh)
     const storedChatId = getLastChatId();
     const storedView = getLastView();
@@ -578,6 +519,107 @@ function closePanels() {
     hideProfileDropdown();
 }
 
+// Chunks are requested with compact framing: raw text in data lines, with
+// only the start/end events named and JSON encoded
+const STREAM_FRAMING = 'compact';
+
+// Parse one SSE event block into {type, ...}; handles both json and compact framing
+function parseStreamEvent(block) {
+    let eventType = null;
+    let eventId = null;
+    const dataLines = [];
+    for (const line of block.split('\n')) {
+        if (line.startsWith('id:')) {
+            eventId = parseInt(line.slice(3), 10);
+        } else if (line.startsWith('event:')) {
+            eventType = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            const value = line.slice(5);
+            dataLines.push(value.startsWith(' ') ? value.slice(1) : value);
+        }
+    }
+    if (!dataLines.length) return null;
+
+    const data = dataLines.join('\n');
+    let event;
+    if (eventType) {
+        event = { type: eventType, ...(data ? JSON.parse(data) : {}) };
+    } else if (STREAM_FRAMING === 'compact') {
+        event = { type: 'chunk', content: data };
+    } else {
+        event = JSON.parse(data);
+    }
+    event.id = eventId;
+    return event;
+}
+
+const STREAM_RESUME_ATTEMPTS = 5;
+
+// Read an SSE response until it ends, remembering the stream id and last event id
+async function readStream(response, state, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop();
+        
+        for (const block of blocks) {
+            const data = parseStreamEvent(block);
+            if (!data) continue;
+            if (data.id !== null) state.lastEventId = data.id;
+            if (data.type === 'start' && data.stream_id) state.streamId = data.stream_id;
+            if (data.type === 'end') state.ended = true;
+            await onEvent(data);
+        }
+    }
+}
+
+// Follow a response stream, reconnecting with Last-Event-ID if the connection
+// drops before the end event; the server replays whatever was missed
+async function followStream(response, onEvent) {
+    const state = { streamId: null, lastEventId: 0, ended: false };
+    for (let attempt = 0; ; attempt++) {
+        try {
+            await readStream(response, state, onEvent);
+        } catch (error) {
+            if (!state.streamId || attempt >= STREAM_RESUME_ATTEMPTS) throw error;
+        }
+        if (state.ended) return;
+        if (!state.streamId || attempt >= STREAM_RESUME_ATTEMPTS) {
+            throw new Error('Stream interrupted');
+        }
+
+        await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+        response = await fetch(`/api/stream/${state.streamId}?framing=${STREAM_FRAMING}`, {
+            headers: { 'Last-Event-ID': String(state.lastEventId) }
+        });
+        if (!response.ok) {
+            throw new Error('Failed to resume stream');
+        }
+    }
+}
+
+const JOB_POLL_ATTEMPTS = 20;
+
+// Poll a background job until it finishes; resolves with the job or null
+async function waitForJob(jobId) {
+    for (let attempt = 0; attempt < JOB_POLL_ATTEMPTS; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, Math.min(250 * 2 ** attempt, 2000)));
+        const response = await fetch(`/api/jobs/${jobId}`);
+        if (!response.ok) return null;
+        const job = await response.json();
+        if (job.status === 'done' || job.status === 'failed') return job;
+    }
+    return null;
+}
+
 async function sendMessage(message) {
     if (!message || isLoading) return;
 
@@ -596,7 +638,7 @@ async function sendMessage(message) {
     switchToChatView();
 
     // Add user message to UI
-    addMessageToUI(message, true);
+    const userMessageDiv = addMessageToUI(message, true);
 
     // Create placeholder for streaming AI response
     const messagesList = document.getElementById('messagesList');
@@ -624,7 +666,8 @@ async function sendMessage(message) {
             },
             body: JSON.stringify({
                 message: message,
-                chat_id: currentChatId
+                chat_id: currentChatId,
+                framing: STREAM_FRAMING
             })
         });
 
@@ -632,70 +675,60 @@ async function sendMessage(message) {
             throw new Error('Failed to send message');
         }
 
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = '';
-        let accumulatedText = '';
+        const markdown = new IncrementalMarkdownRenderer(messageText);
 
-        while (true) {
-            const { done, value } = await reader.read();
-            
-            if (done) break;
-            
-            buffer += decoder.decode(value, { stream: true });
-            const lines = buffer.split('\n\n');
-            buffer = lines.pop();
-            
-            for (const line of lines) {
-                if (line.startsWith('data: ')) {
-                    const data = JSON.parse(line.slice(6));
+        await followStream(response, async (data) => {
+            if (data.type === 'start') {
+                if (userMessageDiv && data.user_message_id) {
+                    userMessageDiv.dataset.messageId = String(data.user_message_id);
+                }
+                if (!currentChatId) {
+                    currentChatId = data.chat_id;
+                    setLastChatId(currentChatId);
+                    await ensureChatInHistory(currentChatId);
                     
-                    if (data.type === 'start') {
-                        if (!currentChatId) {
-                            currentChatId = data.chat_id;
-                            setLastChatId(currentChatId);
-                            await ensureChatInHistory(currentChatId);
-                            
-                            // Request better title
-                            fetch('/api/retitle_chat', {
-                                method: 'POST',
-                                headers: { 'Content-Type': 'application/json' },
-                                body: JSON.stringify({ chat_id: currentChatId, first_message: message })
-                            }).then(r => r.json()).then(res => {
-                                if (res && res.title) {
-                                    const item = document.querySelector(`.chat-history-item[data-chat-id="${currentChatId}"] .chat-title`);
-                                    if (item) item.textContent = res.title;
-                                }
-                            }).catch(() => {});
+                    // Request better title; it is generated by a background job
+                    const titledChatId = currentChatId;
+                    fetch('/api/retitle_chat', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ chat_id: titledChatId, first_message: message })
+                    }).then(r => r.json()).then(res => res && res.job_id ? waitForJob(res.job_id) : null).then(job => {
+                        if (job && job.result && job.result.title) {
+                            const item = document.querySelector(`.chat-history-item[data-chat-id="${titledChatId}"] .chat-title`);
+                            if (item) item.textContent = job.result.title;
                         }
-                    } else if (data.type === 'chunk') {
-                        accumulatedText += data.content;
-                        messageText.innerHTML = renderMarkdown(accumulatedText);
-                        scrollToBottom();
-                    } else if (data.type === 'end') {
-                        aiMessageDiv.classList.remove('streaming');
-                        
-                        // Final markdown render
-                        messageText.innerHTML = renderMarkdown(accumulatedText);
-                        
-                        // Add action bar
-                        const actionBar = document.createElement('div');
-                        actionBar.className = 'message-action-bar';
-                        actionBar.innerHTML = `
-                            <button class="action-btn copy-btn" title="Copy"><i class="fas fa-copy"></i></button>
-                            <button class="action-btn thumbs-up-btn" title="Thumbs Up"><i class="fas fa-thumbs-up"></i></button>
-                            <button class="action-btn thumbs-down-btn" title="Thumbs Down"><i class="fas fa-thumbs-down"></i></button>
-                            <button class="action-btn retry-btn" title="Retry"><i class="fas fa-redo"></i></button>
-                        `;
-                        messageContent.appendChild(actionBar);
-                        
-                        const feedback = document.createElement('div');
-                        feedback.className = 'message-feedback';
-                        messageContent.appendChild(feedback);
-                    }
+                    }).catch(() => {});
                 }
+            } else if (data.type === 'chunk') {
+                markdown.append(data.content);
+                scrollToBottom();
+            } else if (data.type === 'snapshot') {
+                // Resumed after the server dropped old chunks: start from its copy
+                markdown.reset(data.content);
+            } else if (data.type === 'end') {
+                aiMessageDiv.classList.remove('streaming');
+                if (data.message_id) aiMessageDiv.dataset.messageId = String(data.message_id);
+                
+                // Final markdown render
+                markdown.finish();
+                
+                // Add action bar
+                const actionBar = document.createElement('div');
+                actionBar.className = 'message-action-bar';
+                actionBar.innerHTML = `
+                    <button class="action-btn copy-btn" title="Copy"><i class="fas fa-copy"></i></button>
+                    <button class="action-btn thumbs-up-btn" title="Thumbs Up"><i class="fas fa-thumbs-up"></i></button>
+                    <button class="action-btn thumbs-down-btn" title="Thumbs Down"><i class="fas fa-thumbs-down"></i></button>
+                    <button class="action-btn retry-btn" title="Retry"><i class="fas fa-redo"></i></button>
+                `;
+                messageContent.appendChild(actionBar);
+                
+                const feedback = document.createElement('div');
+                feedback.className = 'message-feedback';
+                messageContent.appendChild(feedback);
             }
-        }
+        });
 
     } catch (error) {
         console.error('Error sending message:', error);
@@ -712,37 +745,49 @@ async function sendMessage(message) {
     }
 }
 
+// Build a sidebar entry; mirrors the server-rendered markup in chat.html
+function createChatHistoryItem(chat) {
+    const item = document.createElement('div');
+    item.className = 'chat-history-item';
+    item.dataset.chatId = String(chat.id);
+    const titleDiv = document.createElement('div');
+    titleDiv.className = 'chat-title';
+    titleDiv.textContent = chat.title || 'New Chat';
+    const previewDiv = document.createElement('div');
+    previewDiv.className = 'chat-preview';
+    previewDiv.textContent = chat.preview || '';
+    const delBtn = document.createElement('button');
+    delBtn.className = 'delete-chat-btn';
+    delBtn.dataset.chatId = String(chat.id);
+    delBtn.title = 'Delete';
+    delBtn.innerHTML = '<i class="fas fa-trash"></i>';
+
+    item.appendChild(titleDiv);
+    item.appendChild(previewDiv);
+    item.appendChild(delBtn);
+    return item;
+}
+
 // Ensure a chat exists in the sidebar history; if not, fetch and prepend
 async function ensureChatInHistory(chatId) {
     if (!chatId) return;
     const existing = document.querySelector(`.chat-history-item[data-chat-id="${chatId}"]`);
     if (existing) return;
     try {
-        const response = await fetch(`/api/get_chat/${chatId}`);
+        // after=0&limit=1 fetches just the first message for the preview
+        const response = await fetch(`/api/get_chat/${chatId}?after=0&limit=1`);
         const data = await response.json();
         if (!response.ok || !data || !data.chat) return;
         const chatsList = document.getElementById('chatsList');
         if (!chatsList) return;
 
-        const item = document.createElement('div');
-        item.className = 'chat-history-item active';
-        item.dataset.chatId = String(data.chat.id);
-        const titleDiv = document.createElement('div');
-        titleDiv.className = 'chat-title';
-        titleDiv.textContent = data.chat.title || 'New Chat';
-        const previewDiv = document.createElement('div');
-        previewDiv.className = 'chat-preview';
         const firstMessage = (data.chat.messages && data.chat.messages[0] && data.chat.messages[0].content) || '';
-        previewDiv.textContent = firstMessage.length > 50 ? firstMessage.slice(0, 50) + '...' : firstMessage;
-        const delBtn = document.createElement('button');
-        delBtn.className = 'delete-chat-btn';
-        delBtn.dataset.chatId = String(data.chat.id);
-        delBtn.title = 'Delete';
-        delBtn.innerHTML = '<i class="fas fa-trash"></i>';
-
-        item.appendChild(titleDiv);
-        item.appendChild(previewDiv);
-        item.appendChild(delBtn);
+        const item = createChatHistoryItem({
+            id: data.chat.id,
+            title: data.chat.title,
+            preview: firstMessage.length > 50 ? firstMessage.slice(0, 50) + '...' : firstMessage
+        });
+        item.classList.add('active');
 
         // Remove any existing active marking
         document.querySelectorAll('.chat-history-item').forEach(el => el.classList.remove('active'));
@@ -752,12 +797,57 @@ async function ensureChatInHistory(chatId) {
     }
 }
 
-function addMessageToUI(content, isUser, isError = false) {
+// Infinite scroll for the chat history panel: fetch the next page near the bottom
+let isLoadingChatPage = false;
+
+async function loadMoreChats() {
+    const chatsList = document.getElementById('chatsList');
+    if (!chatsList || isLoadingChatPage) return;
+    const cursor = chatsList.dataset.nextCursor;
+    if (!cursor) return;
+
+    isLoadingChatPage = true;
+    try {
+        const response = await fetch(`/api/chats?cursor=${encodeURIComponent(cursor)}`);
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error || 'Failed to load chats');
+
+        data.chats.forEach(chat => {
+            if (!chatsList.querySelector(`.chat-history-item[data-chat-id="${chat.id}"]`)) {
+                chatsList.appendChild(createChatHistoryItem(chat));
+            }
+        });
+        chatsList.dataset.nextCursor = data.next_cursor || '';
+    } catch (error) {
+        console.error('Error loading chats:', error);
+    }
+    isLoadingChatPage = false;
+}
+
+function setupChatHistoryPaging() {
+    const historyContent = document.querySelector('.history-content');
+    if (!historyContent) return;
+    historyContent.addEventListener('scroll', function () {
+        if (this.scrollHeight - this.scrollTop - this.clientHeight < 200) {
+            loadMoreChats();
+        }
+    }, { passive: true });
+}
+
+function addMessageToUI(content, isUser, isError = false, messageId = null) {
     const messagesList = document.getElementById('messagesList');
     if (!messagesList) return;
 
+    const messageDiv = createMessageElement(content, isUser, isError, messageId);
+    messagesList.appendChild(messageDiv);
+    scrollToBottom();
+    return messageDiv;
+}
+
+function createMessageElement(content, isUser, isError = false, messageId = null) {
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${isUser ? 'user-message' : 'ai-message'}${isError ? ' error-message' : ''}`;
+    if (messageId) messageDiv.dataset.messageId = String(messageId);
 
     const messageContent = document.createElement('div');
     messageContent.className = 'message-content';
@@ -804,8 +894,41 @@ function addMessageToUI(content, isUser, isError = false) {
         if (retryBtn) retryBtn.onclick = () => handleRetryMessage(content, messageDiv);
     }
 
-    messagesList.appendChild(messageDiv);
-    scrollToBottom();
+    return messageDiv;
+}
+
+// Older messages are paged in on demand; this tracks the cursor for the open chat
+let olderMessagesCursor = null;
+let isLoadingOlderMessages = false;
+
+async function loadOlderMessages() {
+    if (!currentChatId || !olderMessagesCursor || isLoadingOlderMessages) return;
+    const messagesList = document.getElementById('messagesList');
+    const mc = document.getElementById('messagesContainer');
+    if (!messagesList || !mc) return;
+
+    isLoadingOlderMessages = true;
+    const chatId = currentChatId;
+    try {
+        const response = await fetch(`/api/get_chat/${chatId}?before=${olderMessagesCursor}`);
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error || 'Failed to load messages');
+        if (chatId !== currentChatId) return;
+
+        // Prepend while keeping the visible messages where they were
+        const fragment = document.createDocumentFragment();
+        data.chat.messages.forEach(message => {
+            fragment.appendChild(createMessageElement(message.content, message.is_user, false, message.id));
+        });
+        const previousHeight = mc.scrollHeight;
+        messagesList.prepend(fragment);
+        mc.scrollTop += mc.scrollHeight - previousHeight;
+        olderMessagesCursor = data.chat.next_before;
+    } catch (error) {
+        console.error('Error loading older messages:', error);
+    } finally {
+        isLoadingOlderMessages = false;
+    }
 }
 
 // Removed typing indicator and HTML replacement to ensure immediate rendering without delays
@@ -853,9 +976,10 @@ async function loadChat(chatId) {
                 messagesList.innerHTML = '';
 
                 data.chat.messages.forEach(message => {
-                    addMessageToUI(message.content, message.is_user);
+                    addMessageToUI(message.content, message.is_user, false, message.id);
                 });
             }
+            olderMessagesCursor = data.chat.next_before;
 
             // Update active chat item
             document.querySelectorAll('.chat-history-item').forEach(item => {
@@ -890,6 +1014,7 @@ async function loadChat(chatId) {
 
 function newChat() {
     currentChatId = null;
+    olderMessagesCursor = null;
     clearLastChatId();
 
     // Clear active chat
@@ -1281,6 +1406,11 @@ function setupScrollDetection() {
 
         lastScrollTop = currentScrollTop;
 
+        // Page in older history when the user nears the top
+        if (currentScrollTop < 200) {
+            loadOlderMessages();
+        }
+
         // Clear existing timeout
         if (scrollTimeout) {
             clearTimeout(scrollTimeout);
@@ -1463,6 +1593,7 @@ document.head.appendChild(style);
     const cancelBtn = document.getElementById('cancelSettingsCenterBtn');
     const saveBtn = document.getElementById('saveSettingsCenterBtn');
     const displayNameInput = document.getElementById('displayNameCenter');
+    const responseCacheInput = document.getElementById('responseCacheCenter');
 
     function openModal() {
         hideProfileDropdown();
@@ -1474,11 +1605,14 @@ document.head.appendChild(style);
     function saveChanges() {
         // Reuse existing profile name save endpoint if available
         const value = (displayNameInput && displayNameInput.value || '').trim();
-        if (!value) { closeModal(); return; }
+        const payload = {};
+        if (value) payload.display_name = value;
+        if (responseCacheInput) payload.response_cache_opt_out = !responseCacheInput.checked;
+        if (!Object.keys(payload).length) { closeModal(); return; }
         fetch('/api/update_profile', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ display_name: value })
+            body: JSON.stringify(payload)
         }).then(() => { closeModal(); }).catch(() => { closeModal(); });
     }
 
@@ -1594,17 +1728,22 @@ function setupActionBarDelegation() {
     });
 }
 
-function findPreviousUserMessageText(startNode) {
-    if (!startNode) return '';
+function findPreviousUserMessage(startNode) {
+    if (!startNode) return null;
     let node = startNode.previousElementSibling;
     while (node) {
         if (node.classList && node.classList.contains('user-message')) {
-            const textEl = node.querySelector('.message-text');
-            return (textEl && textEl.innerText) || '';
+            return node;
         }
         node = node.previousElementSibling;
     }
-    return '';
+    return null;
+}
+
+function findPreviousUserMessageText(startNode) {
+    const node = findPreviousUserMessage(startNode);
+    const textEl = node && node.querySelector('.message-text');
+    return (textEl && textEl.innerText) || '';
 }
 
 // Helper: write tiny feedback below the action bar
@@ -1629,8 +1768,11 @@ async function retryFromAiMessage(aiMessageEl) {
 
     isLoading = true;
 
+    // Retry answers the preceding user message again; the server finds it by id
+    const userMessageEl = findPreviousUserMessage(aiMessageEl);
+    const anchorMessageId = userMessageEl && userMessageEl.dataset.messageId;
     const userText = findPreviousUserMessageText(aiMessageEl);
-    if (!userText) {
+    if (!currentChatId || (!anchorMessageId && !userText)) {
         isLoading = false;
         return;
     }
@@ -1658,12 +1800,14 @@ async function retryFromAiMessage(aiMessageEl) {
     scrollToBottomForce();
 
     try {
-        const response = await fetch('/api/send_message', {
+        const response = await fetch('/api/retry', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                message: userText,
-                chat_id: currentChatId
+                chat_id: currentChatId,
+                anchor_message_id: anchorMessageId ? Number(anchorMessageId) : null,
+                anchor_user_text: userText,
+                framing: STREAM_FRAMING
             })
         });
 
@@ -1671,51 +1815,37 @@ async function retryFromAiMessage(aiMessageEl) {
             throw new Error('Failed to retry message');
         }
 
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = '';
-        let accumulatedText = '';
-
-        while (true) {
-            const { done, value } = await reader.read();
-            
-            if (done) break;
-            
-            buffer += decoder.decode(value, { stream: true });
-            const lines = buffer.split('\n\n');
-            buffer = lines.pop();
-            
-            for (const line of lines) {
-                if (line.startsWith('data: ')) {
-                    const data = JSON.parse(line.slice(6));
-                    
-                    if (data.type === 'chunk') {
-                        accumulatedText += data.content;
-                        messageText.innerHTML = renderMarkdown(accumulatedText);
-                        scrollToBottom();
-                    } else if (data.type === 'end') {
-                        aiMessageDiv.classList.remove('streaming');
-                        
-                        // Final markdown render
-                        messageText.innerHTML = renderMarkdown(accumulatedText);
-                        
-                        const actionBar = document.createElement('div');
-                        actionBar.className = 'message-action-bar';
-                        actionBar.innerHTML = `
-                            <button class="action-btn copy-btn" title="Copy"><i class="fas fa-copy"></i></button>
-                            <button class="action-btn thumbs-up-btn" title="Thumbs Up"><i class="fas fa-thumbs-up"></i></button>
-                            <button class="action-btn thumbs-down-btn" title="Thumbs Down"><i class="fas fa-thumbs-down"></i></button>
-                            <button class="action-btn retry-btn" title="Retry"><i class="fas fa-redo"></i></button>
-                        `;
-                        messageContent.appendChild(actionBar);
-                        
-                        const feedback = document.createElement('div');
-                        feedback.className = 'message-feedback';
-                        messageContent.appendChild(feedback);
-                    }
-                }
+        const markdown = new IncrementalMarkdownRenderer(messageText);
+
+        await followStream(response, async (data) => {
+            if (data.type === 'chunk') {
+                markdown.append(data.content);
+                scrollToBottom();
+            } else if (data.type === 'snapshot') {
+                // Resumed after the server dropped old chunks: start from its copy
+                markdown.reset(data.content);
+            } else if (data.type === 'end') {
+                aiMessageDiv.classList.remove('streaming');
+                if (data.message_id) aiMessageDiv.dataset.messageId = String(data.message_id);
+                
+                // Final markdown render
+                markdown.finish();
+                
+                const actionBar = document.createElement('div');
+                actionBar.className = 'message-action-bar';
+                actionBar.innerHTML = `
+                    <button class="action-btn copy-btn" title="Copy"><i class="fas fa-copy"></i></button>
+                    <button class="action-btn thumbs-up-btn" title="Thumbs Up"><i class="fas fa-thumbs-up"></i></button>
+                    <button class="action-btn thumbs-down-btn" title="Thumbs Down"><i class="fas fa-thumbs-down"></i></button>
+                    <button class="action-btn retry-btn" title="Retry"><i class="fas fa-redo"></i></button>
+                `;
+                messageContent.appendChild(actionBar);
+                
+                const feedback = document.createElement('div');
+                feedback.className = 'message-feedback';
+                messageContent.appendChild(feedback);
             }
-        }
+        });
     } catch (error) {
         console.error('Error retrying message:', error);
         messageText.textContent = 'Sorry, I encountered an error. Please try again.';
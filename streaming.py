@@ -0,0 +1,293 @@
+"""SSE framing and chunk coalescing for chat response streams.
+
+Models often emit very small chunks, and framing each one as its own
+``data: {json}`` event costs a ``json.dumps`` and a network write per chunk.
+Chunks are therefore coalesced: after a flush, text is held for up to
+``SSE_COALESCE_MS`` or until ``SSE_COALESCE_CHARS`` characters are waiting. The
+first chunk always goes out immediately so time-to-first-token is unchanged.
+Setting ``SSE_COALESCE_MS=0`` sends every chunk as it arrives.
+
+Generation is decoupled from the HTTP connection. A ``ResumableStream`` gets
+every event with an increasing id and keeps the most recent ones in a bounded
+ring buffer. The response that started the turn is just the first subscriber.
+A client that drops can reconnect with ``Last-Event-ID``. It then receives the
+events it missed, or a ``snapshot`` of the evicted text followed by them, and
+follows the stream from there. Streams live in process memory, so a reconnect
+must reach the same worker process.
+
+Two framings are supported. ``json`` (the default) sends every event as
+``data: {"type": ..., ...}``. ``compact`` sends chunk text as raw ``data:``
+lines and only frames the start and end events as JSON with an ``event:`` name,
+which cuts the per-chunk overhead to a few bytes.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COALESCE_MS = float(os.environ.get('SSE_COALESCE_MS', '30'))
+COALESCE_CHARS = int(os.environ.get('SSE_COALESCE_CHARS', '512'))
+DEFAULT_FRAMING = os.environ.get('SSE_FRAMING', 'json')
+FRAMINGS = ('json', 'compact')
+# Events kept per stream for replay, and how long finished streams stay resumable
+RESUME_BUFFER_EVENTS = int(os.environ.get('SSE_RESUME_BUFFER_EVENTS', '256'))
+RESUME_TTL_SECONDS = float(os.environ.get('SSE_RESUME_TTL_SECONDS', '120'))
+
+STREAM_EVENTS = metrics.histogram(
+    'sse_stream_events', 'SSE events sent per stream')
+STREAM_BYTES = metrics.histogram(
+    'sse_stream_bytes', 'SSE bytes sent per stream')
+STREAM_EVENT_RATE = metrics.histogram(
+    'sse_stream_events_per_second', 'SSE events per second over the life of a stream',
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500))
+STREAM_DURATION = metrics.histogram(
+    'sse_stream_duration_seconds', 'How long each SSE response stayed open',
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300))
+ACTIVE_STREAMS = metrics.gauge('sse_active_streams', 'SSE responses currently open')
+EVENTS_TOTAL = metrics.counter('sse_events_total', 'SSE events sent')
+BYTES_TOTAL = metrics.counter('sse_bytes_total', 'SSE bytes sent')
+
+
+def sse_event(payload: dict) -> str:
+    """Frame a payload as a single Server-Sent Event."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def _settings(window_ms, max_chars):
+    window = (COALESCE_MS if window_ms is None else window_ms) / 1000
+    max_chars = COALESCE_CHARS if max_chars is None else max_chars
+    return window, max_chars
+
+
+def coalesce(chunks, window_ms=None, max_chars=None):
+    """Batch a chunk iterator into fewer, larger chunks.
+
+    The WSGI path has no timer, so held text goes out with the next chunk that
+    arrives after the window, or at the end of the stream.
+    """
+    window, max_chars = _settings(window_ms, max_chars)
+    buffer = []
+    size = 0
+    last_flush = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer.append(chunk)
+        size += len(chunk)
+        now = time.monotonic()
+        if last_flush is None or now - last_flush >= window or size >= max_chars:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+            last_flush = now
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def acoalesce(chunks, window_ms=None, max_chars=None):
+    """Async version of ``coalesce`` that also flushes when the window expires."""
+    window, max_chars = _settings(window_ms, max_chars)
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    buffer = []
+    size = 0
+    last_flush = None
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0, last_flush + window - loop.time()) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                task, pending = pending, None
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    break
+                if not chunk:
+                    continue
+                buffer.append(chunk)
+                size += len(chunk)
+            now = loop.time()
+            if buffer and (last_flush is None or now - last_flush >= window or size >= max_chars):
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+                last_flush = now
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+class StreamWriter:
+    """Frames the events of one response stream and records its size and rate."""
+
+    def __init__(self, framing=None):
+        self.framing = framing or DEFAULT_FRAMING
+        self.events = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.closed = False
+        ACTIVE_STREAMS.inc(framing=self.framing)
+
+    def _emit(self, frame):
+        self.events += 1
+        self.bytes += len(frame.encode('utf-8'))
+        return frame
+
+    def event(self, event_id, event_type, fields):
+        """Frame a buffered ``(id, type, fields)`` event from a ResumableStream."""
+        if event_type == 'chunk':
+            return self.chunk(fields['content'], event_id)
+        return self.control(event_type, event_id, **fields)
+
+    def control(self, event_type, event_id=None, **fields):
+        prefix = f"id: {event_id}\n" if event_id is not None else ''
+        if self.framing == 'compact':
+            return self._emit(f"{prefix}event: {event_type}\ndata: {json.dumps(fields)}\n\n")
+        return self._emit(prefix + sse_event({'type': event_type, **fields}))
+
+    def chunk(self, text, event_id=None):
+        prefix = f"id: {event_id}\n" if event_id is not None else ''
+        if self.framing == 'compact':
+            lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+            return self._emit(prefix + ''.join(f"data: {line}\n" for line in lines) + '\n')
+        return self._emit(prefix + sse_event({'type': 'chunk', 'content': text}))
+
+    def close(self):
+        """Record metrics for the finished stream. Safe to call more than once."""
+        if self.closed:
+            return
+        self.closed = True
+        duration = max(time.monotonic() - self.started, 1e-6)
+        ACTIVE_STREAMS.dec(framing=self.framing)
+        STREAM_DURATION.observe(duration, framing=self.framing)
+        STREAM_EVENTS.observe(self.events, framing=self.framing)
+        STREAM_BYTES.observe(self.bytes, framing=self.framing)
+        STREAM_EVENT_RATE.observe(self.events / duration, framing=self.framing)
+        EVENTS_TOTAL.inc(self.events, framing=self.framing)
+        BYTES_TOTAL.inc(self.bytes, framing=self.framing)
+        logger.debug(f"Stream closed: {self.events} events, {self.bytes} bytes in {duration:.2f}s "
+                     f"({self.events / duration:.1f} events/s, framing={self.framing})")
+
+
+class ResumableStream:
+    """The events of one response, buffered so clients can reconnect and catch up.
+
+    The producer calls ``publish`` from a thread or a coroutine, and its last
+    event must be ``end``. Subscribers iterate ``events`` (sync) or ``aevents``
+    (async) from an event id and are woken whenever something is published.
+    """
+
+    def __init__(self, user_id, buffer_size=None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.last_id = 0
+        self.done = False
+        self.finished_at = None
+        self.task = None
+        self._events = deque(maxlen=max(1, buffer_size or RESUME_BUFFER_EVENTS))
+        self._evicted_text = ''
+        self._listeners = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, **fields):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                _, old_type, old_fields = self._events[0]
+                if old_type == 'chunk':
+                    self._evicted_text += old_fields['content']
+            self.last_id += 1
+            self._events.append((self.last_id, event_type, fields))
+            if event_type == 'end':
+                self.done = True
+                self.finished_at = time.monotonic()
+            listeners = list(self._listeners)
+        for notify in listeners:
+            notify()
+
+    def _read(self, cursor):
+        """Events after ``cursor``, led by a snapshot if some were already evicted."""
+        with self._lock:
+            events = [event for event in self._events if event[0] > cursor]
+            first_id = self._events[0][0] if self._events else self.last_id + 1
+            if cursor < first_id - 1:
+                events.insert(0, (first_id - 1, 'snapshot', {'content': self._evicted_text}))
+            return events, self.done
+
+    def _subscribe(self, notify):
+        with self._lock:
+            self._listeners.add(notify)
+
+    def _unsubscribe(self, notify):
+        with self._lock:
+            self._listeners.discard(notify)
+
+    def events(self, cursor=0):
+        """Yield ``(id, type, fields)`` after ``cursor`` until the stream ends."""
+        wake = threading.Event()
+        self._subscribe(wake.set)
+        try:
+            while True:
+                wake.clear()
+                events, done = self._read(cursor)
+                for event in events:
+                    cursor = event[0]
+                    yield event
+                if done:
+                    return
+                wake.wait()
+        finally:
+            self._unsubscribe(wake.set)
+
+    async def aevents(self, cursor=0):
+        """Async version of ``events``."""
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+
+        def notify():
+            loop.call_soon_threadsafe(wake.set)
+
+        self._subscribe(notify)
+        try:
+            while True:
+                wake.clear()
+                events, done = self._read(cursor)
+                for event in events:
+                    cursor = event[0]
+                    yield event
+                if done:
+                    return
+                await wake.wait()
+        finally:
+            self._unsubscribe(notify)
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def register_stream(stream):
+    """Make ``stream`` resumable by id and drop finished streams past their TTL."""
+    now = time.monotonic()
+    with _streams_lock:
+        for stream_id, existing in list(_streams.items()):
+            if existing.finished_at is not None and now - existing.finished_at > RESUME_TTL_SECONDS:
+                del _streams[stream_id]
+        _streams[stream.id] = stream
+
+
+def get_stream(stream_id):
+    with _streams_lock:
+        return _streams.get(stream_id)
@@ -0,0 +1,111 @@
+"""Short-lived cache of user rows for Flask-Login's ``load_user``.
+
+Every authenticated request resolves ``current_user``, and so does every SSE
+stream and every JSON call from the chat page. Each of those used to cost a
+``SELECT`` on ``user``. This cache keeps each user's column values for
+``USER_CACHE_TTL_SECONDS``. A hit rebuilds the ``User`` and attaches it to the
+session with ``merge(load=False)``, which issues no query. Relationships still
+lazy-load, and attribute changes followed by ``commit`` persist as usual.
+
+Entries are dropped after any commit that updated or deleted the user, which
+covers profile changes and password resets. The cache is per process, so other
+workers may serve the old values until the TTL expires. Set
+``USER_CACHE_TTL_SECONDS=0`` to turn the cache off.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+import metrics
+
+TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', '10000'))
+
+CACHE_REQUESTS = metrics.counter('user_cache_requests_total', 'load_user lookups by result')
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+def _snapshot(user):
+    return {attr.key: getattr(user, attr.key) for attr in inspect(type(user)).column_attrs}
+
+
+def get(user_id):
+    """Cached column values for ``user_id``, or None."""
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del _entries[user_id]
+            return None
+        _entries.move_to_end(user_id)
+        return entry[1]
+
+
+def put(user):
+    if TTL_SECONDS <= 0:
+        return
+    with _lock:
+        _entries[user.id] = (time.monotonic() + TTL_SECONDS, _snapshot(user))
+        _entries.move_to_end(user.id)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def invalidate(user_id):
+    with _lock:
+        _entries.pop(user_id, None)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def load_user(user_id):
+    """``user_loader`` body: the user with ``user_id`` in the current session, or None."""
+    from app import db
+    from models import User
+
+    user_id = int(user_id)
+    fields = get(user_id) if TTL_SECONDS > 0 else None
+    if fields is not None:
+        CACHE_REQUESTS.inc(result='hit')
+        user = User(**fields)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    CACHE_REQUESTS.inc(result='miss')
+    user = db.session.get(User, user_id)
+    if user is not None:
+        put(user)
+    return user
+
+
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('user_cache_changed', set()).add(target.id)
+
+
+def _after_commit(session):
+    for user_id in session.info.pop('user_cache_changed', ()):
+        invalidate(user_id)
+
+
+def _after_rollback(session):
+    session.info.pop('user_cache_changed', None)
+
+
+def register(user_model):
+    """Drop cached users once a commit that changed them has gone through."""
+    event.listen(user_model, 'after_update', _mark_changed)
+    event.listen(user_model, 'after_delete', _mark_changed)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)